@@ -13,4 +13,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'RyoURL.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from shortURL.cache_warming import warm_on_startup  # noqa: E402  需在 Django 設定完成後匯入
+from shortURL.fast_path import wrap_asgi  # noqa: E402  需在 Django 設定完成後匯入
+
+# 短網址導向走快速路徑，其餘請求交給 Django
+application = wrap_asgi(django_application)
+
+# 設定 CACHE_WARM_ON_STARTUP 時在背景預熱短網址查詢快取
+warm_on_startup()
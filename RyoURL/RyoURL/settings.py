@@ -86,7 +86,6 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'silk.middleware.SilkyMiddleware',
 ]
 
 ROOT_URLCONF = 'RyoURL.urls'
@@ -125,16 +124,154 @@ DATABASES = {
     }
 }
 
+# 資料庫連線池（預設關閉）：每個行程（worker）的執行緒共用一組連線，請求結束時歸還而不關閉，省去每個請求重新連線與驗證的時間；
+# 啟用後資料庫後端改為 shortURL.pooled_postgresql（只支援 PostgreSQL），副本使用與主資料庫相同的設定，各自一個連線池
+DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', 'False') == 'True'
+if DB_POOL_ENABLED:
+    DATABASES['default']['ENGINE'] = 'shortURL.pooled_postgresql'
+    DATABASES['default']['POOL'] = {
+        'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', 20)),                          # 每個行程最多的連線數
+        'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),                          # 連線全部使用中時最多等待的秒數
+        'IDLE_TIMEOUT': float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300)),               # 閒置超過此秒數的連線會關閉
+        'MAX_LIFETIME': float(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),              # 連線最長使用時間（秒）
+        'HEALTH_CHECK_AFTER': float(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', 30)),    # 閒置超過此秒數的連線，取出前先檢查
+    }
+
+# 資料庫副本：以逗號分隔的 host[:port]，唯讀請求的查詢會分散到副本，寫入一律使用主資料庫
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+for index, replica in enumerate(DB_REPLICA_HOSTS):
+    replica_host, _, replica_port = replica.partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        'OPTIONS': {'connect_timeout': 2},      # 副本無法連線時盡快改用主資料庫
+        'TEST': {'MIRROR': 'default'},
+    }
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 5))                 # 副本延遲超過幾秒就暫時改用主資料庫
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', 5))   # 每個行程檢查副本狀態的間隔（秒）
+DB_STICKY_SECONDS = int(os.getenv('DB_STICKY_SECONDS', 10))                    # 寫入後幾秒內同一個使用者的讀取使用主資料庫
+if DB_REPLICA_HOSTS:
+    MIDDLEWARE.insert(0, 'shortURL.middleware.ReplicaRoutingMiddleware')
+
+# 短網址分片：以逗號分隔的額外分片 host[:port]，default 為第 0 個分片；Url 與 ClickRollup 依短網址的雜湊值分散到各分片，
+# 其餘資料表只使用 default。分片只能接在最後新增，新增後以 reshard_urls 搬移資料
+DB_SHARD_HOSTS = [host.strip() for host in os.getenv('DB_SHARD_HOSTS', '').split(',') if host.strip()]
+DB_SHARDS = ['default']
+for index, shard in enumerate(DB_SHARD_HOSTS, start=1):
+    shard_host, _, shard_port = shard.partition(':')
+    DATABASES[f'shard_{index}'] = {
+        **DATABASES['default'],
+        'HOST': shard_host,
+        'PORT': shard_port or DATABASES['default']['PORT'],
+    }
+    DB_SHARDS.append(f'shard_{index}')
+DB_SHARD_PREVIOUS_COUNT = int(os.getenv('DB_SHARD_PREVIOUS_COUNT', 0))   # 重新分片期間設為新增前的分片數，讀取時也會查詢原本的分片
+DATABASE_ROUTERS = ['shortURL.sharding.ShardRouter', 'shortURL.db_router.PrimaryReplicaRouter']
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/1')
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": os.getenv('REDIS_URL', 'redis://redis:6379/1'),
+        "LOCATION": REDIS_URL,
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "REDIS_CLIENT_CLASS": "shortURL.redis_client.InstrumentedRedis",   # 記錄 Redis 指令時間
         }
     }
 }
 
+# ASGI 非同步模式：導向與查詢原網址改用 async view、asyncio Redis 與 Django async ORM
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS') == 'True'
+ASYNC_REDIS_MAX_CONNECTIONS = int(os.getenv('ASYNC_REDIS_MAX_CONNECTIONS', 100))     # 每個 event loop 的 Redis 連線上限
+
+# 短網址導向的快速路徑：wsgi.py / asgi.py 直接處理 GET、HEAD /<短網址>/，不經過 middleware 與 URL 解析
+# （不記錄 Silk、不加 SecurityMiddleware 的標頭），其餘請求仍交給 Django；設定 SECURE_SSL_REDIRECT 時不啟用
+FAST_PATH_ENABLED = os.getenv('FAST_PATH_ENABLED', 'True') == 'True'
+
+# 註冊與登入的密碼雜湊（PBKDF2）在行程池中計算，不佔用處理請求的執行緒、event loop 與 GIL
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))                     # 每個伺服器行程的雜湊子行程數量，0 代表在請求中直接計算
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 64))           # 每個伺服器行程等待中的雜湊上限，超過時回傳 503
+
+# 效能指標（Prometheus 格式的 /metrics）
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'                      # 是否記錄每個請求的處理時間
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')                                            # 設定後 /metrics 需帶 Authorization: Bearer <token>
+METRICS_PUSH_INTERVAL = float(os.getenv('METRICS_PUSH_INTERVAL', 15))                 # 各行程將指標寫入 Redis 的間隔（秒），0 代表 /metrics 只回傳單一行程的指標
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'shortURL.middleware.MetricsMiddleware')
+
+# Silk 只記錄部分請求（百分比），會將請求與 SQL 寫入資料庫，正式環境請維持低比例；0 代表不啟用
+SILKY_INTERCEPT_PERCENT = float(os.getenv('SILKY_INTERCEPT_PERCENT', 100 if DEBUG else 1))
+# Silk 的 middleware 只支援同步，非同步模式下會讓每個請求都被轉到執行緒處理，因此不啟用
+if not ASYNC_VIEWS and SILKY_INTERCEPT_PERCENT > 0:
+    MIDDLEWARE.append('silk.middleware.SilkyMiddleware')
+
+# 短網址查詢快取（Redis + 行程內 LRU）
+URL_LOOKUP_CACHE_TIMEOUT = int(os.getenv('URL_LOOKUP_CACHE_TIMEOUT', 60 * 60 * 24))   # Redis 快取時間（秒）
+URL_LOOKUP_LRU_SIZE = int(os.getenv('URL_LOOKUP_LRU_SIZE', 10000))                    # 每個行程最多快取的短網址數量
+URL_LOOKUP_LRU_TIMEOUT = int(os.getenv('URL_LOOKUP_LRU_TIMEOUT', 60))                 # 行程內快取時間（秒）
+CACHE_INVALIDATION_BUS_ENABLED = os.getenv('CACHE_INVALIDATION_BUS_ENABLED', 'True') == 'True'  # 以 Redis pub/sub 通知所有行程清除行程內的短網址與使用者快取
+
+# 快取預熱（manage.py warm_cache）：載入點擊數最多與最新建立的短網址到 Redis
+CACHE_WARM_TOP = int(os.getenv('CACHE_WARM_TOP', 100000))                            # 點擊數最多的短網址數量
+CACHE_WARM_RECENT = int(os.getenv('CACHE_WARM_RECENT', 100000))                      # 最新建立的短網址數量
+CACHE_WARM_ON_STARTUP = os.getenv('CACHE_WARM_ON_STARTUP') == 'True'                 # 伺服器啟動時在背景預熱（多個行程同時啟動時只有一個會執行）
+
+# 熱門短網址：以 Space-Saving 演算法找出熱門短網址並固定在各行程的記憶體中
+HOT_KEY_CAPACITY = int(os.getenv('HOT_KEY_CAPACITY', 1000))                          # 每個行程追蹤的短網址數量
+HOT_KEY_PIN_SIZE = int(os.getenv('HOT_KEY_PIN_SIZE', 100))                           # 每個行程最多固定的短網址數量
+HOT_KEY_MIN_RATE = float(os.getenv('HOT_KEY_MIN_RATE', 1))                           # 本行程每秒至少導向幾次才固定
+HOT_KEY_REFRESH_INTERVAL = float(os.getenv('HOT_KEY_REFRESH_INTERVAL', 10))          # 統計區間與更新固定資料的間隔（秒）
+
+# 不存在短網址的過濾（Redis Bloom filter + 負向快取）
+SHORT_CODE_FILTER_BITS = int(os.getenv('SHORT_CODE_FILTER_BITS', 2 ** 28))             # Bloom filter 位元數（預設 32 MB，3 千萬筆短網址時誤判率約 1%）
+SHORT_CODE_FILTER_HASHES = int(os.getenv('SHORT_CODE_FILTER_HASHES', 7))               # 每個短網址使用的雜湊函式數量
+NEGATIVE_CACHE_TIMEOUT = int(os.getenv('NEGATIVE_CACHE_TIMEOUT', 60))                  # 不存在的短網址的快取時間（秒）
+
+# JWT 使用者快取（Redis + 行程內 LRU）
+PRINCIPAL_CACHE_TIMEOUT = int(os.getenv('PRINCIPAL_CACHE_TIMEOUT', 60 * 5))           # Redis 快取時間（秒）
+PRINCIPAL_LRU_SIZE = int(os.getenv('PRINCIPAL_LRU_SIZE', 10000))                      # 每個行程最多快取的使用者數量
+PRINCIPAL_LRU_TIMEOUT = int(os.getenv('PRINCIPAL_LRU_TIMEOUT', 30))                   # 行程內快取時間（秒）
+
+# 短網址分配器
+SHORT_CODE_BLOCK_SIZE = int(os.getenv('SHORT_CODE_BLOCK_SIZE', 1000))                 # 每個行程一次保留的序號數量
+BULK_CREATE_MAX_ITEMS = int(os.getenv('BULK_CREATE_MAX_ITEMS', 10000))                # 批次建立一次最多的短網址數量
+ORIGINS_MAX_ITEMS = int(os.getenv('ORIGINS_MAX_ITEMS', 5000))                         # 批次查詢原網址一次最多的短網址數量
+URL_DEDUP_ENABLED = os.getenv('URL_DEDUP_ENABLED') == 'True'                          # 同一使用者重複建立相同原網址時回傳既有短網址
+
+# 導向與查詢的 HTTP 快取（CDN 與瀏覽器），快取時間不超過短網址的過期時間
+REDIRECT_PERMANENT_MAX_AGE = int(os.getenv('REDIRECT_PERMANENT_MAX_AGE', 60 * 60 * 24))   # 301、308 導向的快取時間（秒）
+REDIRECT_TEMPORARY_MAX_AGE = int(os.getenv('REDIRECT_TEMPORARY_MAX_AGE', 0))              # 302、307 導向的快取時間（秒），0 代表每次都回到伺服器
+ORIGIN_CACHE_MAX_AGE = int(os.getenv('ORIGIN_CACHE_MAX_AGE', 60))                         # /origin/{short_string} 的快取時間（秒），之後以 ETag 重新驗證
+EDGE_INGEST_TOKEN = os.getenv('EDGE_INGEST_TOKEN')                                        # 邊緣節點回報導向次數的 Bearer token，未設定時停用 /api/edge/hits
+EDGE_HITS_MAX_ITEMS = int(os.getenv('EDGE_HITS_MAX_ITEMS', 10000))                        # 一次最多回報的筆數
+
+# 限流（Redis token bucket，格式為 '次數/秒數'，空字串代表不限制）
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True') == 'True'
+RATE_LIMITS = {
+    'create': os.getenv('RATE_LIMIT_CREATE', '30/60'),          # POST /short 與 /bulk
+    'custom': os.getenv('RATE_LIMIT_CUSTOM', '30/60'),          # POST /custom 與登入後的 /bulk
+    'redirect': os.getenv('RATE_LIMIT_REDIRECT', ''),           # 短網址導向，預設不限制（在反向代理之後需先設定 RATE_LIMIT_TRUSTED_PROXIES）
+}
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv('RATE_LIMIT_TRUSTED_PROXIES', 0))          # 前方反向代理的層數，大於 0 時由 X-Forwarded-For 取得用戶端 IP
+
+# 短網址列表分頁
+URL_LIST_PAGE_SIZE = int(os.getenv('URL_LIST_PAGE_SIZE', 100))                        # 每頁預設筆數
+URL_LIST_MAX_PAGE_SIZE = int(os.getenv('URL_LIST_MAX_PAGE_SIZE', 1000))               # 每頁最多筆數
+
+# 過期短網址清除
+EXPIRY_REAP_BATCH_SIZE = int(os.getenv('EXPIRY_REAP_BATCH_SIZE', 1000))               # 每批刪除的數量
+EXPIRY_REAP_RATE = float(os.getenv('EXPIRY_REAP_RATE', 0))                            # 每秒最多刪除的數量，0 代表不限制
+EXPIRY_REAP_API_MAX_BATCHES = int(os.getenv('EXPIRY_REAP_API_MAX_BATCHES', 5))         # DELETE /api/admin/expire-urls 一次請求最多刪除的批次數
+
+# 訪問次數批次寫入
+VISIT_COUNT_FLUSH_INTERVAL = float(os.getenv('VISIT_COUNT_FLUSH_INTERVAL', 10))       # 寫入資料庫的間隔（秒）
+
+# 點擊分析（Redis Stream + 每小時、每日彙總）
+CLICK_STREAM_MAX_LEN = int(os.getenv('CLICK_STREAM_MAX_LEN', 1000000))                # Stream 最多保留的點擊事件數（約略），避免 consumer 停止時無限增長
+CLICK_CONSUMER_BATCH_SIZE = int(os.getenv('CLICK_CONSUMER_BATCH_SIZE', 5000))         # consumer 每次讀取的事件數
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -155,6 +292,9 @@ LOGGING = {
 
 AUTH_USER_MODEL = 'shortURL.User'
 
+# 登入驗證：與 ModelBackend 相同，密碼雜湊在行程池中計算
+AUTHENTICATION_BACKENDS = ['shortURL.auth_backends.PooledHashingBackend']
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -19,7 +19,7 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
-from shortURL.views import redirectShortUrl
+from shortURL.views import aredirectShortUrl, getMetrics, redirectShortUrl
 from shortURL.api import api
 
 urlpatterns = \
@@ -28,5 +28,6 @@ urlpatterns = \
         path('shortURL/', include('shortURL.urls')),
         path('silk/', include('silk.urls', namespace='silk')),
         path('api/', api.urls),
-        path('<str:short_string>/', redirectShortUrl, name='redirectShortUrl'),
+        path('metrics', getMetrics, name='metrics'),
+        path('<str:short_string>/', aredirectShortUrl if settings.ASYNC_VIEWS else redirectShortUrl, name='redirectShortUrl'),
     ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
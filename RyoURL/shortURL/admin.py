@@ -1,9 +1,15 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from . import sharding
 from .models import Url, User 
 
 class UrlAdmin(admin.ModelAdmin):
-    list_display = ('origin_url', 'short_string', 'short_url', 'create_date', 'expire_date', 'visit_count', 'user')
+    list_display = ('origin_url', 'short_string', 'short_url', 'create_date', 'expire_date', 'visit_count', 'redirect_type', 'user')
+
+    # 管理後台只操作 default 分片，分片後修改短網址字串可能使資料不在所屬的分片
+    def get_readonly_fields(self, request, obj=None):
+        fields = super().get_readonly_fields(request, obj)
+        return (*fields, 'short_string') if sharding.enabled() and obj is not None else fields
 
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'user_type')
@@ -4,12 +4,13 @@ from django.core.serializers.json import DjangoJSONEncoder
 
 from pydantic import AnyUrl
 
-from .apis.auth import AdminJWTAuth, AnonymousAuth, JWTAuth
+from .apis.auth import AdminJWTAuth, AnonymousAuth, EdgeTokenAuth, JWTAuth
 from .apis.auth_api import auth_router
 from .apis.short_url_basic_api import short_url_router
 from .apis.short_url_with_auth_api import auth_short_url_router
 from .apis.user_api import user_router
 from .apis.admin_api import admin_router
+from .apis.edge_api import edge_router
 
 class CustomJSONEncoder(DjangoJSONEncoder):
     def default(self, obj):
@@ -26,4 +27,5 @@ api.add_router("/auth/", auth_router)
 api.add_router("/short-url/", short_url_router, auth=[JWTAuth(), AnonymousAuth()])
 api.add_router("/short-url-with-auth/", auth_short_url_router, auth=JWTAuth())
 api.add_router("/user/", user_router, auth=JWTAuth())
-api.add_router("/admin/", admin_router, auth=AdminJWTAuth())
\ No newline at end of file
+api.add_router("/admin/", admin_router, auth=AdminJWTAuth())
+api.add_router("/edge/", edge_router, auth=EdgeTokenAuth())
\ No newline at end of file
@@ -1,29 +1,66 @@
 from http import HTTPStatus
-from django.http import Http404
-from ninja import Router
-from typing import List
-import datetime
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from ninja import Query, Router
+from typing import List, Literal, Optional
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from ninja.errors import HttpError
 
-from ..models import Url, User
+from .. import hot_keys, sharding, short_code_filter, url_cache, url_transfer
+from ..expiry import count_expired_urls, reap_expired_urls
+from ..models import User
+from ..pagination import NEXT_CURSOR_HEADER, keyset_page, stream_ndjson
+from .schemas import ExpiredUrlReapSchema, HotKeySchema, ShortCodeFilterSchema
 from schemas.schemas import UrlSchema, ErrorSchema, UserInfoSchema
 
 admin_router = Router()
 
-@admin_router.get('all-urls', response={HTTPStatus.OK: List[UrlSchema], HTTPStatus.FORBIDDEN: ErrorSchema})
-def get_all_url(request):
+@admin_router.get('all-urls', response={HTTPStatus.OK: List[UrlSchema], HTTPStatus.BAD_REQUEST: ErrorSchema, HTTPStatus.FORBIDDEN: ErrorSchema})
+def get_all_url(request, response: HttpResponse, cursor: Optional[str] = None, limit: int = Query(settings.URL_LIST_PAGE_SIZE, ge=1, le=settings.URL_LIST_MAX_PAGE_SIZE), stream: bool = False):
     try:
-        urls = Url.objects.all()
-        return HTTPStatus.OK, [UrlSchema.from_orm(url) for url in urls]
+        urls = sharding.querysets()
+        if stream:
+            return stream_ndjson(urls, cursor)
+        page, next_cursor = keyset_page(urls, cursor, limit)
+        if next_cursor:
+            response[NEXT_CURSOR_HEADER] = next_cursor
+        return HTTPStatus.OK, [UrlSchema.from_orm(url) for url in page]
+    except ValueError as e:
+        return HTTPStatus.BAD_REQUEST, ErrorSchema(detail=str(e))
     except Exception as e:
         return HTTPStatus.FORBIDDEN, ErrorSchema(detail=str(e))
 
-@admin_router.delete('expire-urls', response={HTTPStatus.NO_CONTENT: None, HTTPStatus.FORBIDDEN: ErrorSchema})
+# 以 CSV 或 NDJSON 串流下載所有短網址（伺服器端游標逐批讀取），可直接以 import_urls 匯入
+@admin_router.get('export-urls', response={HTTPStatus.FORBIDDEN: ErrorSchema})
+def export_urls(request, format: Literal['csv', 'ndjson'] = 'ndjson'):
+    try:
+        response = StreamingHttpResponse(url_transfer.export_chunks(format), content_type=url_transfer.CONTENT_TYPES[format])
+        response['Content-Disposition'] = f'attachment; filename="urls.{format}"'
+        return response
+    except Exception as e:
+        return HTTPStatus.FORBIDDEN, ErrorSchema(detail=str(e))
+
+# 請求中最多刪除 EXPIRY_REAP_API_MAX_BATCHES 批，其餘的過期短網址由 reap_expired_urls 指令刪除
+@admin_router.delete('expire-urls', response={HTTPStatus.OK: ExpiredUrlReapSchema, HTTPStatus.FORBIDDEN: ErrorSchema})
 def delete_expire_url(request):
     try:
-        Url.objects.filter(expire_date__lt=datetime.datetime.now()).delete()
-        return HTTPStatus.NO_CONTENT, None
+        deleted = reap_expired_urls(settings.EXPIRY_REAP_BATCH_SIZE, max_batches=settings.EXPIRY_REAP_API_MAX_BATCHES)
+        return HTTPStatus.OK, ExpiredUrlReapSchema(deleted=deleted, remaining=count_expired_urls())
+    except Exception as e:
+        return HTTPStatus.FORBIDDEN, ErrorSchema(detail=str(e))
+
+@admin_router.get('short-code-filter', response={HTTPStatus.OK: ShortCodeFilterSchema, HTTPStatus.FORBIDDEN: ErrorSchema})
+def get_short_code_filter(request):
+    try:
+        return HTTPStatus.OK, ShortCodeFilterSchema(**short_code_filter.info())
+    except Exception as e:
+        return HTTPStatus.FORBIDDEN, ErrorSchema(detail=str(e))
+
+@admin_router.get('hot-keys', response={HTTPStatus.OK: List[HotKeySchema], HTTPStatus.FORBIDDEN: ErrorSchema})
+def get_hot_keys(request):
+    try:
+        return HTTPStatus.OK, [HotKeySchema(short_string=code, rate=rate, processes=processes)
+                               for code, rate, processes in hot_keys.current_hot_keys()]
     except Exception as e:
         return HTTPStatus.FORBIDDEN, ErrorSchema(detail=str(e))
 
@@ -51,7 +88,8 @@ def update_user_type(request, username: str, user_type: int):
 def delete_user(request, username: str):
     try:
         user = get_object_or_404(User, username=username)
-        user.delete()
+        with url_cache.deferred_invalidation():     # 連帶刪除的短網址合併為一次 Redis 呼叫清除快取
+            user.delete()
         return HTTPStatus.NO_CONTENT, None
     except Http404:
         return HTTPStatus.NOT_FOUND, ErrorSchema(detail="User not found")
@@ -1,8 +1,11 @@
+import hmac
+
+from django.conf import settings
 from ninja.security import HttpBearer
 from rest_framework_simplejwt.tokens import AccessToken
 from ninja.errors import HttpError
 from http import HTTPStatus
-from ..models import User
+from .. import principal_cache
 
 class JWTAuth(HttpBearer):
     def authenticate(self, request, token):
@@ -10,7 +13,7 @@ class JWTAuth(HttpBearer):
             return None
         try:
             access_token = AccessToken(token)
-            user = User.objects.get(id=access_token['user_id'])
+            user = principal_cache.get_user(access_token['user_id'])  # 命中快取時不會查詢資料庫
             return {
                 'user': user,
                 'user_type': user.user_type
@@ -27,4 +30,11 @@ class AdminJWTAuth(JWTAuth):
         auth = super().authenticate(request, token)
         if not auth or auth['user_type'] != 2:
             raise HttpError(HTTPStatus.FORBIDDEN, "需要管理員權限")
-        return auth
\ No newline at end of file
+        return auth
+
+# CDN 等邊緣節點回報導向次數時使用的固定 token（EDGE_INGEST_TOKEN），未設定時不接受任何請求
+class EdgeTokenAuth(HttpBearer):
+    def authenticate(self, request, token):
+        if not settings.EDGE_INGEST_TOKEN or not hmac.compare_digest(token, settings.EDGE_INGEST_TOKEN):
+            return None
+        return {'user': None, 'user_type': 0}
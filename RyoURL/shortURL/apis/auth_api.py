@@ -1,4 +1,6 @@
 from http import HTTPStatus
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import authenticate
 from ninja import Router
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -6,43 +8,80 @@ from ninja.errors import HttpError
 from django.db import IntegrityError
 
 from schemas.schemas import UserSchema, UserResponseSchema, ErrorSchema
+from .. import password_hashing
 from ..models import User
 
+try:
+    from django.contrib.auth import aauthenticate
+except ImportError:
+    # Django 5.0 以前沒有 aauthenticate：在執行緒池中執行 authenticate，等待雜湊時不佔用處理其他 async 請求的執行緒
+    aauthenticate = sync_to_async(authenticate, thread_sensitive=False)
+
 auth_router = Router(tags=["auth"])
 
-@auth_router.post("register", auth=None, response={HTTPStatus.CREATED: UserResponseSchema, HTTPStatus.BAD_REQUEST: ErrorSchema})
+AUTH_RESPONSES = {HTTPStatus.BAD_REQUEST: ErrorSchema, HTTPStatus.SERVICE_UNAVAILABLE: ErrorSchema}
+BUSY_DETAIL = "系統忙碌，請稍後再試"
+
+def token_response(status: HTTPStatus, user: User):
+    refresh = RefreshToken.for_user(user)
+    return status, UserResponseSchema(
+        username=user.username,
+        user_type=user.user_type,
+        access=str(refresh.access_token),
+        refresh=str(refresh)
+    )
+
+# 密碼雜湊在行程池中計算（見 password_hashing），等待中的雜湊超過上限時回傳 503
 def register_user(request, user_data: UserSchema):
     try:
-        user = User.objects.create_user(
-            username=user_data.username, 
-            password=user_data.password
+        user = User.objects.create(
+            username=User.normalize_username(user_data.username),
+            password=password_hashing.hash_password(user_data.password)
         )
+    except password_hashing.HashingBusy:
+        raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, BUSY_DETAIL)
     except IntegrityError:
         raise HttpError(HTTPStatus.BAD_REQUEST, "用戶名已存在")
     except Exception as e:
         raise HttpError(HTTPStatus.BAD_REQUEST, f"註冊失敗: {str(e)}")
-    
-    refresh = RefreshToken.for_user(user)
-    return HTTPStatus.CREATED, UserResponseSchema(
-        username=user.username,
-        user_type=user.user_type,
-        access=str(refresh.access_token),
-        refresh=str(refresh)
-    )
-    
-@auth_router.post("login", auth=None, response={HTTPStatus.OK: UserResponseSchema, HTTPStatus.BAD_REQUEST: ErrorSchema})
+    return token_response(HTTPStatus.CREATED, user)
+
+async def aregister_user(request, user_data: UserSchema):
+    try:
+        user = await User.objects.acreate(
+            username=User.normalize_username(user_data.username),
+            password=await password_hashing.ahash_password(user_data.password)
+        )
+    except password_hashing.HashingBusy:
+        raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, BUSY_DETAIL)
+    except IntegrityError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "用戶名已存在")
+    except Exception as e:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"註冊失敗: {str(e)}")
+    return token_response(HTTPStatus.CREATED, user)
+
 def login_user(request, user_data: UserSchema):
-    user = authenticate(
-        username=user_data.username, 
-        password=user_data.password
-    )
+    try:
+        user = authenticate(request, username=user_data.username, password=user_data.password)
+    except password_hashing.HashingBusy:
+        raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, BUSY_DETAIL)
     if not user:
         raise HttpError(HTTPStatus.BAD_REQUEST, "登入失敗")
-    
-    refresh = RefreshToken.for_user(user)
-    return HTTPStatus.OK, UserResponseSchema(
-        username=user.username,
-        user_type=user.user_type,
-        access=str(refresh.access_token),
-        refresh=str(refresh)
-    )
\ No newline at end of file
+    return token_response(HTTPStatus.OK, user)
+
+async def alogin_user(request, user_data: UserSchema):
+    try:
+        user = await aauthenticate(request, username=user_data.username, password=user_data.password)
+    except password_hashing.HashingBusy:
+        raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, BUSY_DETAIL)
+    if not user:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "登入失敗")
+    return token_response(HTTPStatus.OK, user)
+
+# ASGI 非同步模式下改用 async 版本，等待雜湊時不會阻塞 event loop
+auth_router.post("register", auth=None, response={HTTPStatus.CREATED: UserResponseSchema, **AUTH_RESPONSES})(
+    aregister_user if settings.ASYNC_VIEWS else register_user
+)
+auth_router.post("login", auth=None, response={HTTPStatus.OK: UserResponseSchema, **AUTH_RESPONSES})(
+    alogin_user if settings.ASYNC_VIEWS else login_user
+)
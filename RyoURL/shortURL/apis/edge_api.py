@@ -0,0 +1,22 @@
+from http import HTTPStatus
+
+from django.conf import settings
+from ninja import Router
+
+from .. import sharding
+from ..visit_counter import record_hits
+from .schemas import EdgeHitsResponseSchema, EdgeHitsSchema
+from schemas.schemas import ErrorSchema
+
+edge_router = Router(tags=["edge"])
+
+# CDN 由快取直接回應的導向不會經過 Django，由邊緣節點的記錄整批回報，計入訪問次數與點擊統計
+@edge_router.post("hits", response={HTTPStatus.OK: EdgeHitsResponseSchema, HTTPStatus.BAD_REQUEST: ErrorSchema})
+def ingest_edge_hits(request, data: EdgeHitsSchema):
+    if len(data.hits) > settings.EDGE_HITS_MAX_ITEMS:
+        return HTTPStatus.BAD_REQUEST, ErrorSchema(detail=f'一次最多回報 {settings.EDGE_HITS_MAX_ITEMS} 筆')
+    ids = sharding.ids_by_short_string({hit.short_string for hit in data.hits})
+    hits = [(ids[hit.short_string], hit.count, hit.referrer, hit.user_agent) for hit in data.hits if hit.short_string in ids]
+    record_hits(hits)
+    accepted = sum(count for _, count, _, _ in hits)
+    return HTTPStatus.OK, EdgeHitsResponseSchema(accepted=accepted, unknown=sum(hit.count for hit in data.hits) - accepted)
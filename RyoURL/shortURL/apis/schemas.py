@@ -0,0 +1,88 @@
+from datetime import datetime
+from typing import Dict, List, Literal, Optional
+
+from ninja import Field, Schema
+
+from schemas.schemas import CustomUrlCreateSchema, UrlCreateSchema, UrlSchema
+
+RedirectType = Literal[301, 302, 307, 308]
+
+
+# 建立短網址時可指定導向類型，301、308 為永久導向（可由 CDN 與瀏覽器快取），預設 302
+class RedirectUrlCreateSchema(UrlCreateSchema):
+    redirect_type: RedirectType = 302
+
+
+class RedirectCustomUrlCreateSchema(CustomUrlCreateSchema):
+    redirect_type: RedirectType = 302
+
+
+class BulkUrlResultSchema(Schema):
+    index: int
+    url: Optional[UrlSchema] = None
+    error: Optional[str] = None
+    deduplicated: bool = False
+
+
+class BulkUrlResponseSchema(Schema):
+    created: int
+    failed: int
+    results: List[BulkUrlResultSchema]
+
+
+class ShortCodeFilterSchema(Schema):
+    ready: bool
+    bits: int
+    hashes: int
+    stats: Dict[str, int]
+
+
+# 管理員刪除過期短網址的結果，remaining 為尚未刪除的過期短網址（留給 reap_expired_urls 處理）
+class ExpiredUrlReapSchema(Schema):
+    deleted: int
+    remaining: int
+
+
+class ClickPointSchema(Schema):
+    bucket: datetime
+    clicks: int
+
+
+class ReferrerStatSchema(Schema):
+    referrer_host: str
+    clicks: int
+
+
+class HotKeySchema(Schema):
+    short_string: str
+    rate: float         # 所有行程合計的每秒導向次數（估計值）
+    processes: int      # 將此短網址固定在記憶體中的行程數
+
+
+class OriginsRequestSchema(Schema):
+    short_strings: List[str]
+
+
+# 批次查詢原網址的單筆結果，status 為 ok、not_found 或 expired
+class OriginResultSchema(Schema):
+    short_string: str
+    status: Literal['ok', 'not_found', 'expired']
+    origin_url: Optional[str] = None
+    expire_date: Optional[datetime] = None
+
+
+# CDN 等邊緣節點由快取回應的導向次數
+class EdgeHitSchema(Schema):
+    short_string: str
+    count: int = Field(1, ge=1)
+    referrer: Optional[str] = None
+    user_agent: Optional[str] = None
+
+
+class EdgeHitsSchema(Schema):
+    hits: List[EdgeHitSchema]
+
+
+class EdgeHitsResponseSchema(Schema):
+    accepted: int       # 已記錄的導向次數
+    unknown: int        # 不存在的短網址的導向次數（未記錄）
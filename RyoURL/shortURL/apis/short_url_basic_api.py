@@ -1,64 +1,315 @@
 from http import HTTPStatus
-import random
-import string
 import datetime
+import hashlib
+import json
+import time
+from typing import List
 
-from django.http import Http404
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from ninja import Router
-from django.shortcuts import get_object_or_404
+from pydantic import ValidationError
 
+from django.utils import timezone
+
+from .. import rate_limit, sharding, short_code_filter, url_cache
+from ..dedup import aware_expire_date, find_existing_url, origin_hash
 from ..models import Url, User
-from schemas.schemas import UrlSchema, ErrorSchema, UrlCreateSchema
+from ..short_code import allocator
+from .schemas import BulkUrlResponseSchema, BulkUrlResultSchema, OriginResultSchema, OriginsRequestSchema, RedirectUrlCreateSchema
+from schemas.schemas import UrlSchema, ErrorSchema
 
 short_url_router = Router(tags=["short-url"])
 
-def generate_short_url(length=6):
-    char = string.ascii_letters + string.digits
-    while True:
-        short_string = ''.join(random.choices(char, k=length))
-        if not Url.objects.filter(short_string=short_string).exists():
-            return short_string
+MAX_CREATE_ATTEMPTS = 5     # 短網址與自訂短網址或舊資料衝突時的重試次數
+BULK_INSERT_BATCH_SIZE = 1000
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+def generate_short_url():
+    return allocator.next_code()
 
 def handle_domain(request, short_string):
     domain = request.build_absolute_uri('/').strip('/')
     return f'{domain}/{short_string}'
 
-def create_url_entry(origin_url, short_string, short_url, expire_date=None, user=None):
+# 超過限流時回傳 429 與 Retry-After 標頭，未超過時回傳 None
+def rate_limited(request, response, route):
+    retry = rate_limit.check(request, route)
+    if retry is None:
+        return None
+    response['Retry-After'] = rate_limit.retry_after_header(retry)
+    return HTTPStatus.TOO_MANY_REQUESTS, ErrorSchema(detail="請求過於頻繁，請稍後再試。")
+
+def get_anonymous_user():
+    user, _ = User.objects.get_or_create(username='anonymous', defaults={'user_type': 0})
+    return user
+
+def create_url_entry(origin_url, short_string, short_url, expire_date=None, user=None, redirect_type=302):
     if user is None:
-        user, _ = User.objects.get_or_create(username='anonymous', defaults={'user_type': 0})
-    return Url.objects.create(
+        user = get_anonymous_user()
+    return Url.objects.using(sharding.shard_for(short_string)).create(
+        id=sharding.next_ids(1)[0],
         origin_url=str(origin_url),
         short_string=short_string,
         short_url=str(short_url),
         create_date=datetime.datetime.now(),
-        expire_date=expire_date,
-        user=user
+        expire_date=aware_expire_date(expire_date),
+        user=user,
+        redirect_type=redirect_type
+    )
+
+# 解析批次建立的請求內容，支援 JSON 陣列與 NDJSON，回傳 (索引, 資料, 錯誤訊息) 的列表
+def parse_bulk_items(request, schema_for):
+    content_type = request.content_type or ''
+    body = request.body.decode('utf-8')
+    if content_type in NDJSON_CONTENT_TYPES:
+        raw_items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                raw_items.append(json.loads(line))
+            except ValueError as e:
+                raw_items.append(e)
+    else:
+        try:
+            raw_items = json.loads(body)
+        except ValueError as e:
+            raise ValueError(f'無法解析請求內容: {e}')
+        if not isinstance(raw_items, list):
+            raise ValueError('請求內容必須是陣列')
+
+    if len(raw_items) > settings.BULK_CREATE_MAX_ITEMS:
+        raise ValueError(f'一次最多建立 {settings.BULK_CREATE_MAX_ITEMS} 個短網址')
+
+    items = []
+    for index, raw in enumerate(raw_items):
+        if isinstance(raw, Exception):
+            items.append((index, None, f'無法解析此行: {raw}'))
+            continue
+        if not isinstance(raw, dict):
+            items.append((index, None, '每個項目必須是物件'))
+            continue
+        try:
+            items.append((index, schema_for(raw)(**raw), None))
+        except ValidationError as e:
+            items.append((index, None, str(e)))
+    return items
+
+# 去除重複：以單一索引查詢找出同一使用者已存在的短網址，
+# 回傳仍需建立的項目索引，以及批次內重複項目對應到第一個相同項目的索引
+def deduplicate_bulk_items(data_by_index, generated, hashes, user, results):
+    existing = {}
+    urls = [
+        url
+        for queryset in sharding.querysets()
+        for url in queryset.filter(user=user, origin_hash__in={hashes[index] for index in generated})
+        .exclude(expire_date__lte=timezone.now())
+    ]
+    for url in sorted(urls, key=lambda url: url.id):
+        existing[(url.origin_hash, url.expire_date, url.redirect_type)] = url
+
+    remaining = []
+    duplicates = {}
+    first_in_batch = {}
+    for index in generated:
+        key = (hashes[index], aware_expire_date(data_by_index[index].expire_date), data_by_index[index].redirect_type)
+        if key in existing:
+            results[index] = BulkUrlResultSchema(index=index, url=UrlSchema.from_orm(existing[key]), deduplicated=True)
+        elif key in first_in_batch:
+            duplicates[index] = first_in_batch[key]
+        else:
+            first_in_batch[key] = index
+            remaining.append(index)
+    return remaining, duplicates
+
+# 批次建立短網址：一次分配所有短網址，並在單一交易中以 bulk_create 寫入
+def bulk_create_url_entries(request, items, user=None):
+    if user is None:
+        user = get_anonymous_user()
+    domain = request.build_absolute_uri('/').strip('/')
+    results = {index: BulkUrlResultSchema(index=index, error=error) for index, data, error in items if error}
+    pending = [(index, data) for index, data, error in items if not error]
+
+    # 自訂短網址：檢查批次內重複與資料庫中已存在的短網址
+    custom = [data.short_string for _, data in pending if getattr(data, 'short_string', None)]
+    taken = sharding.existing_short_strings(custom)
+    codes = {}
+    for index, data in pending:
+        short_string = getattr(data, 'short_string', None)
+        if not short_string:
+            continue
+        if short_string in taken:
+            results[index] = BulkUrlResultSchema(index=index, error='自訂短網址已存在，請更換其他短網址。')
+        else:
+            taken.add(short_string)
+            codes[index] = short_string
+
+    # 其餘項目一次分配短網址，若與既有資料衝突則換新的
+    generated = [index for index, data in pending if index not in results and index not in codes]
+    hashes = {index: origin_hash(data.origin_url) for index, data in pending}
+    duplicates = {}
+    if settings.URL_DEDUP_ENABLED:
+        generated, duplicates = deduplicate_bulk_items(dict(pending), generated, hashes, user, results)
+    while generated:
+        candidates = dict(zip(generated, allocator.next_codes(len(generated))))
+        conflicts = sharding.existing_short_strings(candidates.values())
+        generated = []
+        for index, short_string in candidates.items():
+            if short_string in conflicts or short_string in taken:
+                generated.append(index)
+            else:
+                taken.add(short_string)
+                codes[index] = short_string
+
+    now = datetime.datetime.now()
+    ids = iter(sharding.next_ids(len(codes)))
+    entries = [
+        (index, Url(
+            id=next(ids),
+            origin_url=str(data.origin_url),
+            short_string=codes[index],
+            short_url=f'{domain}/{codes[index]}',
+            create_date=now,
+            expire_date=aware_expire_date(data.expire_date),
+            user=user,
+            origin_hash=hashes[index],
+            redirect_type=data.redirect_type
+        ))
+        for index, data in pending if index in codes
+    ]
+    # 依短網址所在的分片分別寫入，每個分片各自一個交易
+    by_shard = {}
+    for _, url in entries:
+        by_shard.setdefault(sharding.shard_for(url.short_string), []).append(url)
+    for shard, urls in by_shard.items():
+        with transaction.atomic(using=shard):
+            Url.objects.using(shard).bulk_create(urls, batch_size=BULK_INSERT_BATCH_SIZE)
+    # bulk_create 不會觸發 signal，手動清除快取並加入 Bloom filter
+    url_cache.invalidate(codes.values())
+    short_code_filter.add(codes.values())
+
+    for index, url in entries:
+        results[index] = BulkUrlResultSchema(index=index, url=UrlSchema.from_orm(url))
+    # 批次內重複的原網址沿用同一批新建立的短網址
+    for index, first in duplicates.items():
+        results[index] = BulkUrlResultSchema(index=index, url=results[first].url, deduplicated=True)
+    ordered = [results[index] for index, _, _ in items]
+    return BulkUrlResponseSchema(
+        created=len(entries),
+        failed=sum(1 for result in ordered if result.error),
+        results=ordered
     )
 
-@short_url_router.post("/short", response={HTTPStatus.CREATED: UrlSchema, HTTPStatus.BAD_REQUEST: ErrorSchema})
-def create_short_url(request, data: UrlCreateSchema):
+@short_url_router.post("/short", response={HTTPStatus.CREATED: UrlSchema, HTTPStatus.OK: UrlSchema, HTTPStatus.BAD_REQUEST: ErrorSchema, HTTPStatus.TOO_MANY_REQUESTS: ErrorSchema})
+def create_short_url(request, response: HttpResponse, data: RedirectUrlCreateSchema):
+    limited = rate_limited(request, response, 'create')
+    if limited:
+        return limited
     try:
-        short_string = generate_short_url()
-        short_url = handle_domain(request, short_string)
-        
         user = request.auth.get('user') if request.auth else None
+        if user is None:
+            user = get_anonymous_user()
 
-        url = create_url_entry(
-            origin_url=data.origin_url,
-            short_string=short_string,
-            short_url=short_url,
-            expire_date=data.expire_date,
-            user=user
-        )
-        
-        return HTTPStatus.CREATED, UrlSchema.from_orm(url)
+        # 去除重複模式下，同一使用者重複建立相同原網址時回傳既有的短網址
+        if settings.URL_DEDUP_ENABLED:
+            existing = find_existing_url(user, data.origin_url, data.expire_date, data.redirect_type)
+            if existing is not None:
+                return HTTPStatus.OK, UrlSchema.from_orm(existing)
+
+        for attempt in range(MAX_CREATE_ATTEMPTS):
+            short_string = generate_short_url()
+            short_url = handle_domain(request, short_string)
+            try:
+                with transaction.atomic(using=sharding.shard_for(short_string)):
+                    url = create_url_entry(
+                        origin_url=data.origin_url,
+                        short_string=short_string,
+                        short_url=short_url,
+                        expire_date=data.expire_date,
+                        user=user,
+                        redirect_type=data.redirect_type
+                    )
+                return HTTPStatus.CREATED, UrlSchema.from_orm(url)
+            except IntegrityError:
+                # 產生的短網址已被自訂短網址佔用，改用下一個
+                if attempt == MAX_CREATE_ATTEMPTS - 1:
+                    raise
     except Exception as e:
         return HTTPStatus.BAD_REQUEST, ErrorSchema(detail=str(e))
 
-@short_url_router.get("/origin/{short_string}", response={HTTPStatus.OK: UrlSchema, HTTPStatus.NOT_FOUND: ErrorSchema})
-def get_original_url(request, short_string: str):
+# 回傳短網址資料並加上 ETag、Last-Modified 與 Cache-Control；
+# 請求的 If-None-Match 或 If-Modified-Since 符合時回傳 304，不需要再傳送內容
+def conditional_url_response(request, response, url):
+    last_modified = url.update_date or url.create_date
+    if timezone.is_naive(last_modified):
+        last_modified = timezone.make_aware(last_modified)
+    fingerprint = f'{url.id}:{url.origin_url}:{url.expire_date}:{url.visit_count}:{url.redirect_type}'
+    headers = {
+        'ETag': quote_etag(hashlib.md5(fingerprint.encode()).hexdigest()),
+        'Last-Modified': http_date(last_modified.timestamp()),
+    }
+    not_modified = get_conditional_response(request, etag=headers['ETag'], last_modified=int(last_modified.timestamp()))
+    target = not_modified if not_modified is not None else response
+    for name, value in headers.items():
+        target[name] = value
+    patch_cache_control(target, public=True, max_age=settings.ORIGIN_CACHE_MAX_AGE)
+    if not_modified is not None:
+        return not_modified
+    return HTTPStatus.OK, UrlSchema.from_orm(url)
+
+def get_original_url(request, response: HttpResponse, short_string: str):
+    url = sharding.first(short_string)
+    if url is None:
+        return HTTPStatus.NOT_FOUND, ErrorSchema(detail="Short URL not found")
+    return conditional_url_response(request, response, url)
+
+async def aget_original_url(request, response: HttpResponse, short_string: str):
+    url = await sharding.afirst(short_string)
+    if url is None:
+        return HTTPStatus.NOT_FOUND, ErrorSchema(detail="Short URL not found")
+    return conditional_url_response(request, response, url)
+
+# ASGI 非同步模式下改用 async 版本
+short_url_router.get("/origin/{short_string}", response={HTTPStatus.OK: UrlSchema, HTTPStatus.NOT_FOUND: ErrorSchema})(
+    aget_original_url if settings.ASYNC_VIEWS else get_original_url
+)
+
+@short_url_router.post("/bulk", response={HTTPStatus.OK: BulkUrlResponseSchema, HTTPStatus.BAD_REQUEST: ErrorSchema, HTTPStatus.TOO_MANY_REQUESTS: ErrorSchema})
+def create_bulk_short_url(request, response: HttpResponse):
+    limited = rate_limited(request, response, 'create')
+    if limited:
+        return limited
     try:
-        url = get_object_or_404(Url, short_string=short_string)
-        return HTTPStatus.OK, UrlSchema.from_orm(url)
-    except Http404:
-        return HTTPStatus.NOT_FOUND, ErrorSchema(detail="Short URL not found")
\ No newline at end of file
+        items = parse_bulk_items(request, lambda raw: RedirectUrlCreateSchema)
+        user = request.auth.get('user') if request.auth else None
+        return HTTPStatus.OK, bulk_create_url_entries(request, items, user=user)
+    except Exception as e:
+        return HTTPStatus.BAD_REQUEST, ErrorSchema(detail=str(e))
+
+# 一次查詢多個短網址的原網址：快取以一次 MGET 取得，其餘每個分片一次查詢，結果依輸入順序回傳
+@short_url_router.post("/origins", response={HTTPStatus.OK: List[OriginResultSchema], HTTPStatus.BAD_REQUEST: ErrorSchema})
+def get_original_urls(request, data: OriginsRequestSchema):
+    if len(data.short_strings) > settings.ORIGINS_MAX_ITEMS:
+        return HTTPStatus.BAD_REQUEST, ErrorSchema(detail=f'一次最多查詢 {settings.ORIGINS_MAX_ITEMS} 個短網址')
+    urls = url_cache.get_urls(data.short_strings)
+    now = time.time()
+    results = []
+    for short_string in data.short_strings:
+        url = urls.get(short_string)
+        if url is None:
+            results.append(OriginResultSchema(short_string=short_string, status='not_found'))
+            continue
+        expire_date = datetime.datetime.fromtimestamp(url.expire_date, datetime.timezone.utc) if url.expire_date is not None else None
+        # 與導向相同，已過期的短網址不回傳原網址
+        expired = url.is_expired(now)
+        results.append(OriginResultSchema(
+            short_string=short_string,
+            status='expired' if expired else 'ok',
+            origin_url=None if expired else url.origin_url,
+            expire_date=expire_date
+        ))
+    return HTTPStatus.OK, results
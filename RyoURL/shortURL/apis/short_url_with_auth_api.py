@@ -1,44 +1,120 @@
 from http import HTTPStatus
-from typing import List
-from django.http import Http404
-from ninja import Router
+from datetime import datetime, timedelta
+from typing import List, Optional
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+from django.http import Http404, HttpResponse
+from ninja import Query, Router
 from ninja.errors import HttpError
 from django.db import IntegrityError
-from django.shortcuts import get_object_or_404
 
-from ..models import Url
-from schemas.schemas import UrlSchema, ErrorSchema, CustomUrlCreateSchema
-from .short_url_basic_api import handle_domain, create_url_entry
+from .. import sharding
+from ..models import ClickRollup
+from ..pagination import NEXT_CURSOR_HEADER, keyset_page, stream_ndjson
+from .schemas import BulkUrlResponseSchema, ClickPointSchema, RedirectCustomUrlCreateSchema, RedirectUrlCreateSchema, ReferrerStatSchema
+from schemas.schemas import UrlSchema, ErrorSchema
+from .short_url_basic_api import handle_domain, create_url_entry, parse_bulk_items, bulk_create_url_entries, rate_limited
 
 auth_short_url_router = Router(tags=["auth-short-url"])
 
-@auth_short_url_router.post("custom", response={HTTPStatus.CREATED: UrlSchema, HTTPStatus.BAD_REQUEST: ErrorSchema})
-def create_custom_url(request, data: CustomUrlCreateSchema):
+# 常數設定
+DEFAULT_CLICK_RANGE = {'hour': timedelta(hours=48), 'day': timedelta(days=30)}     # 未指定 start 時查詢的時間範圍
+MAX_TOP_REFERRERS = 100
+
+# 查詢短網址的點擊彙總資料，只有短網址的擁有者與管理員可以查看
+def query_click_rollups(request, short_string: str, granularity: str, start: Optional[datetime], end: Optional[datetime]):
+    if granularity not in DEFAULT_CLICK_RANGE:
+        raise ValueError("granularity 必須是 hour 或 day")
+    url = sharding.first(short_string)
+    if url is None:
+        raise Http404
+    if url.user_id != request.auth['user'].id and request.auth['user_type'] != 2:
+        raise PermissionError("無權限查看此短網址的統計")
+    end = end or timezone.now()
+    start = start or end - DEFAULT_CLICK_RANGE[granularity]
+    # 點擊彙總與短網址在同一個分片
+    return ClickRollup.objects.using(url._state.db).filter(url=url, granularity=granularity, bucket__gte=start, bucket__lt=end)
+
+@auth_short_url_router.post("custom", response={HTTPStatus.CREATED: UrlSchema, HTTPStatus.BAD_REQUEST: ErrorSchema, HTTPStatus.TOO_MANY_REQUESTS: ErrorSchema})
+def create_custom_url(request, response: HttpResponse, data: RedirectCustomUrlCreateSchema):
+    limited = rate_limited(request, response, 'custom')
+    if limited:
+        return limited
     short_url = handle_domain(request, data.short_string)
-    if Url.objects.filter(short_string=data.short_string).exists():
+    if sharding.existing_short_strings([data.short_string]):
         return HTTPStatus.BAD_REQUEST, ErrorSchema(detail="自訂短網址已存在，請更換其他短網址。")
     
     user = request.auth['user']
     try:
-        url = create_url_entry(data.origin_url, data.short_string, short_url, data.expire_date, user=user)
+        url = create_url_entry(data.origin_url, data.short_string, short_url, data.expire_date, user=user,
+                               redirect_type=data.redirect_type)
         return HTTPStatus.CREATED, UrlSchema.from_orm(url)
     except IntegrityError as e:
         return HTTPStatus.BAD_REQUEST, ErrorSchema(detail=f"創建短網址失敗：{str(e)}")
     except Exception as e:
         return HTTPStatus.BAD_REQUEST, ErrorSchema(detail=f"創建短網址時發生錯誤：{str(e)}")
 
-@auth_short_url_router.get('all-my', response={HTTPStatus.OK: List[UrlSchema], HTTPStatus.FORBIDDEN: ErrorSchema})
-def get_all_myurl(request):
-    urls = Url.objects.filter(user=request.auth['user'])
-    return HTTPStatus.OK, [UrlSchema.from_orm(url) for url in urls]
+@auth_short_url_router.post("bulk", response={HTTPStatus.OK: BulkUrlResponseSchema, HTTPStatus.BAD_REQUEST: ErrorSchema, HTTPStatus.TOO_MANY_REQUESTS: ErrorSchema})
+def create_bulk_custom_url(request, response: HttpResponse):
+    limited = rate_limited(request, response, 'custom')
+    if limited:
+        return limited
+    # 有 short_string 的項目視為自訂短網址，其餘自動產生
+    try:
+        items = parse_bulk_items(request, lambda raw: RedirectCustomUrlCreateSchema if raw.get('short_string') else RedirectUrlCreateSchema)
+        return HTTPStatus.OK, bulk_create_url_entries(request, items, user=request.auth['user'])
+    except Exception as e:
+        return HTTPStatus.BAD_REQUEST, ErrorSchema(detail=f"批次創建短網址時發生錯誤：{str(e)}")
+
+@auth_short_url_router.get('all-my', response={HTTPStatus.OK: List[UrlSchema], HTTPStatus.BAD_REQUEST: ErrorSchema, HTTPStatus.FORBIDDEN: ErrorSchema})
+def get_all_myurl(request, response: HttpResponse, cursor: Optional[str] = None, limit: int = Query(settings.URL_LIST_PAGE_SIZE, ge=1, le=settings.URL_LIST_MAX_PAGE_SIZE), stream: bool = False):
+    urls = [queryset.filter(user=request.auth['user']) for queryset in sharding.querysets()]
+    try:
+        if stream:
+            return stream_ndjson(urls, cursor)
+        page, next_cursor = keyset_page(urls, cursor, limit)
+    except ValueError as e:
+        return HTTPStatus.BAD_REQUEST, ErrorSchema(detail=str(e))
+    if next_cursor:
+        response[NEXT_CURSOR_HEADER] = next_cursor
+    return HTTPStatus.OK, [UrlSchema.from_orm(url) for url in page]
 
 @auth_short_url_router.delete('url/{short_string}', response={HTTPStatus.NO_CONTENT: None, HTTPStatus.NOT_FOUND: ErrorSchema, HTTPStatus.FORBIDDEN: ErrorSchema})
 def delete_short_url(request, short_string: str):
     try:
-        url = get_object_or_404(Url, short_string=short_string)
-        if url.user == request.auth['user'] or request.auth['user_type'] == 2:
+        url = sharding.first(short_string)
+        if url is None:
+            raise Http404
+        if url.user_id == request.auth['user'].id or request.auth['user_type'] == 2:
             url.delete()
             return HTTPStatus.NO_CONTENT, None
         return HTTPStatus.FORBIDDEN, ErrorSchema(detail="無權限刪除此短網址")
     except Http404:
-        return HTTPStatus.NOT_FOUND, ErrorSchema(detail="Short URL not found")
\ No newline at end of file
+        return HTTPStatus.NOT_FOUND, ErrorSchema(detail="Short URL not found")
+
+@auth_short_url_router.get('url/{short_string}/clicks', response={HTTPStatus.OK: List[ClickPointSchema], HTTPStatus.BAD_REQUEST: ErrorSchema, HTTPStatus.FORBIDDEN: ErrorSchema, HTTPStatus.NOT_FOUND: ErrorSchema})
+def get_click_series(request, short_string: str, granularity: str = 'day', start: Optional[datetime] = None, end: Optional[datetime] = None):
+    try:
+        rollups = query_click_rollups(request, short_string, granularity, start, end)
+        points = rollups.values('bucket').annotate(clicks=Sum('clicks')).order_by('bucket')
+        return HTTPStatus.OK, [ClickPointSchema(bucket=point['bucket'], clicks=point['clicks']) for point in points]
+    except Http404:
+        return HTTPStatus.NOT_FOUND, ErrorSchema(detail="Short URL not found")
+    except PermissionError as e:
+        return HTTPStatus.FORBIDDEN, ErrorSchema(detail=str(e))
+    except ValueError as e:
+        return HTTPStatus.BAD_REQUEST, ErrorSchema(detail=str(e))
+
+@auth_short_url_router.get('url/{short_string}/referrers', response={HTTPStatus.OK: List[ReferrerStatSchema], HTTPStatus.BAD_REQUEST: ErrorSchema, HTTPStatus.FORBIDDEN: ErrorSchema, HTTPStatus.NOT_FOUND: ErrorSchema})
+def get_top_referrers(request, short_string: str, start: Optional[datetime] = None, end: Optional[datetime] = None, limit: int = Query(10, ge=1, le=MAX_TOP_REFERRERS)):
+    try:
+        rollups = query_click_rollups(request, short_string, 'day', start, end)
+        top = rollups.values('referrer_host').annotate(clicks=Sum('clicks')).order_by('-clicks', 'referrer_host')
+        return HTTPStatus.OK, [ReferrerStatSchema(referrer_host=row['referrer_host'], clicks=row['clicks']) for row in top[:limit]]
+    except Http404:
+        return HTTPStatus.NOT_FOUND, ErrorSchema(detail="Short URL not found")
+    except PermissionError as e:
+        return HTTPStatus.FORBIDDEN, ErrorSchema(detail=str(e))
+    except ValueError as e:
+        return HTTPStatus.BAD_REQUEST, ErrorSchema(detail=str(e))
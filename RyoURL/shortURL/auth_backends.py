@@ -0,0 +1,48 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from . import password_hashing
+
+UserModel = get_user_model()
+
+
+# 與 ModelBackend 相同的驗證規則，密碼雜湊改在行程池中計算（見 password_hashing）：
+# 使用者不存在時同樣計算一次雜湊，避免由回應時間判斷帳號是否存在；雜湊方式或迭代次數變更時以新的設定重新雜湊並儲存。
+# 等待中的雜湊超過上限時拋出 HashingBusy，由 view 回傳 503
+class PooledHashingBackend(ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            password_hashing.hash_password(password)
+            return None
+        correct, must_update = password_hashing.verify_password(password, user.password)
+        if correct and must_update:
+            user.password = password_hashing.hash_password(password)
+            user.save(update_fields=['password'])
+        if correct and self.user_can_authenticate(user):
+            return user
+        return None
+
+    # asyncio 版本，由 django.contrib.auth.aauthenticate 呼叫（Django 5.0 以上），等待雜湊時不會阻塞 event loop
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await UserModel._default_manager.aget(**{UserModel.USERNAME_FIELD: username})
+        except UserModel.DoesNotExist:
+            await password_hashing.ahash_password(password)
+            return None
+        correct, must_update = await password_hashing.averify_password(password, user.password)
+        if correct and must_update:
+            user.password = await password_hashing.ahash_password(password)
+            await user.asave(update_fields=['password'])
+        if correct and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,218 @@
+import json
+import math
+import random
+import time
+from collections import Counter, defaultdict
+from itertools import accumulate
+from typing import Dict, List, Optional
+
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import sharding, short_code_filter, url_cache
+from .models import ClickRollup, Url, User
+
+# 常數設定
+SEED_PREFIX = '~'       # 測試資料的短網址前綴，不在短網址字元集中，不會與產生的短網址衝突
+SEED_BATCH_SIZE = 10000
+MIX_SEED_PREFIX = '~b'
+CREATE_ORIGIN_PREFIX = 'https://example.com/bench-create/'
+BENCH_USERNAME = '~bench'
+HOST = 'localhost'
+DEFAULT_MIX = 'redirect=80,origin=10,create=5,list=5'
+SCENARIOS = ('redirect', 'origin', 'create', 'list')
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+# 效能測試用的延遲紀錄器
+class LatencyRecorder:
+    def __init__(self, name: str):
+        self.name = name
+        self.samples: List[float] = []
+        self._started = None
+        self._elapsed = 0.0
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._elapsed += time.perf_counter() - self._started
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    # 計時一次操作
+    def time(self, func, *args, **kwargs):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.samples.append(time.perf_counter() - started)
+        return result
+
+    def summary(self, **extra) -> Dict:
+        samples = sorted(self.samples)
+        total = self._elapsed or sum(samples)
+        result = {
+            'name': self.name,
+            'count': len(samples),
+            'seconds': round(total, 6),
+            'per_second': round(len(samples) / total, 2) if total else None,
+            'p50_ms': percentile(samples, 50),
+            'p95_ms': percentile(samples, 95),
+            'p99_ms': percentile(samples, 99),
+        }
+        result.update(extra)
+        return result
+
+
+# 計算已排序樣本的百分位數（毫秒）
+def percentile(sorted_samples: List[float], pct: float):
+    if not sorted_samples:
+        return None
+    index = max(0, math.ceil(pct / 100 * len(sorted_samples)) - 1)
+    return round(sorted_samples[index] * 1000, 4)
+
+
+# 以 JSON 輸出效能測試結果，方便比較不同版本
+def dump_results(results: List[Dict], stream) -> None:
+    stream.write(json.dumps(results, indent=2, ensure_ascii=False))
+    stream.write('\n')
+
+
+# 第 i 個請求的用戶端 IP：每個請求來自不同的 IP，限流照常檢查但不會拒絕測試請求
+def simulated_ip(i: int) -> str:
+    return f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}'
+
+
+# 產生測試用的短網址，回傳其短網址字串（未分片的 PostgreSQL 使用 generate_series，一次插入）
+def seed_urls(count: int, prefix: str = SEED_PREFIX, user_id: Optional[int] = None) -> List[str]:
+    table = connection.ops.quote_name(Url._meta.db_table)
+    if connection.vendor == 'postgresql' and not sharding.enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (origin_url, short_string, short_url, create_date, visit_count, user_id, redirect_type) "
+                f"SELECT 'https://example.com/' || g, %s || to_hex(g), 'http://bench/' || g, now(), 0, %s, 302 "
+                f"FROM generate_series(0, %s - 1) AS g ON CONFLICT (short_string) DO NOTHING",
+                [prefix, user_id, count],
+            )
+    else:
+        for start in range(0, count, SEED_BATCH_SIZE):
+            indexes = range(start, min(count, start + SEED_BATCH_SIZE))
+            by_shard = {}
+            for i, url_id in zip(indexes, sharding.next_ids(len(indexes))):
+                url = Url(id=url_id, origin_url=f'https://example.com/{i}', short_string=f'{prefix}{i:x}',
+                          short_url=f'http://bench/{i}', user_id=user_id)
+                by_shard.setdefault(sharding.shard_for(url.short_string), []).append(url)
+            for shard, urls in by_shard.items():
+                Url.objects.using(shard).bulk_create(urls, ignore_conflicts=True)
+    codes = [f'{prefix}{i:x}' for i in range(count)]
+    # 直接寫入資料庫不會觸發 signal，手動清除負向快取並加入 Bloom filter
+    for start in range(0, count, SEED_BATCH_SIZE):
+        batch = codes[start:start + SEED_BATCH_SIZE]
+        url_cache.invalidate(batch)
+        short_code_filter.add(batch)
+    return codes
+
+
+# 直接以 SQL 刪除每個分片的測試資料，避免逐筆觸發 signal
+def delete_seeded_urls(prefix: str = SEED_PREFIX, ids: List[int] = (), origin_prefix: Optional[str] = None) -> None:
+    for shard in sharding.all_shards():
+        # 先刪除測試期間 consume_clicks 可能產生的點擊統計
+        rollups = ClickRollup.objects.using(shard).filter(url__short_string__startswith=prefix)
+        if origin_prefix:
+            rollups = rollups | ClickRollup.objects.using(shard).filter(url__origin_url__startswith=origin_prefix)
+        rollups.delete()
+        table = connections[shard].ops.quote_name(Url._meta.db_table)
+        with connections[shard].cursor() as cursor:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                ClickRollup.objects.using(shard).filter(url_id__in=batch).delete()
+                cursor.execute(f'DELETE FROM {table} WHERE id IN ({", ".join(["%s"] * len(batch))})', batch)
+            cursor.execute(f'DELETE FROM {table} WHERE short_string LIKE %s', [f'{prefix}%'])
+            if origin_prefix:
+                cursor.execute(f'DELETE FROM {table} WHERE origin_url LIKE %s', [f'{origin_prefix}%'])
+
+
+# 解析 "redirect=80,create=5" 格式的請求比例
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise ValueError(f'未知的請求類型: {name}，可用的類型: {", ".join(SCENARIOS)}')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def _send(client: Client, auth: Dict, name: str, code: str, i: int, list_limit: int):
+    if name == 'redirect':
+        return client.get(f'/{code}/', REMOTE_ADDR=simulated_ip(i))
+    if name == 'origin':
+        return client.get(f'/api/short-url/origin/{code}')
+    if name == 'create':
+        return client.post('/api/short-url/short', {'origin_url': f'{CREATE_ORIGIN_PREFIX}{i}'},
+                           content_type='application/json', REMOTE_ADDR=simulated_ip(i))
+    return client.get(f'/api/short-url-with-auth/all-my?limit={list_limit}', **auth)
+
+
+# 產生 urls 筆短網址，以 Django test client 重播依 Zipf 分佈挑選短網址的請求，回傳每種請求與全部請求的效能統計
+def run_mix(urls: int, requests: int, mix: Dict[str, float], zipf: float = 1.1, list_limit: int = 100,
+            seed: Optional[int] = None, warmup: int = 0) -> List[Dict]:
+    rng = random.Random(seed)
+    user, _ = User.objects.get_or_create(username=BENCH_USERNAME, defaults={'user_type': 1})
+    token = str(RefreshToken.for_user(user).access_token)
+    codes = seed_urls(urls, prefix=MIX_SEED_PREFIX, user_id=user.id)
+
+    # 依 Zipf 分佈決定每個短網址被請求的機率，熱門的短網址隨機分散在整個範圍內
+    ranked = codes[:]
+    rng.shuffle(ranked)
+    cum_weights = list(accumulate(1 / (rank ** zipf) for rank in range(1, len(ranked) + 1)))
+    names = rng.choices(list(mix), weights=list(mix.values()), k=warmup + requests)
+    targets = rng.choices(ranked, cum_weights=cum_weights, k=len(names))
+
+    client = Client(HTTP_HOST=HOST)
+    auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+    recorders = {name: LatencyRecorder(name) for name in mix}
+    queries = defaultdict(int)
+    silk_queries = defaultdict(int)
+    statuses = defaultdict(Counter)
+    total = LatencyRecorder('total')
+    try:
+        for i, (name, code) in enumerate(zip(names, targets)):
+            measured = i >= warmup
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = _send(client, auth, name, code, i, list_limit)
+                elapsed = time.perf_counter() - started
+            if not measured:
+                continue
+            recorders[name].record(elapsed)
+            total.record(elapsed)
+            # 不計算交易控制陳述式，Silk 寫入自己分析資料表的查詢分開計算
+            statements = [query['sql'] for query in captured.captured_queries
+                          if not query['sql'].startswith(TRANSACTION_STATEMENTS)]
+            silk = sum(1 for sql in statements if '"silk_' in sql)
+            queries[name] += len(statements) - silk
+            silk_queries[name] += silk
+            statuses[name][response.status_code] += 1
+    finally:
+        delete_seeded_urls(prefix=MIX_SEED_PREFIX, origin_prefix=CREATE_ORIGIN_PREFIX)
+        url_cache.invalidate(codes)
+        user.delete()
+
+    results = []
+    for name, recorder in recorders.items():
+        count = len(recorder.samples)
+        results.append(recorder.summary(
+            queries_per_request=round(queries[name] / count, 3) if count else None,
+            silk_queries_per_request=round(silk_queries[name] / count, 3) if count else None,
+            status_codes={str(code): n for code, n in sorted(statuses[name].items())},
+        ))
+    results.append(total.summary(
+        queries_per_request=round(sum(queries.values()) / len(total.samples), 3) if total.samples else None,
+        silk_queries_per_request=round(sum(silk_queries.values()) / len(total.samples), 3) if total.samples else None,
+        urls=urls, zipf=zipf, mix=mix, seed=seed, database=connection.vendor,
+    ))
+    return results
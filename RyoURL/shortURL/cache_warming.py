@@ -0,0 +1,102 @@
+import heapq
+import logging
+import threading
+import time
+from itertools import islice
+from typing import Dict, List
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis import RedisError
+
+from . import db_router, sharding, url_cache
+from .models import Url
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+WARM_BATCH_SIZE = 2000                  # 每次由伺服器端游標取回、由主資料庫讀取並以一個 pipeline 寫入 Redis 的筆數
+STARTUP_LOCK_KEY = 'cache_warm_lock'    # 啟動時預熱的鎖，避免多個行程同時預熱
+STARTUP_LOCK_TIMEOUT = 600              # 鎖的存活時間（秒），期間內重新啟動的行程不再預熱
+WARM_ORDERINGS = {
+    'top': 'visit_count',       # 點擊數最多（使用 (visit_count, id) 索引）
+    'recent': 'create_date',    # 最新建立（使用 (create_date, id) 索引）
+}
+
+
+# 由各分片以伺服器端游標依 field 由大到小讀取尚未過期的短網址，合併後取前 limit 筆；
+# 每筆為 (short_string, field, id)
+def _stream(field: str, limit: int, batch_size: int):
+    now = timezone.now()
+    iterables = []
+    for shard in sharding.all_shards():
+        queryset = (
+            Url.objects.using(sharding.read_db(shard))
+            .filter(Q(expire_date__isnull=True) | Q(expire_date__gt=now))
+            .order_by(f'-{field}', '-id')
+            .values_list('short_string', field, 'id')[:limit]
+        )
+        iterables.append(queryset.iterator(chunk_size=batch_size))
+    if len(iterables) == 1:
+        return iterables[0]
+    return islice(heapq.merge(*iterables, key=lambda row: (row[1], row[2]), reverse=True), limit)
+
+
+# 寫入一批短網址：與 url_cache.get_url 相同，先讀取版本再由主資料庫讀取導向所需的欄位，
+# 確認版本未變才寫入，串流讀取後才修改或刪除的短網址不會以舊資料寫回快取
+def _warm_batch(client, batch: List[tuple]) -> Dict[str, int]:
+    short_strings = [row[0] for row in batch]
+    versions = url_cache.fetch_versions(short_strings, client)
+    rows = sharding.rows_by_short_string(short_strings, url_cache.LOOKUP_FIELDS, primary=True)
+    stored = url_cache.store_rows(rows.items(), client, versions)
+    return {'stored': stored, 'removed': len(batch) - len(rows)}
+
+
+# 將點擊數最多的 top 筆與最新建立的 recent 筆短網址載入 Redis（兩者重疊的短網址會寫入兩次），
+# 排序的掃描由副本讀取（有設定時），回傳各類別讀取、寫入的數量與耗時
+def warm_cache(top: int, recent: int, batch_size: int = WARM_BATCH_SIZE) -> Dict:
+    started = time.monotonic()
+    client = get_redis_connection('default')
+    result = {'rows': 0, 'stored': 0, 'removed': 0}
+    with db_router.replica_reads():
+        for name, limit in (('top', top), ('recent', recent)):
+            if limit <= 0:
+                continue
+            rows = _stream(WARM_ORDERINGS[name], limit, batch_size)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                result['rows'] += len(batch)
+                for key, count in _warm_batch(client, batch).items():
+                    result[key] += count
+    result['seconds'] = round(time.monotonic() - started, 3)
+    logger.info(f'快取預熱完成: 讀取 {result["rows"]} 筆，寫入 {result["stored"]} 筆，耗時 {result["seconds"]} 秒')
+    return result
+
+
+def _warm_in_background() -> None:
+    try:
+        warm_cache(settings.CACHE_WARM_TOP, settings.CACHE_WARM_RECENT)
+    except Exception as e:
+        logger.error(f'啟動時預熱快取失敗: {e}', exc_info=True)
+    finally:
+        connections.close_all()
+
+
+# 伺服器啟動時（wsgi.py / asgi.py）在背景執行緒預熱快取，不延遲行程開始處理請求；
+# 以 Redis 鎖確保多個行程同時啟動時只有一個會預熱
+def warm_on_startup() -> None:
+    if not settings.CACHE_WARM_ON_STARTUP:
+        return
+    try:
+        if not get_redis_connection('default').set(STARTUP_LOCK_KEY, 1, nx=True, ex=STARTUP_LOCK_TIMEOUT):
+            return
+    except RedisError as e:
+        logger.error(f'無法取得快取預熱的鎖，略過啟動時預熱: {e}')
+        return
+    threading.Thread(target=_warm_in_background, name='cache-warm', daemon=True).start()
@@ -0,0 +1,144 @@
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from django.db import connections, transaction
+from django.utils import timezone
+from redis import ResponseError
+
+from . import sharding
+from .models import ClickRollup, Url
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+CLICK_STREAM_KEY = 'click_events'       # Redis Stream：每次導向的點擊事件
+CLICK_GROUP = 'click_rollup'            # 彙總點擊事件的 consumer group
+UPSERT_BATCH_SIZE = 1000                # 每個 INSERT 陳述式最多寫入的彙總筆數
+MAX_REFERRER_LENGTH = 255
+BOT_KEYWORDS = ('bot', 'spider', 'crawl', 'slurp', 'preview', 'curl', 'wget', 'python-requests')
+
+
+# 取出來源網址的主機名稱
+def referrer_host(referrer: Optional[str]) -> str:
+    if not referrer:
+        return ''
+    try:
+        return (urlsplit(referrer).hostname or '')[:MAX_REFERRER_LENGTH]
+    except ValueError:
+        return ''
+
+
+# 將 User-Agent 粗略分類，只保留統計需要的資訊
+def agent_class(user_agent: Optional[str]) -> str:
+    if not user_agent:
+        return 'other'
+    lowered = user_agent.lower()
+    if any(keyword in lowered for keyword in BOT_KEYWORDS):
+        return 'bot'
+    if 'mobi' in lowered or 'android' in lowered:
+        return 'mobile'
+    if lowered.startswith('mozilla/'):
+        return 'browser'
+    return 'other'
+
+
+# 點擊事件的欄位，事件時間使用 Stream 的 ID，不另外儲存；
+# count 為此事件代表的點擊數（CDN 回報的導向次數），只有大於 1 時才儲存
+def click_event(url_id: int, referrer: Optional[str], user_agent: Optional[str], count: int = 1) -> Dict[str, str]:
+    event = {'u': url_id, 'r': referrer_host(referrer), 'a': agent_class(user_agent)}
+    if count != 1:
+        event['n'] = count
+    return event
+
+
+# 建立 consumer group（已存在時略過）
+def ensure_group(client) -> None:
+    try:
+        client.xgroup_create(CLICK_STREAM_KEY, CLICK_GROUP, id='0', mkstream=True)
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+# 讀取一批點擊事件；pending 為 True 時重新讀取已交付給此 consumer 但尚未確認的事件（例如上次中途結束）
+def read_events(client, consumer: str, count: int, block_ms: Optional[int], pending: bool = False) -> List[Tuple]:
+    streams = client.xreadgroup(CLICK_GROUP, consumer, {CLICK_STREAM_KEY: '0' if pending else '>'},
+                                count=count, block=None if pending else block_ms)
+    return streams[0][1] if streams else []
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+# 將點擊事件依短網址、時間區間、來源網站與 User-Agent 類別彙總
+def aggregate(events) -> Counter:
+    counts = Counter()
+    tz = timezone.get_default_timezone()
+    for event_id, fields in events:
+        if not fields:  # 已被 MAXLEN 裁掉的事件
+            continue
+        fields = {_text(key): _text(value) for key, value in fields.items()}
+        milliseconds = int(_text(event_id).split('-')[0])
+        hour = datetime.fromtimestamp(milliseconds / 1000, tz).replace(minute=0, second=0, microsecond=0)
+        day = hour.replace(hour=0)
+        url_id, host, agent = int(fields['u']), fields.get('r', ''), fields.get('a', 'other')
+        clicks = int(fields.get('n', 1))
+        counts[(url_id, 'hour', hour, host, agent)] += clicks
+        counts[(url_id, 'day', day, host, agent)] += clicks
+    return counts
+
+
+# 將彙總結果寫入短網址所在的分片，回傳寫入的彙總筆數
+def apply_rollups(counts: Counter) -> int:
+    # 略過彙總前已被刪除的短網址；重新分片期間同時存在於兩個分片的短網址寫入目前的分片
+    url_ids = {key[0] for key in counts}
+    shard_of = {}
+    for shard in sharding.all_shards():
+        for url_id, short_string in Url.objects.using(shard).filter(id__in=url_ids).values_list('id', 'short_string'):
+            if url_id not in shard_of or sharding.shard_for(short_string) == shard:
+                shard_of[url_id] = shard
+    rows_by_shard = {}
+    for key, clicks in counts.items():
+        if key[0] in shard_of:
+            rows_by_shard.setdefault(shard_of[key[0]], []).append((*key, clicks))
+    for shard, rows in rows_by_shard.items():
+        upsert_rollups(shard, rows)
+    return sum(len(rows) for rows in rows_by_shard.values())
+
+
+# 以 INSERT ... ON CONFLICT DO UPDATE 將彙總結果累加進 ClickRollup（PostgreSQL 與 SQLite 皆支援此語法）
+# rows 為 (url_id, granularity, bucket, referrer_host, agent_class, clicks)
+def upsert_rollups(shard: str, rows: List[Tuple]) -> None:
+    connection = connections[shard]
+    table = connection.ops.quote_name(ClickRollup._meta.db_table)
+    with transaction.atomic(using=shard):
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+                batch = rows[start:start + UPSERT_BATCH_SIZE]
+                values = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(batch))
+                params = []
+                for url_id, granularity, bucket, host, agent, clicks in batch:
+                    params += [url_id, granularity, connection.ops.adapt_datetimefield_value(bucket), host, agent, clicks]
+                cursor.execute(
+                    f'INSERT INTO {table} (url_id, granularity, bucket, referrer_host, agent_class, clicks) '
+                    f'VALUES {values} '
+                    f'ON CONFLICT (url_id, granularity, bucket, referrer_host, agent_class) '
+                    f'DO UPDATE SET clicks = {table}.clicks + EXCLUDED.clicks',
+                    params,
+                )
+
+
+# 處理一批點擊事件，寫入資料庫成功後才確認（ACK），回傳處理的事件數
+def consume_once(client, consumer: str, count: int, block_ms: Optional[int], pending: bool = False) -> int:
+    events = read_events(client, consumer, count, block_ms, pending=pending)
+    if not events:
+        return 0
+    apply_rollups(aggregate(events))
+    client.xack(CLICK_STREAM_KEY, CLICK_GROUP, *[event_id for event_id, _ in events])
+    logger.debug(f'點擊事件寫入彙總資料: {len(events)} 筆')
+    return len(events)
@@ -0,0 +1,175 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, InterfaceError, OperationalError, connections
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+PRIMARY = 'default'                 # 主資料庫，所有寫入都在這裡
+REPLICA_PREFIX = 'replica_'         # settings.DATABASES 中副本的別名前綴
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'db_primary'        # 寫入後一段時間內讀取主資料庫的 cookie
+# 副本已重播完收到的所有 WAL 時延遲為 0；否則以最後重播的交易時間估算延遲
+REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+REPLICAS = [alias for alias in settings.DATABASES if alias.startswith(REPLICA_PREFIX)]
+
+# 目前的請求是否允許讀取副本，由 ReplicaRoutingMiddleware 設定；
+# 請求以外（管理指令、背景工作）預設讀取主資料庫
+_replica_reads: ContextVar[bool] = ContextVar('replica_reads', default=False)
+_health: Dict[str, Tuple[bool, float]] = {}     # 副本 -> (是否可用, 檢查時間)
+_health_lock = threading.Lock()
+
+
+def replica_reads_enabled() -> bool:
+    return bool(REPLICAS) and _replica_reads.get()
+
+
+# 請求是否可以讀取副本：唯讀請求，且最近沒有寫入（沒有 STICKY_COOKIE）
+def request_allows_replica(request) -> bool:
+    return request.method in SAFE_METHODS and STICKY_COOKIE not in request.COOKIES
+
+
+# 在區塊內允許（或禁止）讀取副本
+@contextmanager
+def replica_reads(allowed: bool = True):
+    token = _replica_reads.set(allowed)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+# 檢查副本是否可連線且延遲在 DB_REPLICA_MAX_LAG 以內
+def _check(alias: str) -> bool:
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(REPLICA_LAG_SQL)
+                lag = float(cursor.fetchone()[0] or 0)
+            else:
+                cursor.execute('SELECT 1')
+                lag = 0.0
+    except DatabaseError as e:
+        logger.error(f'資料庫副本 {alias} 無法連線，暫時改用主資料庫: {e}')
+        connection.close()
+        return False
+    if lag > settings.DB_REPLICA_MAX_LAG:
+        logger.warning(f'資料庫副本 {alias} 延遲 {lag:.1f} 秒，暫時改用主資料庫')
+        return False
+    return True
+
+
+# 回傳需要檢查的副本，每個副本每 DB_REPLICA_CHECK_INTERVAL 秒最多檢查一次
+def _due_replicas(now: float) -> List[str]:
+    due = []
+    with _health_lock:
+        for alias in REPLICAS:
+            state = _health.get(alias)
+            if state is None or now - state[1] >= settings.DB_REPLICA_CHECK_INTERVAL:
+                # 先更新檢查時間，避免其他執行緒同時檢查同一個副本
+                _health[alias] = (state[0] if state else False, now)
+                due.append(alias)
+    return due
+
+
+# 回傳目前可用的副本
+def healthy_replicas() -> List[str]:
+    now = time.monotonic()
+    for alias in _due_replicas(now):
+        _health[alias] = (_check(alias), now)
+    return [alias for alias in REPLICAS if _health[alias][0]]
+
+
+# 回傳目前可用的副本（asyncio 版本）：檢查需要同步的資料庫連線，
+# 與 asyncio 版本的 ORM 查詢相同，在 sync_to_async 的執行緒中檢查，不可在 event loop 中執行
+async def ahealthy_replicas() -> List[str]:
+    now = time.monotonic()
+    for alias in _due_replicas(now):
+        _health[alias] = (await sync_to_async(_check)(alias), now)
+    return [alias for alias in REPLICAS if _health[alias][0]]
+
+
+# 副本查詢失敗時呼叫，下次檢查前不再使用此副本
+def mark_unhealthy(alias: str) -> None:
+    _health[alias] = (False, time.monotonic())
+
+
+# 用於副本連線的 execute_wrappers，連線中斷等錯誤發生時立即停用該副本
+def replica_error_wrapper(execute, sql, params, many, context):
+    try:
+        return execute(sql, params, many, context)
+    except (OperationalError, InterfaceError) as e:
+        alias = context['connection'].alias
+        logger.error(f'資料庫副本 {alias} 查詢失敗，暫時改用主資料庫: {e}')
+        mark_unhealthy(alias)
+        raise
+
+
+# 選擇主資料庫的讀取來源：唯讀請求分散到可用的副本，交易中的讀取仍使用主資料庫
+def read_db() -> str:
+    if not replica_reads_enabled() or connections[PRIMARY].in_atomic_block:
+        return PRIMARY
+    replicas = healthy_replicas()
+    return random.choice(replicas) if replicas else PRIMARY
+
+
+# 選擇主資料庫的讀取來源（asyncio 版本）
+async def aread_db() -> str:
+    if not replica_reads_enabled() or connections[PRIMARY].in_atomic_block:
+        return PRIMARY
+    replicas = await ahealthy_replicas()
+    return random.choice(replicas) if replicas else PRIMARY
+
+
+# 寫入一律使用主資料庫，讀取依 read_db() 選擇；
+# 關聯物件與原物件讀取同一個資料庫（例如由主資料庫補查到的短網址，其使用者也由主資料庫讀取）
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return read_db()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    # 副本與主資料庫是同一份資料
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+# 取得查詢的第一筆資料；由副本查無資料時改查主資料庫（副本可能尚未同步剛建立的資料）
+def first_or_primary(queryset):
+    db = queryset.db
+    obj = queryset.using(db).first()
+    if obj is None and db in REPLICAS:
+        obj = queryset.using(PRIMARY).first()
+    return obj
+
+
+# 取得查詢的第一筆資料（asyncio 版本）
+async def afirst_or_primary(queryset):
+    db = queryset.db
+    obj = await queryset.using(db).afirst()
+    if obj is None and db in REPLICAS:
+        obj = await queryset.using(PRIMARY).afirst()
+    return obj
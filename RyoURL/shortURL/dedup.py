@@ -0,0 +1,52 @@
+import hashlib
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from django.utils import timezone
+
+from . import sharding
+from .models import Url
+
+# 常數設定
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+# 正規化原網址：協定與主機名稱轉小寫、移除預設埠號、空路徑補上 /
+def normalize_origin_url(origin_url) -> str:
+    parts = urlsplit(str(origin_url).strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if parts.port and DEFAULT_PORTS.get(scheme) != parts.port:
+        netloc = f'{netloc}:{parts.port}'
+    if parts.username:
+        userinfo = parts.username if parts.password is None else f'{parts.username}:{parts.password}'
+        netloc = f'{userinfo}@{netloc}'
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, parts.fragment))
+
+
+# 計算正規化後原網址的固定長度雜湊值（128 位元）
+def origin_hash(origin_url) -> str:
+    return hashlib.sha256(normalize_origin_url(origin_url).encode()).hexdigest()[:32]
+
+
+# 請求中沒有時區的過期時間視為目前的時區（與 Django 儲存時的處理相同），才能與資料庫中有時區的過期時間比較
+def aware_expire_date(expire_date):
+    if expire_date is not None and timezone.is_naive(expire_date):
+        return timezone.make_aware(expire_date)
+    return expire_date
+
+
+# 以 (user, origin_hash) 索引查詢同一使用者尚未過期、且過期時間與導向方式相同的既有短網址（分片時查詢所有分片）
+def find_existing_url(user, origin_url, expire_date=None, redirect_type=302) -> Optional[Url]:
+    expire_date = aware_expire_date(expire_date)
+    found = []
+    for urls in sharding.querysets():
+        urls = urls.filter(user=user, origin_hash=origin_hash(origin_url), redirect_type=redirect_type)
+        if expire_date is None:
+            urls = urls.filter(expire_date__isnull=True)
+        else:
+            urls = urls.filter(expire_date=expire_date, expire_date__gt=timezone.now())
+        url = urls.order_by('-id').first()
+        if url is not None:
+            found.append(url)
+    return max(found, key=lambda url: url.id, default=None)
@@ -0,0 +1,61 @@
+import logging
+import time
+from typing import Optional
+
+from django.utils import timezone
+
+from . import sharding, url_cache
+from .models import Url
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+
+# 以 expire_date 部分索引分批刪除過期的短網址（依序處理每個分片），回傳刪除的數量
+# rate 為每秒最多刪除的數量（0 代表不限制），max_batches 為最多執行的批次數
+def reap_expired_urls(batch_size: int, rate: float = 0, max_batches: Optional[int] = None) -> int:
+    now = timezone.now()
+    deleted = 0
+    batches = 0
+    for shard in sharding.all_shards():
+        if max_batches is not None and batches >= max_batches:
+            break
+        shard_deleted, shard_batches = _reap_shard(shard, now, batch_size, rate,
+                                                   None if max_batches is None else max_batches - batches)
+        deleted += shard_deleted
+        batches += shard_batches
+    return deleted
+
+
+# 計算所有分片目前過期但尚未刪除的短網址數量（使用 expire_date 部分索引）
+def count_expired_urls() -> int:
+    now = timezone.now()
+    return sum(
+        Url.objects.using(shard).filter(expire_date__isnull=False, expire_date__lt=now).count()
+        for shard in sharding.all_shards()
+    )
+
+
+# 分批刪除單一分片的過期短網址，回傳 (刪除的數量, 執行的批次數)
+def _reap_shard(shard: str, now, batch_size: int, rate: float, max_batches: Optional[int]):
+    deleted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        started = time.monotonic()
+        ids = list(
+            Url.objects.using(shard).filter(expire_date__isnull=False, expire_date__lt=now)
+            .order_by('expire_date')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        # 刪除時會透過 signal 清除查詢快取，在此合併為一次 Redis 呼叫
+        with url_cache.deferred_invalidation():
+            Url.objects.using(shard).filter(id__in=ids).delete()
+        deleted += len(ids)
+        batches += 1
+        logger.debug(f'已刪除 {len(ids)} 個過期短網址')
+
+        if rate > 0:
+            time.sleep(max(0.0, len(ids) / rate - (time.monotonic() - started)))
+    return deleted, batches
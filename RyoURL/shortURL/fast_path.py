@@ -0,0 +1,165 @@
+import io
+import logging
+import time
+from typing import List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler, ASGIRequest
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.handlers.wsgi import WSGIHandler, WSGIRequest, get_path_info
+from django.core.signals import request_finished, request_started
+from django.urls import get_resolver
+
+from . import db_router, metrics, views
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+REDIRECT_URL_NAME = 'redirectShortUrl'  # urls.py 中短網址導向的 URL 名稱
+FAST_METHODS = ('GET', 'HEAD')
+
+
+# 導向的路由，以及排在它之前的路由（例如 admin/、api/ 等），這些路由符合的請求不能走快速路徑；
+# 找不到導向的路由時回傳 None
+def _redirect_routes():
+    preceding = []
+    for pattern in get_resolver().url_patterns:
+        if getattr(pattern, 'name', None) == REDIRECT_URL_NAME:
+            return pattern.pattern, preceding
+        preceding.append(pattern.pattern)
+    return None
+
+
+def enabled() -> bool:
+    return settings.FAST_PATH_ENABLED and not settings.SECURE_SSL_REDIRECT
+
+
+# 依 urls.py 的順序判斷路徑是否由短網址導向處理，回傳短網址；其他路徑回傳 None
+class RedirectMatcher:
+    def __init__(self, route, preceding: List):
+        self.route = route
+        self.preceding = preceding
+
+    # 先以字串檢查排除大部分的請求（只有 /<一段>/ 可能是短網址），不需要建立 request
+    @staticmethod
+    def candidate(path: str) -> bool:
+        return len(path) > 2 and path[0] == '/' and path[-1] == '/' and path.count('/') == 2
+
+    def match(self, path_info: str) -> Optional[str]:
+        path = path_info[1:]
+        if any(pattern.match(path) for pattern in self.preceding):
+            return None
+        match = self.route.match(path)
+        if match is None or match[0]:
+            return None
+        return match[2]['short_string']
+
+
+def _matcher() -> Optional[RedirectMatcher]:
+    routes = _redirect_routes()
+    if routes is None:
+        logger.warning(f'找不到名稱為 {REDIRECT_URL_NAME} 的 URL，不啟用短網址導向的快速路徑')
+        return None
+    return RedirectMatcher(*routes)
+
+
+# WSGI 的快速路徑：短網址導向直接呼叫 view，仍會送出 request_started / request_finished
+# （連線池依此歸還連線）、記錄效能指標並依 ReplicaRoutingMiddleware 的規則讀取副本
+class WSGIFastPath:
+    def __init__(self, application):
+        self.application = application
+        self.matcher = _matcher()
+        self.route = str(self.matcher.route) if self.matcher else None
+        self.view = convert_exception_to_response(lambda request: views.redirectShortUrl(request, request.short_string))
+
+    def __call__(self, environ, start_response):
+        if (
+            self.matcher is None
+            or environ.get('REQUEST_METHOD') not in FAST_METHODS
+            or not RedirectMatcher.candidate(environ.get('PATH_INFO', ''))
+        ):
+            return self.application(environ, start_response)
+        short_string = self.matcher.match(get_path_info(environ))
+        if short_string is None:
+            return self.application(environ, start_response)
+        started = time.perf_counter_ns()
+        request_started.send(sender=WSGIHandler, environ=environ)
+        request = WSGIRequest(environ)
+        request.short_string = short_string
+        with db_router.replica_reads(db_router.request_allows_replica(request)):
+            response = self.view(request)
+        # 回應由伺服器 close() 時送出 request_finished
+        response._handler_class = WSGIHandler
+        status = f'{response.status_code} {response.reason_phrase}'
+        headers = [
+            *response.items(),
+            *(('Set-Cookie', cookie.output(header='')) for cookie in response.cookies.values()),
+        ]
+        start_response(status, headers)
+        if settings.METRICS_ENABLED:
+            metrics.observe_route(self.route, request.method, response.status_code, time.perf_counter_ns() - started)
+        return response
+
+
+# ASGI 的快速路徑：短網址導向直接 await async view；ORM 連線位於 sync_to_async 的執行緒，
+# 因此與 ASGIHandler 相同在該執行緒送出 request_started，回應送出後送出 request_finished 歸還連線（不在請求的延遲內）
+class ASGIFastPath:
+    def __init__(self, application):
+        self.application = application
+        self.matcher = _matcher()
+        self.route = str(self.matcher.route) if self.matcher else None
+        self.view = convert_exception_to_response(self._redirect)
+
+    @staticmethod
+    async def _redirect(request):
+        return await views.aredirectShortUrl(request, request.short_string)
+
+    # ASGI 的 path 包含 root_path，與 ASGIRequest 相同的方式取得 path_info
+    @staticmethod
+    def _path_info(scope) -> str:
+        path, root_path = scope['path'], scope.get('root_path', '')
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        return path
+
+    # 導向與錯誤訊息的回應都很小，以一個 body 訊息送出
+    @staticmethod
+    async def _send_response(response, send) -> None:
+        headers = [(name.encode('ascii'), value.encode('latin1')) for name, value in response.items()]
+        headers.extend(
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip()) for cookie in response.cookies.values()
+        )
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': response.content})
+
+    async def __call__(self, scope, receive, send):
+        if self.matcher is None or scope['type'] != 'http' or scope.get('method') not in FAST_METHODS:
+            return await self.application(scope, receive, send)
+        path_info = self._path_info(scope)
+        short_string = self.matcher.match(path_info) if RedirectMatcher.candidate(path_info) else None
+        if short_string is None:
+            return await self.application(scope, receive, send)
+        started = time.perf_counter_ns()
+        await sync_to_async(request_started.send, thread_sensitive=True)(sender=ASGIHandler, scope=scope)
+        try:
+            request = ASGIRequest(scope, io.BytesIO())
+            request.short_string = short_string
+            with db_router.replica_reads(db_router.request_allows_replica(request)):
+                response = await self.view(request)
+            await self._send_response(response, send)
+            if settings.METRICS_ENABLED:
+                metrics.observe_route(self.route, request.method, response.status_code, time.perf_counter_ns() - started)
+        finally:
+            # 送出回應失敗（例如客戶端中斷連線）時仍要歸還連線
+            await sync_to_async(request_finished.send, thread_sensitive=True)(sender=ASGIHandler)
+
+
+# 在 wsgi.py / asgi.py 包裝 Django 的 application；未啟用時回傳原本的 application
+def wrap_wsgi(application):
+    return WSGIFastPath(application) if enabled() else application
+
+
+def wrap_asgi(application):
+    return ASGIFastPath(application) if enabled() else application
@@ -0,0 +1,161 @@
+import heapq
+import json
+import logging
+import threading
+import time
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis import RedisError
+
+from . import metrics, url_cache
+from .redis_client import get_async_redis
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+SNAPSHOT_KEY = 'hot_key_snapshots'      # Redis hash：行程 -> 該行程上一個區間的熱門短網址
+SNAPSHOT_STALE_FACTOR = 3               # 超過 3 個區間未更新的行程視為已結束
+
+
+# 以 Space-Saving 演算法追蹤出現次數最多的項目，只使用固定大小的記憶體；
+# 新項目以被剔除項目的最大次數為起點，因此次數可能高估，但真正的熱門項目一定會被保留
+class HeavyHitters:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._counts: Dict[str, int] = {}
+        self._floor = 0
+        self._lock = threading.Lock()
+
+    def add(self, key: str) -> None:
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts[key] = count + 1
+                return
+            self._counts[key] = self._floor + 1
+            # 累積到兩倍容量才一次剔除，攤提後每次新增只需 O(log k)
+            if len(self._counts) >= 2 * self.capacity:
+                self._prune()
+
+    def _prune(self) -> None:
+        kept = dict(heapq.nlargest(self.capacity, self._counts.items(), key=itemgetter(1)))
+        evicted = [count for key, count in self._counts.items() if key not in kept]
+        if evicted:
+            self._floor = max(self._floor, max(evicted))
+        self._counts = kept
+
+    def top(self, n: int) -> List[Tuple[str, int]]:
+        with self._lock:
+            return heapq.nlargest(n, self._counts.items(), key=itemgetter(1))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = {}
+            self._floor = 0
+
+
+tracker = HeavyHitters(settings.HOT_KEY_CAPACITY)
+_window_started = time.monotonic()
+_window_lock = threading.Lock()
+
+
+# 結束目前的統計區間，回傳需要固定的熱門短網址；尚未到期或其他執行緒正在處理時回傳 None
+def _close_window() -> Optional[List[Tuple[str, float]]]:
+    global _window_started
+    if not _window_lock.acquire(blocking=False):
+        return None
+    try:
+        now = time.monotonic()
+        elapsed = now - _window_started
+        if elapsed < settings.HOT_KEY_REFRESH_INTERVAL:
+            return None
+        _window_started = now
+        hot = [(code, count / elapsed) for code, count in tracker.top(settings.HOT_KEY_PIN_SIZE)
+               if count / elapsed >= settings.HOT_KEY_MIN_RATE]
+        tracker.reset()
+        return hot
+    finally:
+        _window_lock.release()
+
+
+def _snapshot(hot: List[Tuple[str, float]]) -> str:
+    return json.dumps({'time': time.time(), 'keys': [[code, round(rate, 3)] for code, rate in hot]})
+
+
+# 替換固定的熱門短網址；行程閒置而沒有更新時，固定的資料在兩個區間後失效
+def _pin(urls) -> None:
+    url_cache.replace_pins(urls, settings.HOT_KEY_REFRESH_INTERVAL * 2)
+    metrics.hot_keys_pinned.set(len(urls))
+
+
+def _is_due() -> bool:
+    return time.monotonic() - _window_started >= settings.HOT_KEY_REFRESH_INTERVAL
+
+
+# 區間結束時以 Redis 中最新的快取資料替換固定的熱門短網址（Redis 中已沒有快取，例如已刪除的短網址不再固定），
+# 並將本行程的熱門短網址寫入 Redis
+def refresh() -> None:
+    hot = _close_window()
+    if hot is None:
+        return
+    client = get_redis_connection('default')
+    try:
+        _pin(url_cache.fetch_cached([code for code, _ in hot], client))
+        client.hset(SNAPSHOT_KEY, metrics.process_id(), _snapshot(hot))
+    except RedisError as e:
+        logger.error(f'更新熱門短網址失敗: {e}')
+        _pin({})
+
+
+# 區間結束時更新固定的熱門短網址（asyncio 版本）
+async def arefresh() -> None:
+    hot = _close_window()
+    if hot is None:
+        return
+    client = get_async_redis()
+    try:
+        _pin(await url_cache.afetch_cached([code for code, _ in hot], client))
+        await client.hset(SNAPSHOT_KEY, metrics.process_id(), _snapshot(hot))
+    except RedisError as e:
+        logger.error(f'更新熱門短網址失敗: {e}')
+        _pin({})
+
+
+# 記錄一次導向，由導向的 view 呼叫
+def record(short_string: str) -> None:
+    tracker.add(short_string)
+    if _is_due():
+        refresh()
+
+
+# 記錄一次導向（asyncio 版本）
+async def arecord(short_string: str) -> None:
+    tracker.add(short_string)
+    if _is_due():
+        await arefresh()
+
+
+# 合併所有行程上一個區間的熱門短網址，回傳 (短網址, 每秒次數, 行程數)，依每秒次數排序
+def current_hot_keys() -> List[Tuple[str, float, int]]:
+    client = get_redis_connection('default')
+    entries = client.hgetall(SNAPSHOT_KEY)
+    oldest = time.time() - settings.HOT_KEY_REFRESH_INTERVAL * SNAPSHOT_STALE_FACTOR
+    rates: Dict[str, float] = {}
+    processes: Dict[str, int] = {}
+    stale = []
+    for name, raw in entries.items():
+        data = json.loads(raw)
+        if data['time'] < oldest:
+            stale.append(name)
+            continue
+        for code, rate in data['keys']:
+            rates[code] = rates.get(code, 0.0) + rate
+            processes[code] = processes.get(code, 0) + 1
+    if stale:
+        client.hdel(SNAPSHOT_KEY, *stale)
+    return sorted(((code, round(rate, 3), processes[code]) for code, rate in rates.items()),
+                  key=itemgetter(1), reverse=True)
@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Tuple
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis import RedisError
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+CHANNEL = 'cache_invalidation'      # Redis pub/sub 頻道，訊息為 {種類: [鍵, ...]}
+PING_INTERVAL = 5.0                 # 訂閱連線閒置幾秒後送出 PING 確認連線
+PING_TIMEOUT = 15.0                 # 超過幾秒沒有收到任何訊息（包含 PONG）視為連線中斷
+RECONNECT_INTERVAL = 1.0            # 連線中斷後幾秒重新訂閱
+
+# 種類 -> (清除行程內指定的鍵, 清除行程內所有資料)，由各快取模組註冊
+_handlers: Dict[str, Tuple[Callable[[list], None], Callable[[], None]]] = {}
+_thread = None
+_start_lock = threading.Lock()
+
+
+# 註冊行程內快取的清除函式
+def register(kind: str, evict: Callable[[list], None], flush: Callable[[], None]) -> None:
+    _handlers[kind] = (evict, flush)
+
+
+# 將失效通知加入 pipeline，與清除 Redis 快取的指令一起送出；所有行程（包含自己）都會收到
+def queue_publish(pipe, kind: str, keys: Iterable) -> None:
+    if settings.CACHE_INVALIDATION_BUS_ENABLED:
+        pipe.publish(CHANNEL, json.dumps({kind: list(keys)}))
+
+
+def _dispatch(data) -> None:
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        logger.error(f'無法解析快取失效通知: {data!r}')
+        return
+    for kind, keys in payload.items():
+        handler = _handlers.get(kind)
+        if handler is not None:
+            handler[0](keys)
+
+
+# 訂閱前或連線中斷期間可能錯過通知，清除所有行程內快取
+def _flush_all() -> None:
+    for _, flush in _handlers.values():
+        flush()
+
+
+# 訂閱失效通知直到連線中斷；訂閱成功時先清除行程內快取，閒置時以 PING 偵測無回應的連線
+def _listen() -> None:
+    pubsub = get_redis_connection('default').pubsub()
+    try:
+        pubsub.subscribe(CHANNEL)
+        last_seen = time.monotonic()
+        while True:
+            message = pubsub.get_message(timeout=PING_INTERVAL)
+            now = time.monotonic()
+            if message is None:
+                if now - last_seen > PING_TIMEOUT:
+                    raise RedisError('快取失效通知的訂閱連線沒有回應')
+                pubsub.ping()
+                continue
+            last_seen = now
+            if message['type'] == 'subscribe':
+                _flush_all()
+            elif message['type'] == 'message':
+                _dispatch(message['data'])
+    finally:
+        pubsub.close()
+
+
+def _run() -> None:
+    while True:
+        try:
+            _listen()
+        except Exception as e:
+            logger.error(f'快取失效通知的訂閱中斷，{RECONNECT_INTERVAL} 秒後重新訂閱並清除行程內快取: {e}')
+        time.sleep(RECONNECT_INTERVAL)
+
+
+# 在本行程第一次寫入行程內快取時啟動訂閱執行緒（fork 後的子行程會重新啟動）
+def ensure_started() -> None:
+    global _thread
+    if _thread is not None or not settings.CACHE_INVALIDATION_BUS_ENABLED:
+        return
+    with _start_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name='cache-invalidation', daemon=True)
+            _thread.start()
+
+
+# fork 不會複製執行緒，子行程需要重新訂閱
+def _forget_thread() -> None:
+    global _thread, _start_lock
+    _thread = None
+    _start_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_thread)
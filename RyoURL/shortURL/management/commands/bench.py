@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...bench import DEFAULT_MIX, dump_results, parse_mix, run_mix
+
+
+class Command(BaseCommand):
+    help = '以 Django test client 重播 Zipf 分佈的導向、查詢原網址、建立與列表請求，輸出每種請求的效能（JSON）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--urls', type=int, default=10000, help='測試用的短網址數量')
+        parser.add_argument('--requests', type=int, default=10000, help='總請求數')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'各類請求的比例，預設 {DEFAULT_MIX}')
+        parser.add_argument('--zipf', type=float, default=1.1, help='短網址熱門程度的 Zipf 參數，0 代表平均分佈')
+        parser.add_argument('--list-limit', type=int, default=100, help='列表請求每頁的數量')
+        parser.add_argument('--seed', type=int, default=None, help='亂數種子，固定後可重現相同的請求序列')
+        parser.add_argument('--warmup', type=int, default=0, help='正式計時前先執行的請求數')
+        parser.add_argument('--output', default=None, help='輸出 JSON 的檔案路徑，預設輸出到 stdout')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        results = run_mix(
+            options['urls'], options['requests'], mix, zipf=options['zipf'], list_limit=options['list_limit'],
+            seed=options['seed'], warmup=options['warmup'],
+        )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                dump_results(results, stream)
+        else:
+            dump_results(results, sys.stdout)
@@ -0,0 +1,63 @@
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import connection, connections
+
+from ... import metrics
+from ...bench import LatencyRecorder, delete_seeded_urls, dump_results, seed_urls
+from ...models import Url
+
+# 常數設定
+SEED_PREFIX = '~p'
+
+
+class Command(BaseCommand):
+    help = '比較每個請求重新連線與使用連線池時，快取未命中的短網址查詢延遲（輸出 JSON）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--urls', type=int, default=1000, help='測試用的短網址數量')
+        parser.add_argument('--requests', type=int, default=2000, help='每種模式的請求數')
+        parser.add_argument('--concurrency', type=int, default=8, help='同時進行請求的執行緒數')
+
+    def handle(self, *args, **options):
+        pool_options = connections.settings['default'].get('POOL')
+        if not pool_options or connection.vendor != 'postgresql':
+            raise CommandError('需要 PostgreSQL 並設定 DB_POOL_ENABLED=True')
+
+        codes = seed_urls(options['urls'], prefix=SEED_PREFIX)
+        connection.close()
+        results = []
+        try:
+            # 兩種模式使用相同的後端，只切換 settings_dict 的 POOL，差異只有是否重新連線
+            for name, pool in (('direct', None), ('pooled', pool_options)):
+                connections.settings['default']['POOL'] = pool
+                opened = metrics.db_connections_opened.get('default')
+                recorder = LatencyRecorder(name)
+                with recorder:
+                    self.run(codes, options['requests'], options['concurrency'], recorder)
+                # 不使用連線池時每個請求都會建立一條新連線
+                opened = metrics.db_connections_opened.get('default') - opened if pool else options['requests']
+                results.append(recorder.summary(concurrency=options['concurrency'], connections_opened=opened))
+        finally:
+            connections.settings['default']['POOL'] = pool_options
+            delete_seeded_urls(prefix=SEED_PREFIX)
+        dump_results(results, sys.stdout)
+
+    # 模擬快取未命中的導向：請求開始、以短網址查詢一次資料庫、請求結束（Django 在此關閉或歸還連線）
+    def run(self, codes, requests, concurrency, recorder):
+        def worker(chunk):
+            for code in chunk:
+                started = time.perf_counter()
+                request_started.send(sender=self.__class__)
+                try:
+                    Url.objects.filter(short_string=code).values_list('id', 'origin_url', 'expire_date', 'redirect_type').first()
+                finally:
+                    request_finished.send(sender=self.__class__)
+                recorder.record(time.perf_counter() - started)
+
+        paths = [codes[i % len(codes)] for i in range(requests)]
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(worker, [paths[i::concurrency] for i in range(concurrency)]))
@@ -0,0 +1,121 @@
+import asyncio
+import io
+import random
+import sys
+import time
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import url_cache
+from ...bench import LatencyRecorder, delete_seeded_urls, dump_results, seed_urls, simulated_ip
+from ...fast_path import ASGIFastPath, WSGIFastPath
+
+# 常數設定
+SEED_PREFIX = '~f'
+HOST = 'localhost'
+WARMUP_REQUESTS = 200
+
+
+class Command(BaseCommand):
+    help = '比較短網址導向經過完整 Django（middleware、URL 解析）與快速路徑的每個請求耗時（輸出 JSON）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'], required=True,
+                            help='wsgi 需以 ASYNC_VIEWS=False 執行，asgi 需以 ASYNC_VIEWS=True 執行')
+        parser.add_argument('--urls', type=int, default=1000, help='測試用的短網址數量')
+        parser.add_argument('--requests', type=int, default=10000, help='每種方式的請求數')
+
+    def handle(self, *args, **options):
+        if (options['mode'] == 'asgi') != settings.ASYNC_VIEWS:
+            raise CommandError('--mode asgi 需搭配 ASYNC_VIEWS=True，--mode wsgi 需搭配 ASYNC_VIEWS=False')
+
+        codes = seed_urls(options['urls'], prefix=SEED_PREFIX)
+        paths = [(f'/{random.choice(codes)}/', simulated_ip(i)) for i in range(options['requests'])]
+        mode = options['mode']
+        try:
+            if mode == 'wsgi':
+                django_app = WSGIHandler()
+                apps = [('django', django_app), ('fast_path', WSGIFastPath(django_app))]
+                recorders = [self.run_wsgi(f'{mode}_{name}', app, paths) for name, app in apps]
+            else:
+                django_app = ASGIHandler()
+                apps = [('django', django_app), ('fast_path', ASGIFastPath(django_app))]
+                recorders = [asyncio.run(self.run_asgi(f'{mode}_{name}', app, paths)) for name, app in apps]
+        finally:
+            delete_seeded_urls(prefix=SEED_PREFIX)
+            url_cache.invalidate(codes)
+
+        # 兩種方式查詢快取與記錄點擊的工作相同，平均耗時的差即為 middleware 與 URL 解析的成本
+        full, fast = (recorder.summary(urls=options['urls']) for recorder in recorders)
+        mean_ms = [sum(recorder.samples) / len(recorder.samples) * 1000 for recorder in recorders]
+        fast['saved_mean_ms'] = round(mean_ms[0] - mean_ms[1], 4)
+        fast['saved_p50_ms'] = round(full['p50_ms'] - fast['p50_ms'], 4)
+        dump_results([full, fast], sys.stdout)
+
+    @staticmethod
+    def _environ(path: str, ip: str) -> dict:
+        return {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'SCRIPT_NAME': '',
+            'QUERY_STRING': '',
+            'SERVER_NAME': HOST,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': HOST,
+            'REMOTE_ADDR': ip,
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.url_scheme': 'http',
+        }
+
+    # WSGI：與伺服器相同，讀完回應後呼叫 close()（送出 request_finished）
+    def run_wsgi(self, name, app, paths) -> LatencyRecorder:
+        def start_response(status, headers):
+            pass
+
+        def request(path, ip):
+            response = app(self._environ(path, ip), start_response)
+            b''.join(response)
+            response.close()
+
+        for path, ip in paths[:WARMUP_REQUESTS]:
+            request(path, ip)
+        recorder = LatencyRecorder(name)
+        with recorder:
+            for path, ip in paths:
+                recorder.time(request, path, ip)
+        return recorder
+
+    # ASGI：依序送出請求；請求本文讀完後 receive 不再回傳訊息（與連線未中斷時相同）
+    async def run_asgi(self, name, app, paths) -> LatencyRecorder:
+        async def request(path, ip):
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await asyncio.Event().wait()
+
+            async def send(message):
+                pass
+
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'root_path': '', 'query_string': b'',
+                'headers': [(b'host', HOST.encode())], 'client': (ip, 0), 'server': (HOST, 80),
+            }
+            await app(scope, receive, send)
+
+        for path, ip in paths[:WARMUP_REQUESTS]:
+            await request(path, ip)
+        recorder = LatencyRecorder(name)
+        with recorder:
+            for path, ip in paths:
+                started = time.perf_counter()
+                await request(path, ip)
+                recorder.record(time.perf_counter() - started)
+        return recorder
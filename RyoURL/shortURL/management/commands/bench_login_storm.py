@@ -0,0 +1,151 @@
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from ... import password_hashing, url_cache
+from ...bench import LatencyRecorder, delete_seeded_urls, dump_results, seed_urls, simulated_ip
+from ...models import User
+
+# 常數設定
+SEED_PREFIX = '~l'
+USERNAME_PREFIX = '~login'
+PASSWORD = 'bench-password'
+HOST = 'localhost'
+LOGIN_PATH = '/api/auth/login'
+PHASES = (
+    ('baseline', None),     # 沒有登入請求
+    ('inline', 0),          # 登入時在請求中直接計算雜湊
+    ('pool', None),         # 登入時在行程池中計算雜湊（PASSWORD_HASH_WORKERS）
+)
+
+
+class Command(BaseCommand):
+    help = '比較大量登入請求同時進行時，密碼雜湊在請求中計算與在行程池中計算對短網址導向延遲的影響（輸出 JSON）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'], required=True,
+                            help='wsgi 需以 ASYNC_VIEWS=False 執行，asgi 需以 ASYNC_VIEWS=True 執行')
+        parser.add_argument('--urls', type=int, default=1000, help='測試用的短網址數量')
+        parser.add_argument('--requests', type=int, default=5000, help='每個階段的導向請求數')
+        parser.add_argument('--concurrency', type=int, default=20, help='同時進行的導向請求數')
+        parser.add_argument('--logins', type=int, default=20, help='同時進行的登入請求數')
+        parser.add_argument('--users', type=int, default=100, help='測試用的使用者數量')
+
+    def handle(self, *args, **options):
+        if (options['mode'] == 'asgi') != settings.ASYNC_VIEWS:
+            raise CommandError('--mode asgi 需搭配 ASYNC_VIEWS=True，--mode wsgi 需搭配 ASYNC_VIEWS=False')
+        if settings.PASSWORD_HASH_WORKERS <= 0:
+            raise CommandError('pool 階段需要 PASSWORD_HASH_WORKERS 大於 0')
+
+        # 所有測試使用者使用相同的密碼，雜湊只需計算一次
+        encoded = make_password(PASSWORD)
+        usernames = [f'{USERNAME_PREFIX}{i}' for i in range(options['users'])]
+        User.objects.bulk_create([User(username=name, password=encoded) for name in usernames], ignore_conflicts=True)
+        password_hashing.hash_password(PASSWORD)     # 先啟動行程池，子行程的啟動時間不計入
+        codes = seed_urls(options['urls'], prefix=SEED_PREFIX)
+        paths = [(f'/{random.choice(codes)}/', simulated_ip(i)) for i in range(options['requests'])]
+        results = []
+        try:
+            for phase, workers in PHASES:
+                logins = options['logins'] if phase != 'baseline' else 0
+                overrides = {} if workers is None else {'PASSWORD_HASH_WORKERS': workers}
+                with override_settings(**overrides):
+                    if options['mode'] == 'wsgi':
+                        redirects, login_recorder = self.run_wsgi(paths, options['concurrency'], usernames, logins)
+                    else:
+                        redirects, login_recorder = asyncio.run(
+                            self.run_asgi(paths, options['concurrency'], usernames, logins)
+                        )
+                results.append(redirects.summary(
+                    phase=phase, concurrency=options['concurrency'], logins=logins,
+                    hash_workers=settings.PASSWORD_HASH_WORKERS if workers is None else workers,
+                ))
+                if logins:
+                    results.append(login_recorder.summary(phase=phase, failed=login_recorder.failed))
+        finally:
+            delete_seeded_urls(prefix=SEED_PREFIX)
+            url_cache.invalidate(codes)
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+        # 登入期間導向 p99 增加的幅度
+        baseline_p99 = results[0]['p99_ms']
+        for result in results:
+            if result['name'].startswith('redirect') and baseline_p99 is not None:
+                result['p99_increase_ms'] = round(result['p99_ms'] - baseline_p99, 4)
+        dump_results(results, sys.stdout)
+
+    @staticmethod
+    def _recorders(mode: str):
+        login_recorder = LatencyRecorder(f'login_{mode}')
+        login_recorder.failed = 0       # 非 200 的回應數（例如等待中的雜湊超過上限回傳的 503）
+        return LatencyRecorder(f'redirect_{mode}'), login_recorder
+
+    # WSGI：以執行緒模擬 worker 執行緒，登入的執行緒持續送出請求直到導向請求全部完成
+    def run_wsgi(self, paths, concurrency, usernames, logins):
+        redirects, login_recorder = self._recorders('wsgi')
+        done = threading.Event()
+
+        def redirect_worker(chunk):
+            client = Client(HTTP_HOST=HOST)
+            for path, ip in chunk:
+                started = time.perf_counter()
+                client.get(path, REMOTE_ADDR=ip)
+                redirects.record(time.perf_counter() - started)
+
+        def login_worker(i):
+            client = Client(HTTP_HOST=HOST)
+            while not done.is_set():
+                body = json.dumps({'username': random.choice(usernames), 'password': PASSWORD})
+                started = time.perf_counter()
+                response = client.post(LOGIN_PATH, body, content_type='application/json', REMOTE_ADDR=simulated_ip(i))
+                login_recorder.record(time.perf_counter() - started)
+                if response.status_code != 200:
+                    login_recorder.failed += 1
+
+        with ThreadPoolExecutor(max_workers=concurrency + logins) as executor:
+            storm = [executor.submit(login_worker, i) for i in range(logins)]
+            with redirects, login_recorder:
+                list(executor.map(redirect_worker, [paths[i::concurrency] for i in range(concurrency)]))
+            done.set()
+            for future in storm:
+                future.result()
+        return redirects, login_recorder
+
+    # ASGI：導向與登入在同一個 event loop 上同時執行
+    async def run_asgi(self, paths, concurrency, usernames, logins):
+        redirects, login_recorder = self._recorders('asgi')
+        done = asyncio.Event()
+
+        async def redirect_worker(chunk):
+            client = AsyncClient(HTTP_HOST=HOST)
+            for path, ip in chunk:
+                started = time.perf_counter()
+                await client.get(path, client=(ip, 0))
+                redirects.record(time.perf_counter() - started)
+
+        async def login_worker(i):
+            client = AsyncClient(HTTP_HOST=HOST)
+            while not done.is_set():
+                body = json.dumps({'username': random.choice(usernames), 'password': PASSWORD})
+                started = time.perf_counter()
+                response = await client.post(LOGIN_PATH, body, content_type='application/json', client=(simulated_ip(i), 0))
+                login_recorder.record(time.perf_counter() - started)
+                if response.status_code != 200:
+                    login_recorder.failed += 1
+
+        storm = [asyncio.create_task(login_worker(i)) for i in range(logins)]
+        with redirects, login_recorder:
+            await asyncio.gather(*(redirect_worker(paths[i::concurrency]) for i in range(concurrency)))
+        done.set()
+        await asyncio.gather(*storm)
+        return redirects, login_recorder
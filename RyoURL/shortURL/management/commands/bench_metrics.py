@@ -0,0 +1,67 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
+
+from ... import metrics
+from ...bench import dump_results
+from ...middleware import MetricsMiddleware
+
+
+# 執行 iterations 次並回傳每次平均的奈秒數
+def per_call_ns(func, iterations: int) -> float:
+    started = time.perf_counter_ns()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter_ns() - started) / iterations
+
+
+class Command(BaseCommand):
+    help = '測量效能指標對每個請求、SQL 查詢與 Redis 指令增加的額外時間（輸出 JSON）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200000, help='每項測試的執行次數')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        request = RequestFactory().get('/abc123/', HTTP_HOST='localhost')
+        request.resolver_match = resolve('/abc123/')
+        response = HttpResponse(status=302)
+
+        def view(request):
+            return response
+
+        def execute(sql, params, many, context):
+            return None
+
+        context = {'connection': type('Connection', (), {'alias': 'default'})()}
+        middleware = MetricsMiddleware(view)
+
+        def redis_command():
+            started = time.perf_counter_ns()
+            metrics.redis_command_duration.observe((time.perf_counter_ns() - started) / 1e9, 'command')
+
+        # 不將測試產生的指標寫入 Redis
+        with override_settings(METRICS_PUSH_INTERVAL=0):
+            cases = [
+                ('request', lambda: view(request), lambda: middleware(request)),
+                ('sql_query', lambda: execute('SELECT 1', None, False, context),
+                 lambda: metrics.sql_wrapper(execute, 'SELECT 1', None, False, context)),
+                ('redis_command', lambda: None, redis_command),
+                ('cache_lookup', lambda: None, lambda: metrics.cache_lookups.inc('url', 'local')),
+            ]
+            results = []
+            for name, baseline, instrumented in cases:
+                baseline_ns = per_call_ns(baseline, iterations)
+                instrumented_ns = per_call_ns(instrumented, iterations)
+                results.append({
+                    'name': name,
+                    'iterations': iterations,
+                    'baseline_ns': round(baseline_ns, 1),
+                    'instrumented_ns': round(instrumented_ns, 1),
+                    'overhead_ns': round(instrumented_ns - baseline_ns, 1),
+                })
+        dump_results(results, sys.stdout)
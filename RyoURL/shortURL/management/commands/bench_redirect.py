@@ -0,0 +1,68 @@
+import asyncio
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+
+from ... import url_cache
+from ...bench import LatencyRecorder, delete_seeded_urls, dump_results, seed_urls, simulated_ip
+
+# 常數設定
+SEED_PREFIX = '~r'
+HOST = 'localhost'
+
+
+class Command(BaseCommand):
+    help = '比較 WSGI（同步 view）與 ASGI（async view）下短網址導向的效能（輸出 JSON）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'], required=True,
+                            help='wsgi 需以 ASYNC_VIEWS=False 執行，asgi 需以 ASYNC_VIEWS=True 執行')
+        parser.add_argument('--urls', type=int, default=1000, help='測試用的短網址數量')
+        parser.add_argument('--requests', type=int, default=10000, help='總請求數')
+        parser.add_argument('--concurrency', type=int, default=50, help='同時進行的請求數')
+
+    def handle(self, *args, **options):
+        if (options['mode'] == 'asgi') != settings.ASYNC_VIEWS:
+            raise CommandError('--mode asgi 需搭配 ASYNC_VIEWS=True，--mode wsgi 需搭配 ASYNC_VIEWS=False')
+
+        codes = seed_urls(options['urls'], prefix=SEED_PREFIX)
+        paths = [(f'/{random.choice(codes)}/', simulated_ip(i)) for i in range(options['requests'])]
+        recorder = LatencyRecorder(f'redirect_{options["mode"]}')
+        try:
+            with recorder:
+                if options['mode'] == 'wsgi':
+                    self.run_wsgi(paths, options['concurrency'], recorder)
+                else:
+                    asyncio.run(self.run_asgi(paths, options['concurrency'], recorder))
+        finally:
+            delete_seeded_urls(prefix=SEED_PREFIX)
+            url_cache.invalidate(codes)
+        dump_results([recorder.summary(concurrency=options['concurrency'], urls=options['urls'])], sys.stdout)
+
+    # WSGI：以執行緒模擬多個 worker 執行緒
+    def run_wsgi(self, paths, concurrency, recorder):
+        def worker(chunk):
+            client = Client(HTTP_HOST=HOST)
+            for path, ip in chunk:
+                started = time.perf_counter()
+                client.get(path, REMOTE_ADDR=ip)
+                recorder.record(time.perf_counter() - started)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(worker, [paths[i::concurrency] for i in range(concurrency)]))
+
+    # ASGI：在單一 event loop 上同時執行多個請求
+    async def run_asgi(self, paths, concurrency, recorder):
+        async def worker(chunk):
+            client = AsyncClient(HTTP_HOST=HOST)
+            for path, ip in chunk:
+                started = time.perf_counter()
+                await client.get(path, client=(ip, 0))     # ASGI 的用戶端 IP 來自 scope['client']
+                recorder.record(time.perf_counter() - started)
+
+        await asyncio.gather(*(worker(paths[i::concurrency]) for i in range(concurrency)))
@@ -0,0 +1,71 @@
+import random
+import string
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...apis.short_url_basic_api import create_url_entry, generate_short_url
+from ...bench import LatencyRecorder, delete_seeded_urls, dump_results, seed_urls
+from ...models import ShortCodeSequence, Url, User
+from ...short_code import ShortCodeAllocator
+
+# 常數設定
+BENCH_SEQUENCE_NAME = 'bench_short_code'    # 測試分配速度使用的序號，不消耗正式短網址的序號，測試後刪除
+
+
+# 舊版的隨機產生加上 exists 查詢，作為比較基準
+def legacy_generate_short_url(length=6):
+    char = string.ascii_letters + string.digits
+    while True:
+        short_string = ''.join(random.choices(char, k=length))
+        if not Url.objects.filter(short_string=short_string).exists():
+            return short_string
+
+
+class Command(BaseCommand):
+    help = '測試短網址分配器在大量既有資料下的建立效能（輸出 JSON）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=0, help='測試前資料表至少要有的短網址數量，例如 10000000')
+        parser.add_argument('--creates', type=int, default=5000, help='每種方式建立的短網址數量')
+        parser.add_argument('--keep', action='store_true', help='測試後保留產生的資料')
+
+    def handle(self, *args, **options):
+        missing = options['rows'] - Url.objects.count()
+        if missing > 0:
+            self.stderr.write(f'產生 {missing} 筆測試資料...')
+            seed_urls(missing)
+        user, _ = User.objects.get_or_create(username='anonymous', defaults={'user_type': 0})
+        created_ids = []
+        results = []
+
+        # 純 CPU 的短網址產生速度
+        allocator = ShortCodeAllocator(block_size=options['creates'], name=BENCH_SEQUENCE_NAME)
+        try:
+            allocator.next_code()
+            recorder = LatencyRecorder('allocate_code')
+            with recorder:
+                for _ in range(options['creates']):
+                    recorder.time(allocator.next_code)
+            results.append(recorder.summary())
+        finally:
+            ShortCodeSequence.objects.filter(name=BENCH_SEQUENCE_NAME).delete()
+
+        for name, generate in (('create_allocated', generate_short_url),
+                               ('create_random_exists', legacy_generate_short_url)):
+            recorder = LatencyRecorder(name)
+            with recorder:
+                for i in range(options['creates']):
+                    url = recorder.time(self.create, generate, user, i)
+                    created_ids.append(url.id)
+            results.append(recorder.summary(existing_rows=Url.objects.count()))
+
+        if not options['keep']:
+            delete_seeded_urls(ids=created_ids)
+        dump_results(results, sys.stdout)
+
+    def create(self, generate, user, i):
+        with transaction.atomic():
+            short_string = generate()
+            return create_url_entry(f'https://example.com/bench/{i}', short_string, f'http://bench/{short_string}', user=user)
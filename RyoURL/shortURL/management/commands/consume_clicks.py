@@ -0,0 +1,48 @@
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+from ...clicks import consume_once, ensure_group
+
+# 常數設定
+ERROR_RETRY_DELAY = 1.0     # 發生錯誤後重試前等待的秒數
+
+
+class Command(BaseCommand):
+    help = '由 Redis Stream 讀取點擊事件，彙總為每小時、每日的點擊統計'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.CLICK_CONSUMER_BATCH_SIZE,
+                            help='每次讀取的事件數')
+        parser.add_argument('--block', type=int, default=5000, help='沒有新事件時等待的毫秒數')
+        parser.add_argument('--consumer', default=socket.gethostname(),
+                            help='consumer 名稱，同一台主機執行多個 consumer 時需各自指定；重新啟動時使用相同名稱可接續處理未確認的事件')
+        parser.add_argument('--once', action='store_true', help='處理完目前所有事件後結束')
+
+    def handle(self, *args, **options):
+        client = get_redis_connection('default')
+        ensure_group(client)
+        consumer, batch_size = options['consumer'], options['batch_size']
+        block = None if options['once'] else options['block']
+
+        # 先處理上次中途結束或寫入失敗時已讀取但尚未確認的事件
+        pending = True
+        while True:
+            try:
+                count = consume_once(client, consumer, batch_size, block, pending=pending)
+                if count:
+                    self.stdout.write(f'已彙總 {count} 筆點擊事件')
+                elif pending:
+                    pending = False
+                elif options['once']:
+                    return
+            except Exception as e:
+                # 未確認的事件會保留在 pending 清單中，稍後重試
+                self.stderr.write(f'彙總點擊事件時發生錯誤: {e}')
+                if options['once']:
+                    return
+                pending = True
+                time.sleep(ERROR_RETRY_DELAY)
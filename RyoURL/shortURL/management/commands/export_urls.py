@@ -0,0 +1,25 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...url_transfer import FORMATS, export_urls
+
+
+class Command(BaseCommand):
+    help = '以 CSV 或 NDJSON 匯出所有短網址（伺服器端游標逐批讀取，記憶體用量固定）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='ndjson', help='匯出格式')
+        parser.add_argument('--output', default='-', help='輸出檔案，- 代表標準輸出')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['output'] == '-':
+            total = export_urls(options['format'], sys.stdout)
+        else:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as stream:
+                total = export_urls(options['format'], stream)
+        elapsed = time.monotonic() - started
+        # 結果可能輸出到標準輸出，統計資訊寫入標準錯誤
+        self.stderr.write(f'已匯出 {total} 個短網址，耗時 {elapsed:.1f} 秒，每秒 {total / elapsed if elapsed else 0:.0f} 筆')
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...visit_counter import flush_visit_counts
+
+
+class Command(BaseCommand):
+    help = '定期將 Redis 中累積的訪問次數批次寫入資料庫'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=settings.VISIT_COUNT_FLUSH_INTERVAL,
+                            help='每次寫入的間隔秒數')
+        parser.add_argument('--once', action='store_true', help='只寫入一次後結束')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            try:
+                count = flush_visit_counts()
+                if count:
+                    self.stdout.write(f'已更新 {count} 個短網址的訪問次數')
+            except Exception as e:
+                # 寫入失敗的批次會保留在 Redis 中，下次重試
+                self.stderr.write(f'寫入訪問次數時發生錯誤: {e}')
+            if options['once']:
+                return
+            time.sleep(max(0.0, options['interval'] - (time.monotonic() - started)))
@@ -0,0 +1,42 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import User
+from ...url_transfer import CONFLICT_ACTIONS, FORMATS, IMPORT_BATCH_SIZE, import_urls
+
+
+class Command(BaseCommand):
+    help = '由 export_urls 產生的 CSV 或 NDJSON 分批匯入短網址（PostgreSQL 使用 COPY）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='匯入的檔案，- 代表標準輸入')
+        parser.add_argument('--format', choices=FORMATS, help='檔案格式，未指定時依副檔名判斷（.csv 以外視為 NDJSON）')
+        parser.add_argument('--on-conflict', choices=CONFLICT_ACTIONS, default='skip',
+                            help='短網址已存在時略過（skip）或以匯入的資料覆蓋（update）')
+        parser.add_argument('--user', help='不存在的使用者改由此使用者擁有，預設為匿名使用者')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='每批匯入的數量')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('csv' if options['input'].endswith('.csv') else 'ndjson')
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f'使用者不存在: {options["user"]}')
+
+        started = time.monotonic()
+        try:
+            if options['input'] == '-':
+                result = import_urls(sys.stdin, fmt, options['on_conflict'], user, options['batch_size'])
+            else:
+                with open(options['input'], encoding='utf-8', newline='') as stream:
+                    result = import_urls(stream, fmt, options['on_conflict'], user, options['batch_size'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'已匯入 {result["imported"]} 個短網址（讀取 {result["rows"]} 筆，略過 {result["skipped"]} 筆），'
+            f'耗時 {elapsed:.1f} 秒，每秒 {result["rows"] / elapsed if elapsed else 0:.0f} 筆'
+        )
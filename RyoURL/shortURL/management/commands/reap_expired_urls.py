@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...expiry import reap_expired_urls
+
+
+class Command(BaseCommand):
+    help = '分批刪除過期的短網址，並清除其快取'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.EXPIRY_REAP_BATCH_SIZE,
+                            help='每批刪除的數量')
+        parser.add_argument('--rate', type=float, default=settings.EXPIRY_REAP_RATE,
+                            help='每秒最多刪除的數量，0 代表不限制')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='定期執行的間隔秒數，0 代表只執行一次')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                deleted = reap_expired_urls(options['batch_size'], rate=options['rate'])
+                if deleted:
+                    self.stdout.write(f'已刪除 {deleted} 個過期短網址')
+            except Exception as e:
+                self.stderr.write(f'刪除過期短網址時發生錯誤: {e}')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...short_code_filter import rebuild
+
+
+class Command(BaseCommand):
+    help = '由 Url 資料表重建 Redis 中的短網址 Bloom filter（同時移除已刪除的短網址）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='定期重建的間隔秒數，0 代表只執行一次')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                started = time.monotonic()
+                total = rebuild()
+                self.stdout.write(f'已重建短網址 Bloom filter: {total} 筆，耗時 {time.monotonic() - started:.1f} 秒')
+            except Exception as e:
+                self.stderr.write(f'重建短網址 Bloom filter 時發生錯誤: {e}')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ...resharding import move_misplaced_urls
+
+
+class Command(BaseCommand):
+    help = '新增分片後，將短網址分批搬移到目前所屬的分片（搬移期間服務不需停機）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批掃描的數量')
+        parser.add_argument('--rate', type=float, default=0, help='每秒最多搬移的數量，0 代表不限制')
+        parser.add_argument('--dry-run', action='store_true', help='只計算需要搬移的數量，不實際搬移')
+
+    def handle(self, *args, **options):
+        moved = move_misplaced_urls(options['batch_size'], rate=options['rate'], dry_run=options['dry_run'])
+        verb = '需要搬移' if options['dry_run'] else '已搬移'
+        for shard, count in moved.items():
+            self.stdout.write(f'分片 {shard}: {verb} {count} 個短網址')
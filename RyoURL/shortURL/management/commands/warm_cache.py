@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...cache_warming import WARM_BATCH_SIZE, warm_cache
+
+
+class Command(BaseCommand):
+    help = '將點擊數最多與最新建立的短網址載入 Redis 查詢快取（部署後或 Redis 清空後使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=settings.CACHE_WARM_TOP, help='點擊數最多的短網址數量')
+        parser.add_argument('--recent', type=int, default=settings.CACHE_WARM_RECENT, help='最新建立的短網址數量')
+        parser.add_argument('--batch-size', type=int, default=WARM_BATCH_SIZE, help='每批讀取與寫入的數量')
+
+    def handle(self, *args, **options):
+        result = warm_cache(options['top'], options['recent'], batch_size=options['batch_size'])
+        rate = result['rows'] / result['seconds'] if result['seconds'] else 0
+        self.stdout.write(
+            f'已預熱 {result["stored"]} 個短網址（讀取 {result["rows"]} 筆，略過已刪除 {result["removed"]} 筆），'
+            f'耗時 {result["seconds"]} 秒，每秒 {rate:.0f} 筆'
+        )
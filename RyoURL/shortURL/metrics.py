@@ -0,0 +1,242 @@
+import bisect
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis import RedisError
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SNAPSHOT_KEY = 'metrics_snapshots'      # Redis hash：行程 -> 該行程的指標，讓 /metrics 回傳所有行程的加總
+SNAPSHOT_STALE_FACTOR = 4               # 超過 4 個寫入間隔未更新的行程視為已結束
+
+_lock = threading.Lock()
+_registry = []
+_pusher = None
+_pusher_lock = threading.Lock()
+
+
+# 行程識別名稱（fork 後的子行程各自不同）
+def process_id() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+# 計數器：只會增加的數值
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1) -> None:
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+    @staticmethod
+    def merge(target, value):
+        return value if target is None else target + value
+
+    def render(self, values) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {value}' for labels, value in sorted(values.items())]
+
+
+# 量測值：可增可減的目前數值，多個行程時輸出加總
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value, *labels) -> None:
+        with _lock:
+            self.values[labels] = value
+
+
+# 直方圖：每個區間的次數（非累計）加上總和，輸出時才轉為 Prometheus 的累計格式
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            data = self.values.get(labels)
+            if data is None:
+                data = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            data[index] += 1
+            data[-1] += value
+
+    @staticmethod
+    def merge(target, value):
+        return list(value) if target is None else [a + b for a, b in zip(target, value)]
+
+    def render(self, values) -> List[str]:
+        lines = []
+        for labels, data in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), data):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {data[-1]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+# 各項指標
+request_duration = Histogram('ryourl_http_request_duration_seconds', '請求處理時間', ('route', 'method'))
+requests_total = Counter('ryourl_http_requests_total', '請求數', ('route', 'method', 'status'))
+db_query_duration = Histogram('ryourl_db_query_duration_seconds', 'SQL 查詢時間', ('alias',))
+db_connections_opened = Counter('ryourl_db_connections_opened_total', '連線池建立的資料庫連線數', ('alias',))
+db_pool_connections = Gauge('ryourl_db_pool_connections', '連線池中的資料庫連線數', ('alias', 'state'))
+redis_command_duration = Histogram('ryourl_redis_command_duration_seconds', 'Redis 指令（或 pipeline）時間', ('kind',))
+cache_lookups = Counter('ryourl_cache_lookups_total', '快取查詢結果', ('cache', 'result'))
+hot_keys_pinned = Gauge('ryourl_hot_keys_pinned', '固定在行程內的熱門短網址數量')
+short_code_filter_results = Counter('ryourl_short_code_filter_total', '短網址 Bloom filter 與負向快取的判斷結果', ('result',))
+rate_limited = Counter('ryourl_rate_limited_total', '超過限流而回傳 429 的請求數', ('route', 'backend'))
+password_hash_pending = Gauge('ryourl_password_hash_pending', '等待中與計算中的密碼雜湊數量（行程池的佇列深度）')
+password_hash_duration = Histogram('ryourl_password_hash_duration_seconds', '密碼雜湊時間（包含在佇列中等待）', ('kind',))
+password_hash_rejected = Counter('ryourl_password_hash_rejected_total', '等待中的密碼雜湊超過上限而回傳 503 的請求數')
+
+
+# 記錄一個請求，由 MetricsMiddleware 呼叫
+def observe_request(request, response, elapsed_ns: int) -> None:
+    match = request.resolver_match
+    observe_route(match.route if match is not None else 'unmatched', request.method, response.status_code, elapsed_ns)
+
+
+# 記錄一個請求的處理時間與狀態碼（不經過 middleware 的導向快速路徑直接呼叫）
+def observe_route(route: str, method: str, status_code: int, elapsed_ns: int) -> None:
+    request_duration.observe(elapsed_ns / 1e9, route, method)
+    requests_total.inc(route, method, str(status_code))
+    if _pusher is None and settings.METRICS_PUSH_INTERVAL:
+        _ensure_pusher()
+
+
+# 用於 connection.execute_wrappers，記錄每個 SQL 查詢的時間
+def sql_wrapper(execute, sql, params, many, context):
+    started = time.perf_counter_ns()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        db_query_duration.observe((time.perf_counter_ns() - started) / 1e9, context['connection'].alias)
+
+
+def snapshot() -> Dict[str, list]:
+    with _lock:
+        return {metric.name: [[list(labels), value] for labels, value in metric.values.items()] for metric in _registry}
+
+
+# 將本行程的指標寫入 Redis，讓任一行程的 /metrics 都能回傳所有行程的加總
+def push_snapshot() -> None:
+    try:
+        get_redis_connection('default').hset(SNAPSHOT_KEY, process_id(), json.dumps({'time': time.time(), 'metrics': snapshot()}))
+    except RedisError as e:
+        logger.error(f'寫入效能指標失敗: {e}')
+
+
+# 每隔 METRICS_PUSH_INTERVAL 秒寫入一次，請求本身不等待 Redis
+def _push_periodically() -> None:
+    while True:
+        interval = settings.METRICS_PUSH_INTERVAL
+        time.sleep(interval or 1)
+        if interval:
+            try:
+                push_snapshot()
+            except Exception as e:
+                logger.error(f'寫入效能指標失敗: {e}')
+
+
+# 在本行程記錄第一個請求時啟動寫入指標的執行緒（fork 後的子行程會重新啟動）
+def _ensure_pusher() -> None:
+    global _pusher
+    with _pusher_lock:
+        if _pusher is None:
+            _pusher = threading.Thread(target=_push_periodically, name='metrics-push', daemon=True)
+            _pusher.start()
+
+
+# fork 不會複製執行緒，子行程需要重新啟動
+def _forget_pusher() -> None:
+    global _pusher, _pusher_lock
+    _pusher = None
+    _pusher_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pusher)
+
+
+# 取得所有行程的指標快照（不含本行程），並移除已結束行程的資料
+def _other_snapshots() -> List[Dict[str, list]]:
+    client = get_redis_connection('default')
+    try:
+        entries = client.hgetall(SNAPSHOT_KEY)
+    except RedisError as e:
+        logger.error(f'讀取效能指標失敗，只回傳本行程的指標: {e}')
+        return []
+    current = process_id()
+    oldest = time.time() - settings.METRICS_PUSH_INTERVAL * SNAPSHOT_STALE_FACTOR
+    snapshots, stale = [], []
+    for name, raw in entries.items():
+        name = name.decode() if isinstance(name, bytes) else name
+        if name == current:
+            continue
+        data = json.loads(raw)
+        if data['time'] < oldest:
+            stale.append(name)
+        else:
+            snapshots.append(data['metrics'])
+    if stale:
+        try:
+            client.hdel(SNAPSHOT_KEY, *stale)
+        except RedisError as e:
+            logger.error(f'清除過期的效能指標失敗: {e}')
+    return snapshots
+
+
+# 以 Prometheus 文字格式輸出指標
+def render(snapshots: Optional[List[Dict[str, list]]] = None) -> str:
+    if snapshots is None:
+        snapshots = [snapshot()] + (_other_snapshots() if settings.METRICS_PUSH_INTERVAL else [])
+    lines = []
+    for metric in _registry:
+        merged = {}
+        for data in snapshots:
+            for labels, value in data.get(metric.name, []):
+                labels = tuple(labels)
+                merged[labels] = metric.merge(merged.get(labels), value)
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.render(merged))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,65 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import db_router, metrics
+from .db_router import SAFE_METHODS, STICKY_COOKIE
+
+
+# 記錄每個請求的處理時間與狀態碼，同時支援同步（WSGI）與非同步（ASGI）
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter_ns()
+        response = self.get_response(request)
+        metrics.observe_request(request, response, time.perf_counter_ns() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter_ns()
+        response = await self.get_response(request)
+        metrics.observe_request(request, response, time.perf_counter_ns() - started)
+        return response
+
+
+# 唯讀請求（GET、HEAD、OPTIONS）允許讀取資料庫副本；寫入請求成功後設定短期 cookie，
+# 讓同一個使用者在 DB_STICKY_SECONDS 秒內的讀取都回到主資料庫，能立即看到自己剛寫入的資料
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _mark_sticky(request, response) -> None:
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=settings.DB_STICKY_SECONDS, httponly=True, samesite='Lax')
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with db_router.replica_reads(db_router.request_allows_replica(request)):
+            response = self.get_response(request)
+        self._mark_sticky(request, response)
+        return response
+
+    async def __acall__(self, request):
+        with db_router.replica_reads(db_router.request_allows_replica(request)):
+            response = await self.get_response(request)
+        self._mark_sticky(request, response)
+        return response
@@ -0,0 +1,43 @@
+# Generated by Django 4.2 on 2026-10-18 09:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 2000
+
+
+# 為既有的短網址補上原網址雜湊值
+def backfill_origin_hash(apps, schema_editor):
+    from shortURL.dedup import origin_hash
+
+    Url = apps.get_model('shortURL', 'Url')
+    batch = []
+    for url in Url.objects.filter(origin_hash__isnull=True).only('id', 'origin_url').iterator(chunk_size=BACKFILL_BATCH_SIZE):
+        url.origin_hash = origin_hash(url.origin_url)
+        batch.append(url)
+        if len(batch) >= BACKFILL_BATCH_SIZE:
+            Url.objects.bulk_update(batch, ['origin_hash'])
+            batch = []
+    if batch:
+        Url.objects.bulk_update(batch, ['origin_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('shortURL', '0004_shortcodesequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='url',
+            name='origin_hash',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='url',
+            index=models.Index(fields=['user', 'origin_hash'], name='url_user_origin_hash_idx'),
+        ),
+        migrations.RunPython(backfill_origin_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortURL', '0005_url_origin_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='url',
+            index=models.Index(condition=models.Q(('expire_date__isnull', False)), fields=['expire_date'], name='url_expire_date_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 10:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('shortURL', '0006_url_expire_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='url',
+            index=models.Index(fields=['create_date', 'id'], name='url_create_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='url',
+            index=models.Index(fields=['user', 'create_date', 'id'], name='url_user_create_date_id_idx'),
+        ),
+    ]
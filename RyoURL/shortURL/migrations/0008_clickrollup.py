@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-18 11:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortURL', '0007_url_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClickRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', '每小時'), ('day', '每日')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('referrer_host', models.CharField(blank=True, default='', max_length=255)),
+                ('agent_class', models.CharField(max_length=16)),
+                ('clicks', models.BigIntegerField(default=0)),
+                ('url', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='shortURL.url')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('url', 'granularity', 'bucket', 'referrer_host', 'agent_class'), name='click_rollup_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortURL', '0008_clickrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='url',
+            name='user',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortURL', '0009_url_user_no_db_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='url',
+            name='redirect_type',
+            field=models.PositiveSmallIntegerField(choices=[(301, '301 永久導向'), (302, '302 暫時導向'), (307, '307 暫時導向（保留請求方法）'), (308, '308 永久導向（保留請求方法）')], default=302),
+        ),
+        migrations.AddField(
+            model_name='url',
+            name='update_date',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shortURL', '0010_url_redirect_type'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='url',
+            index=models.Index(fields=['visit_count', 'id'], name='url_visit_count_id_idx'),
+        ),
+    ]
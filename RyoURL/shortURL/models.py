@@ -11,10 +11,61 @@ class User(AbstractUser):
     user_type = models.IntegerField(choices=USER_TYPE, default=1)
 
 class Url(models.Model):
+    REDIRECT_TYPE = (
+        (301, '301 永久導向'),
+        (302, '302 暫時導向'),
+        (307, '307 暫時導向（保留請求方法）'),
+        (308, '308 永久導向（保留請求方法）'),
+    )
     origin_url = models.URLField()
     short_string = models.CharField(max_length=10, unique=True, default='NULL')
     short_url = models.URLField()
     create_date = models.DateTimeField(default=datetime.datetime.now)
     expire_date = models.DateTimeField(null=True, blank=True)
     visit_count = models.IntegerField(default=0)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
\ No newline at end of file
+    # 短網址分片後使用者只在 default，因此不建立資料庫的外鍵限制；連帶刪除由 Django 與 signal 處理
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_constraint=False)
+    origin_hash = models.CharField(max_length=32, null=True, blank=True)   # 正規化後原網址的雜湊值，用於去除重複
+    redirect_type = models.PositiveSmallIntegerField(choices=REDIRECT_TYPE, default=302)  # 導向的 HTTP 狀態碼，永久導向可由 CDN 與瀏覽器快取
+    update_date = models.DateTimeField(auto_now=True, null=True)            # 最後修改時間（包含訪問次數寫入），作為 Last-Modified；舊資料為 None 時以 create_date 代替
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'origin_hash'], name='url_user_origin_hash_idx'),
+            models.Index(fields=['expire_date'], name='url_expire_date_idx', condition=models.Q(expire_date__isnull=False)),
+            models.Index(fields=['create_date', 'id'], name='url_create_date_id_idx'),
+            models.Index(fields=['user', 'create_date', 'id'], name='url_user_create_date_id_idx'),
+            models.Index(fields=['visit_count', 'id'], name='url_visit_count_id_idx'),
+        ]
+
+    # 記下由資料庫讀取時的短網址字串，儲存時不需要再查詢資料庫即可判斷短網址是否被改名
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_short_string = instance.__dict__.get('short_string')
+        return instance
+
+class ShortCodeSequence(models.Model):
+    name = models.CharField(max_length=32, unique=True)
+    next_value = models.BigIntegerField(default=0)
+
+# 點擊統計的彙總資料，由 consume_clicks 依每小時、每日累加，統計 API 只查詢此資料表
+class ClickRollup(models.Model):
+    GRANULARITY = (
+        ('hour', '每小時'),
+        ('day', '每日'),
+    )
+    url = models.ForeignKey(Url, on_delete=models.CASCADE, db_index=False)   # 唯一限制的索引已以 url 開頭
+    granularity = models.CharField(max_length=4, choices=GRANULARITY)
+    bucket = models.DateTimeField()                                         # 時間區間的起始時間
+    referrer_host = models.CharField(max_length=255, default='', blank=True)  # 空字串代表沒有來源網站
+    agent_class = models.CharField(max_length=16)                           # browser、mobile、bot、other
+    clicks = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['url', 'granularity', 'bucket', 'referrer_host', 'agent_class'],
+                name='click_rollup_unique',
+            ),
+        ]
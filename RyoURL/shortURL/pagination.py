@@ -0,0 +1,74 @@
+import base64
+import heapq
+import json
+from itertools import islice
+from typing import Iterable, List, Optional, Tuple
+
+from django.db.models import Q, QuerySet
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+
+from schemas.schemas import UrlSchema
+
+# 常數設定
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'    # 下一頁游標的回應標頭
+STREAM_CHUNK_SIZE = 2000                # 串流時每次由伺服器端游標取回的筆數
+KEYSET_ORDERING = ('-create_date', '-id')
+
+
+# 將 (create_date, id) 編碼為游標字串
+def encode_cursor(create_date, url_id: int) -> str:
+    raw = json.dumps([create_date.isoformat(), url_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+# 解析游標字串，格式錯誤時拋出 ValueError
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        create_date, url_id = json.loads(raw)
+        create_date = parse_datetime(create_date)
+    except Exception:
+        raise ValueError('無效的游標')
+    if create_date is None or not isinstance(url_id, int):
+        raise ValueError('無效的游標')
+    return create_date, url_id
+
+
+# 依 (create_date, id) 由新到舊排序，並從游標之後開始
+def after_cursor(queryset: QuerySet, cursor: Optional[str]) -> QuerySet:
+    queryset = queryset.order_by(*KEYSET_ORDERING)
+    if cursor:
+        create_date, url_id = decode_cursor(cursor)
+        queryset = queryset.filter(Q(create_date__lt=create_date) | Q(create_date=create_date, id__lt=url_id))
+    return queryset
+
+
+# 合併各分片依 (create_date, id) 由新到舊排序的結果；重新分片時同時存在於兩個分片的短網址只保留一筆
+def merge_shards(iterables: List[Iterable]):
+    if len(iterables) == 1:
+        yield from iterables[0]
+        return
+    last_id = None
+    for url in heapq.merge(*iterables, key=lambda url: (url.create_date, url.id), reverse=True):
+        if url.id != last_id:
+            yield url
+        last_id = url.id
+
+
+# 取得一頁資料與下一頁的游標（沒有下一頁時為 None），每個分片最多取 limit + 1 筆後合併
+def keyset_page(querysets: List[QuerySet], cursor: Optional[str], limit: int) -> Tuple[List, Optional[str]]:
+    if limit < 1:
+        raise ValueError('limit 必須大於 0')
+    rows = list(islice(merge_shards([after_cursor(queryset, cursor)[:limit + 1] for queryset in querysets]), limit + 1))
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor(last.create_date, last.id)
+
+
+# 以伺服器端游標逐筆讀取各分片並合併輸出 NDJSON，記憶體用量不隨資料量增加
+def stream_ndjson(querysets: List[QuerySet], cursor: Optional[str] = None) -> StreamingHttpResponse:
+    rows = merge_shards([after_cursor(queryset, cursor).iterator(chunk_size=STREAM_CHUNK_SIZE) for queryset in querysets])
+    lines = (UrlSchema.from_orm(url).model_dump_json() + '\n' for url in rows)
+    return StreamingHttpResponse(lines, content_type='application/x-ndjson')
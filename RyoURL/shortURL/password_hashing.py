@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Tuple
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+from . import metrics
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = 0                    # 本行程等待中與計算中的密碼雜湊數量
+_pending_lock = threading.Lock()
+
+
+# 等待中的密碼雜湊已達 PASSWORD_HASH_MAX_PENDING，應回傳 503 讓用戶端稍後重試
+class HashingBusy(Exception):
+    pass
+
+
+# 行程池中執行的函式（以名稱傳給子行程，必須定義在模組層級）
+def _init_worker() -> None:
+    django.setup()
+
+
+def _make(password: str) -> str:
+    return make_password(password)
+
+
+# 回傳 (密碼是否正確, 是否需要以目前的設定重新雜湊)
+def _verify(password: str, encoded: str) -> Tuple[bool, bool]:
+    updated = []
+    correct = check_password(password, encoded, setter=lambda raw: updated.append(True))
+    return correct, bool(updated)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # 以 spawn 建立子行程，避免在有多個執行緒的 worker 中 fork
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return _executor
+
+
+# 子行程異常結束時行程池無法再使用，捨棄後下次重新建立
+def _discard_executor(broken: ProcessPoolExecutor) -> None:
+    global _executor
+    logger.error('密碼雜湊的子行程異常結束，重新建立行程池')
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+
+def _acquire() -> None:
+    global _pending
+    with _pending_lock:
+        if _pending >= settings.PASSWORD_HASH_MAX_PENDING:
+            metrics.password_hash_rejected.inc()
+            raise HashingBusy()
+        _pending += 1
+        metrics.password_hash_pending.set(_pending)
+
+
+def _release(*args) -> None:
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+        metrics.password_hash_pending.set(_pending)
+
+
+# 送到行程池計算，等待中的數量超過上限時拋出 HashingBusy
+def _submit(func, *args) -> Future:
+    _acquire()
+    try:
+        executor = _get_executor()
+        try:
+            future = executor.submit(func, *args)
+        except BrokenProcessPool:
+            _discard_executor(executor)
+            future = _get_executor().submit(func, *args)
+    except BaseException:
+        _release()
+        raise
+    future.add_done_callback(_release)
+    return future
+
+
+def _observe(kind: str, started: int) -> None:
+    metrics.password_hash_duration.observe((time.perf_counter_ns() - started) / 1e9, kind)
+
+
+# 在行程池計算並等待結果（同步 view 使用，等待期間不佔用 CPU 與 GIL）；PASSWORD_HASH_WORKERS 為 0 時直接計算
+def _call(kind: str, func, *args):
+    started = time.perf_counter_ns()
+    try:
+        if settings.PASSWORD_HASH_WORKERS <= 0:
+            return func(*args)
+        return _submit(func, *args).result()
+    finally:
+        _observe(kind, started)
+
+
+# 在行程池計算（asyncio 版本），不會阻塞 event loop
+async def _acall(kind: str, func, *args):
+    started = time.perf_counter_ns()
+    try:
+        if settings.PASSWORD_HASH_WORKERS <= 0:
+            return await sync_to_async(func, thread_sensitive=False)(*args)
+        return await asyncio.wrap_future(_submit(func, *args))
+    finally:
+        _observe(kind, started)
+
+
+def hash_password(password: str) -> str:
+    return _call('hash', _make, password)
+
+
+def verify_password(password: str, encoded: str) -> Tuple[bool, bool]:
+    return _call('verify', _verify, password, encoded)
+
+
+async def ahash_password(password: str) -> str:
+    return await _acall('hash', _make, password)
+
+
+async def averify_password(password: str, encoded: str) -> Tuple[bool, bool]:
+    return await _acall('verify', _verify, password, encoded)
+
+
+# fork 後的子行程不能使用父行程的行程池
+def _forget_executor() -> None:
+    global _executor, _executor_lock, _pending, _pending_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+    _pending = 0
+    _pending_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_executor)
@@ -0,0 +1,26 @@
+from functools import partial
+
+from django.db.backends.postgresql import base
+
+from .pool import get_pool
+
+
+# PostgreSQL 後端加上行程內連線池：Django 關閉連線（例如請求結束時）會把連線歸還連線池，
+# 下一個請求直接取用，不需要重新連線與驗證；settings_dict 沒有 POOL 時與原本的後端相同
+class DatabaseWrapper(base.DatabaseWrapper):
+    def connection_pool(self):
+        options = self.settings_dict.get('POOL')
+        return get_pool(self.alias, options) if options else None
+
+    def get_new_connection(self, conn_params):
+        pool = self.connection_pool()
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        return pool.acquire(partial(super().get_new_connection, conn_params))
+
+    def _close(self):
+        pool = self.connection_pool()
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.release(self.connection)
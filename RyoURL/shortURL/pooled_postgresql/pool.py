@@ -0,0 +1,158 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Tuple
+
+import psycopg2
+from psycopg2 import extensions
+
+from .. import metrics
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+DEFAULT_OPTIONS = {
+    'MAX_SIZE': 20,             # 每個行程最多的連線數
+    'TIMEOUT': 10,              # 連線全部使用中時最多等待的秒數
+    'IDLE_TIMEOUT': 300,        # 閒置超過此秒數的連線會關閉
+    'MAX_LIFETIME': 3600,       # 連線最長使用時間（秒），超過後歸還時關閉
+    'HEALTH_CHECK_AFTER': 30,   # 閒置超過此秒數的連線，取出前先以 SELECT 1 檢查
+}
+
+_pools: Dict[str, 'ConnectionPool'] = {}
+_pools_lock = threading.Lock()
+
+
+# 單一資料庫的連線池，同一個行程內的所有執行緒（包含 ASGI 的 sync_to_async 執行緒）共用
+class ConnectionPool:
+    def __init__(self, alias: str, options: Dict):
+        options = {**DEFAULT_OPTIONS, **options}
+        self.alias = alias
+        self.max_size = options['MAX_SIZE']
+        self.timeout = options['TIMEOUT']
+        self.idle_timeout = options['IDLE_TIMEOUT']
+        self.max_lifetime = options['MAX_LIFETIME']
+        self.health_check_after = options['HEALTH_CHECK_AFTER']
+        self.pid = os.getpid()
+        self._idle = deque()            # (連線, 歸還時間)，右端為最近歸還的連線
+        self._opened_at: Dict = {}      # 連線 -> 建立時間
+        self._size = 0                  # 已建立（使用中與閒置）的連線數
+        self._cond = threading.Condition()
+
+    # 取出一條連線；沒有閒置連線且未達上限時以 connect 建立新連線
+    def acquire(self, connect: Callable):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn, returned_at = self._take(deadline)
+            if conn is None:
+                return self._open(connect)
+            if self._usable(conn, returned_at):
+                return conn
+            self._discard(conn)
+
+    # 歸還連線：結束未完成的交易，已中斷或超過使用時間的連線直接關閉
+    def release(self, conn) -> None:
+        if conn.closed or time.monotonic() - self._opened_at.get(conn, 0) >= self.max_lifetime:
+            self._discard(conn)
+            return
+        try:
+            if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._update_metrics()
+            self._cond.notify()
+
+    # 回傳 (閒置連線, 歸還時間)；可以建立新連線時回傳 (None, None)
+    def _take(self, deadline: float) -> Tuple:
+        with self._cond:
+            while True:
+                expired = self._pop_expired()
+                if expired:
+                    break
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    self._update_metrics()
+                    return conn, returned_at
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.OperationalError(
+                        f'資料庫連線池 {self.alias} 已滿（{self.max_size} 條連線），等待 {self.timeout} 秒後仍無可用連線'
+                    )
+                self._cond.wait(remaining)
+        # 在鎖外關閉閒置過久的連線後重新取出
+        for conn in expired:
+            self._discard(conn)
+        return self._take(deadline)
+
+    # 取出閒置過久的連線（由最早歸還的一端開始），由呼叫端在鎖外關閉
+    def _pop_expired(self) -> list:
+        expired = []
+        oldest = time.monotonic() - self.idle_timeout
+        while self._idle and self._idle[0][1] < oldest:
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    def _open(self, connect: Callable):
+        try:
+            conn = connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self._opened_at[conn] = time.monotonic()
+        metrics.db_connections_opened.inc(self.alias)
+        return conn
+
+    # 閒置超過 HEALTH_CHECK_AFTER 秒的連線先確認仍可使用（例如資料庫重新啟動後）
+    def _usable(self, conn, returned_at: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not conn.autocommit:
+                conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f'資料庫連線池 {self.alias} 的閒置連線已無法使用，重新連線: {e}')
+            return False
+
+    def _discard(self, conn) -> None:
+        self._opened_at.pop(conn, None)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._update_metrics()
+            self._cond.notify()
+
+    def _update_metrics(self) -> None:
+        metrics.db_pool_connections.set(self._size - len(self._idle), self.alias, 'in_use')
+        metrics.db_pool_connections.set(len(self._idle), self.alias, 'idle')
+
+
+# 取得資料庫的連線池；fork 後的子行程建立自己的連線池，不使用父行程的連線
+def get_pool(alias: str, options: Dict) -> ConnectionPool:
+    pool = _pools.get(alias)
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[alias] = ConnectionPool(alias, options)
+        return pool
@@ -0,0 +1,101 @@
+import json
+import logging
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis import RedisError
+
+from . import db_router, invalidation_bus, metrics
+from .lru import LocalLRUCache
+from .models import User
+from .redis_client import decode_version, fill_if_version
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+PRINCIPAL_KEY_PREFIX = 'principal_'     # Redis 中使用者快取的鍵前綴
+PRINCIPAL_VERSION_KEY_PREFIX = 'principal_version_'     # 使用者的版本，每次清除快取時增加，查詢資料庫後確認版本未變才寫回快取
+PRINCIPAL_VERSION_TIMEOUT = 10 * 60     # 版本的存活時間（秒），需大於一次資料庫查詢可能花費的時間
+
+local_cache = LocalLRUCache(settings.PRINCIPAL_LRU_SIZE)
+
+
+def _redis_key(user_id) -> str:
+    return f'{PRINCIPAL_KEY_PREFIX}{user_id}'
+
+
+def _version_key(user_id) -> str:
+    return f'{PRINCIPAL_VERSION_KEY_PREFIX}{user_id}'
+
+
+# 由快取資料建立使用者物件，只包含驗證與權限判斷所需的欄位，不可用來儲存
+def _to_user(user_id: int, username: str, user_type: int) -> User:
+    user = User(id=user_id, username=username, user_type=user_type)
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+# 依使用者 id 取得使用者：依序查詢行程內快取、Redis、資料庫，找不到時拋出 User.DoesNotExist
+def get_user(user_id) -> User:
+    user_id = int(user_id)
+    user = local_cache.get(user_id)
+    if user is not None:
+        metrics.cache_lookups.inc('principal', 'local')
+        return user
+
+    client = get_redis_connection('default')
+    try:
+        raw, version = client.mget([_redis_key(user_id), _version_key(user_id)])
+        version = decode_version(version)
+    except RedisError as e:
+        logger.error(f'讀取使用者快取失敗，改查資料庫: {e}')
+        raw, version = None, None
+
+    invalidation_bus.ensure_started()
+    if raw is not None:
+        metrics.cache_lookups.inc('principal', 'redis')
+        user = _to_user(user_id, *json.loads(raw))
+        local_cache.set(user_id, user, settings.PRINCIPAL_LRU_TIMEOUT)
+        return user
+
+    metrics.cache_lookups.inc('principal', 'db')
+    # 讀取結果會快取一段時間，由主資料庫讀取以免快取到副本上尚未同步的權限
+    username, user_type = User.objects.using(db_router.PRIMARY).values_list('username', 'user_type').get(id=user_id)
+    user = _to_user(user_id, username, user_type)
+    # 先寫入行程內快取再確認版本：確認之後的清除會由失效通知移除；查詢資料庫期間使用者被修改或刪除
+    # （例如權限降級）時版本已改變，不寫回快取
+    local_cache.set(user_id, user, settings.PRINCIPAL_LRU_TIMEOUT)
+    if version is not None:
+        try:
+            value = json.dumps([username, user_type])
+            if not fill_if_version(client, _redis_key(user_id), _version_key(user_id), version, value,
+                                   settings.PRINCIPAL_CACHE_TIMEOUT):
+                local_cache.delete(user_id)
+        except RedisError as e:
+            logger.error(f'寫入使用者快取失敗: {e}')
+    return user
+
+
+# 使用者被修改或刪除時清除快取，並通知所有行程清除行程內快取（例如權限降級後立即生效）
+def invalidate(user_id: int) -> None:
+    local_cache.delete(user_id)
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        # 先增加版本再清除快取：清除前已查詢資料庫的請求確認版本時會失敗，不會把舊資料寫回快取
+        pipe.incr(_version_key(user_id))
+        pipe.expire(_version_key(user_id), PRINCIPAL_VERSION_TIMEOUT)
+        pipe.delete(_redis_key(user_id))
+        invalidation_bus.queue_publish(pipe, 'principal', [user_id])
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f'清除使用者快取失敗: {e}')
+
+
+def _evict_local(user_ids: list) -> None:
+    for user_id in user_ids:
+        local_cache.delete(int(user_id))
+
+
+invalidation_bus.register('principal', _evict_local, local_cache.clear)
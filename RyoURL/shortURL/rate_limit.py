@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.http import HttpResponse
+from django_redis import get_redis_connection
+from redis import RedisError
+from redis.exceptions import NoScriptError
+
+from . import metrics
+from .lru import LocalLRUCache
+from .redis_client import get_async_redis
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+RATE_LIMIT_KEY_PREFIX = 'rate_limit_'   # Redis 中 token bucket 的鍵前綴
+LOCAL_BUCKETS_SIZE = 100000             # Redis 無法使用時每個行程最多保留的 token bucket 數量
+REDIS_RETRY_INTERVAL = 1.0              # Redis 失敗後幾秒內直接使用行程內的限制，避免每個請求都等待連線逾時
+
+# Token bucket：依經過的時間補充 token（每秒 rate 個，最多 burst 個），每個請求取用一個；
+# 時間取自 Redis 的 TIME，多台伺服器的時鐘誤差不影響結果。回傳 {需等待的毫秒數（0 代表允許）, 剩餘 token 數}
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local retry = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return {retry, math.floor(tokens)}
+"""
+TOKEN_BUCKET_SHA = hashlib.sha1(TOKEN_BUCKET_SCRIPT.encode()).hexdigest()
+
+local_buckets = LocalLRUCache(LOCAL_BUCKETS_SIZE)
+_local_lock = threading.Lock()
+_redis_down_until = 0.0
+
+
+# 解析 '次數/秒數' 格式的限制，回傳 (每秒補充的 token 數, 最多累積的 token 數)；空字串代表不限制
+def parse_limit(value: str) -> Optional[Tuple[float, int]]:
+    if not value:
+        return None
+    count, _, period = value.partition('/')
+    count, period = int(count), float(period or 1)
+    return count / period, count
+
+
+LIMITS = {route: parse_limit(value) for route, value in settings.RATE_LIMITS.items()}
+
+
+# 請求來源的 IP；在 RATE_LIMIT_TRUSTED_PROXIES 層反向代理之後時，由 X-Forwarded-For 的右側取得
+def client_ip(request) -> str:
+    proxies = settings.RATE_LIMIT_TRUSTED_PROXIES
+    if proxies:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+# 限制的對象：已登入的使用者依使用者，其餘依 IP
+def _bucket_key(request, route: str) -> str:
+    auth = getattr(request, 'auth', None)
+    user = auth.get('user') if isinstance(auth, dict) else None
+    if user is not None and user.user_type != 0:
+        return f'{RATE_LIMIT_KEY_PREFIX}{route}:user:{user.pk}'
+    return f'{RATE_LIMIT_KEY_PREFIX}{route}:ip:{client_ip(request)}'
+
+
+def _redis_available() -> bool:
+    return time.monotonic() >= _redis_down_until
+
+
+def _redis_failed(e: Exception) -> None:
+    global _redis_down_until
+    _redis_down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+    logger.error(f'限流檢查無法使用 Redis，暫時改用行程內的限制: {e}')
+
+
+# Redis 無法使用時在行程內以相同的 token bucket 限制；每個行程各自計算，因此實際上限約為行程數倍
+def _take_local(key: str, rate: float, burst: int) -> float:
+    now = time.monotonic()
+    with _local_lock:
+        tokens, ts = local_buckets.get(key) or (burst, now)
+        tokens = min(burst, tokens + (now - ts) * rate)
+        retry = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry = (1 - tokens) / rate
+        local_buckets.set(key, (tokens, now), burst / rate)
+    return retry
+
+
+def _rejected(route: str, backend: str, retry: float) -> Optional[float]:
+    if retry <= 0:
+        return None
+    metrics.rate_limited.inc(route, backend)
+    return retry
+
+
+# 檢查請求是否超過 route 的限制，只需要一次 Redis 往返；超過時回傳需等待的秒數，未超過時回傳 None
+def check(request, route: str) -> Optional[float]:
+    limit = LIMITS.get(route)
+    if limit is None or not settings.RATE_LIMIT_ENABLED:
+        return None
+    key = _bucket_key(request, route)
+    if _redis_available():
+        client = get_redis_connection('default')
+        try:
+            try:
+                retry_ms, _ = client.evalsha(TOKEN_BUCKET_SHA, 1, key, *limit)
+            except NoScriptError:
+                retry_ms, _ = client.eval(TOKEN_BUCKET_SCRIPT, 1, key, *limit)
+            return _rejected(route, 'redis', retry_ms / 1000)
+        except RedisError as e:
+            _redis_failed(e)
+    return _rejected(route, 'local', _take_local(key, *limit))
+
+
+# 檢查請求是否超過 route 的限制（asyncio 版本）
+async def acheck(request, route: str) -> Optional[float]:
+    limit = LIMITS.get(route)
+    if limit is None or not settings.RATE_LIMIT_ENABLED:
+        return None
+    key = _bucket_key(request, route)
+    if _redis_available():
+        client = get_async_redis()
+        try:
+            try:
+                retry_ms, _ = await client.evalsha(TOKEN_BUCKET_SHA, 1, key, *limit)
+            except NoScriptError:
+                retry_ms, _ = await client.eval(TOKEN_BUCKET_SCRIPT, 1, key, *limit)
+            return _rejected(route, 'redis', retry_ms / 1000)
+        except RedisError as e:
+            _redis_failed(e)
+    return _rejected(route, 'local', _take_local(key, *limit))
+
+
+def retry_after_header(retry: float) -> str:
+    return str(max(1, math.ceil(retry)))
+
+
+# 超過限制時的 429 回應（用於非 API 的 view）
+def too_many_requests(retry: float) -> HttpResponse:
+    response = HttpResponse("請求過於頻繁，請稍後再試。", status=429)
+    response['Retry-After'] = retry_after_header(retry)
+    return response
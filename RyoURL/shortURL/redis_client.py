@@ -0,0 +1,87 @@
+import asyncio
+import time
+import weakref
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+from . import metrics
+
+# 版本與查詢資料庫前讀到的相同時才寫入快取（鍵不存在時版本為空字串），ARGV 為版本、值、存活時間
+FILL_SCRIPT = """
+local version = redis.call('GET', KEYS[2]) or ''
+if version ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+# 每個 event loop 各自的 asyncio Redis 連線（asyncio 連線不能跨 event loop 共用）
+_async_clients = weakref.WeakKeyDictionary()
+
+
+# 記錄每個 Redis 指令的時間（設定於 CACHES 的 REDIS_CLIENT_CLASS）
+class InstrumentedRedis(redis.Redis):
+    def execute_command(self, *args, **options):
+        started = time.perf_counter_ns()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            metrics.redis_command_duration.observe((time.perf_counter_ns() - started) / 1e9, 'command')
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+# pipeline 只在 execute 時與 Redis 溝通，整個 pipeline 記為一次
+class InstrumentedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        started = time.perf_counter_ns()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            metrics.redis_command_duration.observe((time.perf_counter_ns() - started) / 1e9, 'pipeline')
+
+
+class InstrumentedAsyncRedis(redis.asyncio.Redis):
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter_ns()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            metrics.redis_command_duration.observe((time.perf_counter_ns() - started) / 1e9, 'command')
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class InstrumentedAsyncPipeline(redis.asyncio.client.Pipeline):
+    async def execute(self, raise_on_error=True):
+        started = time.perf_counter_ns()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            metrics.redis_command_duration.observe((time.perf_counter_ns() - started) / 1e9, 'pipeline')
+
+
+# 取得目前 event loop 的 asyncio Redis 連線
+def get_async_redis() -> redis.asyncio.Redis:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = InstrumentedAsyncRedis.from_url(settings.REDIS_URL, max_connections=settings.ASYNC_REDIS_MAX_CONNECTIONS)
+        _async_clients[loop] = client
+    return client
+
+
+# 讀取到的版本鍵的值（不存在時為空字串），查詢資料庫前讀取，寫入快取時以 fill_if_version 比對
+def decode_version(raw) -> str:
+    return raw.decode() if isinstance(raw, bytes) else str(raw or '')
+
+
+# 以 Lua script 原子地確認版本鍵未變才寫入快取（同步、asyncio 或 pipeline 皆可），避免把查詢資料庫期間
+# 已被修改或刪除的資料寫回快取；版本鍵由清除快取的一方在刪除快取前以 INCR 增加
+def fill_if_version(client, key: str, version_key: str, version: str, value, ttl: int):
+    return client.eval(FILL_SCRIPT, 2, key, version_key, version, value, ttl)
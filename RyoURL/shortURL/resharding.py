@@ -0,0 +1,74 @@
+import logging
+import time
+from typing import Dict, List
+
+from django.db import transaction
+
+from . import clicks, sharding, url_cache
+from .models import ClickRollup, Url
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+
+# 將不在目前分片的短網址（新增分片後改由新分片負責的短網址）分批搬移到正確的分片，回傳各分片搬出的數量
+# 搬移期間讀取會同時查詢新舊分片（DB_SHARD_PREVIOUS_COUNT），因此不需要停機；
+# rate 為每秒最多搬移的數量（0 代表不限制），dry_run 為 True 時只計算需要搬移的數量
+def move_misplaced_urls(batch_size: int, rate: float = 0, dry_run: bool = False) -> Dict[str, int]:
+    moved = {}
+    for source in sharding.all_shards():
+        moved[source] = _move_shard(source, batch_size, rate, dry_run)
+    return moved
+
+
+# 依 id 順序掃描單一分片，回傳搬出的數量
+def _move_shard(source: str, batch_size: int, rate: float, dry_run: bool) -> int:
+    moved = 0
+    last_id = 0
+    while True:
+        started = time.monotonic()
+        rows = list(
+            Url.objects.using(source).filter(id__gt=last_id)
+            .order_by('id').values_list('id', 'short_string')[:batch_size]
+        )
+        if not rows:
+            return moved
+        last_id = rows[-1][0]
+        targets: Dict[str, List[int]] = {}
+        for url_id, short_string in rows:
+            target = sharding.shard_for(short_string)
+            if target != source:
+                targets.setdefault(target, []).append(url_id)
+        for target, ids in targets.items():
+            moved += len(ids) if dry_run else _move(source, target, ids)
+
+        if rate > 0 and targets:
+            count = sum(len(ids) for ids in targets.values())
+            time.sleep(max(0.0, count / rate - (time.monotonic() - started)))
+
+
+# 在來源分片鎖定短網址（搬移期間的點擊數更新會等待），複製短網址與點擊統計到目標分片後再由來源刪除，回傳搬移的數量；
+# 目標分片的交易先提交，因此來源刪除失敗時資料會同時存在於兩個分片，重新執行即可（已複製的短網址不會重複累加點擊統計）
+def _move(source: str, target: str, ids: List[int]) -> int:
+    # 刪除時會透過 signal 在來源的交易 commit 後清除查詢快取，在此合併為一次 Redis 呼叫
+    with url_cache.deferred_invalidation(), transaction.atomic(using=source):
+        urls = list(Url.objects.using(source).select_for_update().filter(id__in=ids).order_by('id'))
+        if not urls:
+            return 0
+        ids = [url.id for url in urls]
+        copied = set(Url.objects.using(target).filter(id__in=ids).values_list('id', flat=True))
+        rollups = list(
+            ClickRollup.objects.using(source).filter(url_id__in=set(ids) - copied)
+            .values_list('url_id', 'granularity', 'bucket', 'referrer_host', 'agent_class', 'clicks')
+        )
+        for url in urls:
+            url._state.db = None
+            url._state.adding = True
+        with transaction.atomic(using=target):
+            Url.objects.using(target).bulk_create([url for url in urls if url.id not in copied])
+            if rollups:
+                clicks.upsert_rollups(target, rollups)
+        # 來源的點擊統計由 Django 連帶刪除
+        Url.objects.using(source).filter(id__in=ids).delete()
+    logger.info(f'已將 {len(ids)} 個短網址由分片 {source} 搬移到 {target}')
+    return len(ids)
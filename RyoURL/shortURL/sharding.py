@@ -0,0 +1,179 @@
+import hashlib
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db.models import Max, QuerySet
+
+from . import db_router
+from .models import ClickRollup, Url
+from .short_code import SequenceAllocator
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+ID_SEQUENCE_NAME = 'url_id'     # ShortCodeSequence 中 Url id 的序號名稱，分片時 id 由此分配以確保所有分片不重複
+SHARDED_MODELS = (Url, ClickRollup)
+
+SHARDS: List[str] = settings.DB_SHARDS
+# 重新分片期間原本的分片（新增的分片只能接在最後），讀取時也會查詢原本的分片
+PREVIOUS_SHARDS: List[str] = SHARDS[:settings.DB_SHARD_PREVIOUS_COUNT] if settings.DB_SHARD_PREVIOUS_COUNT else []
+
+
+def enabled() -> bool:
+    return len(SHARDS) > 1
+
+
+# Jump consistent hash：分片數由 n 增加為 n + 1 時，只有約 1/(n + 1) 的資料需要搬移到新的分片
+def jump_hash(key: int, buckets: int) -> int:
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+# 短網址所在的分片
+def shard_for(short_string: str, shards: Optional[List[str]] = None) -> str:
+    shards = shards or SHARDS
+    if len(shards) == 1:
+        return shards[0]
+    key = int.from_bytes(hashlib.blake2b(short_string.encode(), digest_size=8).digest(), 'big')
+    return shards[jump_hash(key, len(shards))]
+
+
+# 短網址可能所在的分片：目前的分片，重新分片期間再加上原本的分片
+def shards_for(short_string: str) -> List[str]:
+    shard = shard_for(short_string)
+    if PREVIOUS_SHARDS:
+        previous = shard_for(short_string, PREVIOUS_SHARDS)
+        if previous != shard:
+            return [shard, previous]
+    return [shard]
+
+
+def all_shards() -> List[str]:
+    return SHARDS
+
+
+# 分片的讀取來源，主資料庫（default）依請求類型可能改讀副本
+def read_db(shard: str) -> str:
+    return db_router.read_db() if shard == db_router.PRIMARY else shard
+
+
+# 分片的讀取來源（asyncio 版本）
+async def aread_db(shard: str) -> str:
+    return await db_router.aread_db() if shard == db_router.PRIMARY else shard
+
+
+# 所有分片的 Url QuerySet，用於需要查詢所有分片的列表
+def querysets() -> List[QuerySet]:
+    return [Url.objects.using(read_db(shard)) for shard in all_shards()]
+
+
+# 依短網址將多個短網址分組到各自的分片（包含重新分片期間原本的分片）
+def group_by_shard(short_strings: Iterable[str]) -> Dict[str, List[str]]:
+    groups: Dict[str, List[str]] = {}
+    for short_string in short_strings:
+        for shard in shards_for(short_string):
+            groups.setdefault(shard, []).append(short_string)
+    return groups
+
+
+# 依短網址查詢第一筆資料（在所有可能的分片中依序查詢），primary 為 True 時不讀取副本
+def first(short_string: str, transform: Callable[[QuerySet], QuerySet] = lambda queryset: queryset,
+          primary: bool = False):
+    for shard in shards_for(short_string):
+        queryset = transform(Url.objects.using(shard if primary else read_db(shard)).filter(short_string=short_string))
+        obj = db_router.first_or_primary(queryset)
+        if obj is not None:
+            return obj
+    return None
+
+
+# 依短網址查詢第一筆資料（asyncio 版本）
+async def afirst(short_string: str, transform: Callable[[QuerySet], QuerySet] = lambda queryset: queryset,
+                 primary: bool = False):
+    for shard in shards_for(short_string):
+        db = shard if primary else await aread_db(shard)
+        queryset = transform(Url.objects.using(db).filter(short_string=short_string))
+        obj = await db_router.afirst_or_primary(queryset)
+        if obj is not None:
+            return obj
+    return None
+
+
+# 回傳已存在的短網址（由各分片的主資料庫查詢，用於建立前檢查是否重複）
+def existing_short_strings(short_strings: Iterable[str]) -> set:
+    existing = set()
+    for shard, group in group_by_shard(short_strings).items():
+        existing.update(Url.objects.using(shard).filter(short_string__in=group).values_list('short_string', flat=True))
+    return existing
+
+
+def _rows(queryset: QuerySet, short_strings: List[str], fields: List[str]) -> Dict[str, tuple]:
+    return {row[0]: row[1:] for row in queryset.filter(short_string__in=short_strings).values_list('short_string', *fields)}
+
+
+# 一次查詢多個短網址的欄位（每個分片一次 short_string__in 查詢），回傳短網址 -> 欄位值，不存在的短網址不在結果中；
+# 由副本查無資料的短網址再查詢一次主資料庫（副本可能尚未同步剛建立的資料），primary 為 True 時不讀取副本
+def rows_by_short_string(short_strings: Iterable[str], fields: List[str], primary: bool = False) -> Dict[str, tuple]:
+    rows = {}
+    for shard, group in group_by_shard(short_strings).items():
+        db = shard if primary else read_db(shard)
+        rows.update(_rows(Url.objects.using(db), group, fields))
+        missed = [short_string for short_string in group if short_string not in rows]
+        if missed and db in db_router.REPLICAS:
+            rows.update(_rows(Url.objects.using(db_router.PRIMARY), missed, fields))
+    return rows
+
+
+# 回傳短網址 -> id，不存在的短網址不在結果中
+def ids_by_short_string(short_strings: Iterable[str]) -> Dict[str, int]:
+    return {short_string: row[0] for short_string, row in rows_by_short_string(short_strings, ['id']).items()}
+
+
+# 所有分片中最大的 Url id，作為 id 序號的起始值
+def _max_id() -> int:
+    return max((Url.objects.using(shard).aggregate(last_id=Max('id'))['last_id'] or 0) for shard in all_shards())
+
+
+id_allocator = SequenceAllocator(ID_SEQUENCE_NAME, settings.SHORT_CODE_BLOCK_SIZE, initial=lambda: _max_id() + 1)
+
+
+# 新增短網址使用的 id：分片時由 id 序號分配，確保所有分片不重複；未分片時為 None（由資料庫產生）
+def next_ids(count: int) -> List[Optional[int]]:
+    return id_allocator.next_values(count) if enabled() else [None] * count
+
+
+# Url 與 ClickRollup 依短網址分片，其餘資料表只在 default；
+# 讀取只處理物件本身所在的資料庫，查詢短網址的程式以 using() 指定分片
+class ShardRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        db = getattr(getattr(instance, '_state', None), 'db', None)
+        if db is None or db == db_router.PRIMARY or db in db_router.REPLICAS:
+            return None
+        # 分片上的短網址所關聯的使用者等資料仍在 default
+        return db if model in SHARDED_MODELS else db_router.read_db()
+
+    def db_for_write(self, model, **hints):
+        if model not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        db = instance._state.db
+        if db in db_router.REPLICAS:
+            db = db_router.PRIMARY
+        if db is None and isinstance(instance, Url):
+            db = shard_for(instance.short_string)
+        if db is None and isinstance(instance, ClickRollup):
+            db = instance.url._state.db
+        return db
+
+    # 分片擁有完整的資料表結構，只有 Url 與 ClickRollup 會有資料
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True if db in SHARDS else None
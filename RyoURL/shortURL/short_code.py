@@ -0,0 +1,111 @@
+import hashlib
+import os
+import string
+import threading
+from typing import Callable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import ShortCodeSequence
+
+# 常數設定
+ALPHABET = string.ascii_letters + string.digits     # 短網址使用的字元
+CODE_LENGTH = 6                                     # 短網址長度
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH           # 可產生的短網址數量（約 5.68 x 10^10）
+FEISTEL_HALF_BITS = 18                              # Feistel 網路每半邊的位元數，2^36 涵蓋整個 CODE_SPACE
+FEISTEL_HALF_MASK = (1 << FEISTEL_HALF_BITS) - 1
+FEISTEL_ROUNDS = 4
+SEQUENCE_NAME = 'short_code'                        # ShortCodeSequence 中的序號名稱
+
+# 由 SECRET_KEY 推導每一輪的金鑰，讓產生的短網址無法由序號推測
+_round_keys = [
+    hashlib.blake2b(f'{settings.SECRET_KEY}:short_code:{i}'.encode(), digest_size=16).digest()
+    for i in range(FEISTEL_ROUNDS)
+]
+
+
+def _round(value: int, key: bytes) -> int:
+    digest = hashlib.blake2b(value.to_bytes(3, 'big'), key=key, digest_size=4).digest()
+    return int.from_bytes(digest, 'big') & FEISTEL_HALF_MASK
+
+
+# 以 Feistel 網路在 [0, 2^36) 上做可逆的位元置換，並以 cycle walking 確保結果落在 [0, CODE_SPACE)
+def permute(value: int) -> int:
+    while True:
+        left, right = value >> FEISTEL_HALF_BITS, value & FEISTEL_HALF_MASK
+        for key in _round_keys:
+            left, right = right, left ^ _round(right, key)
+        value = (left << FEISTEL_HALF_BITS) | right
+        if value < CODE_SPACE:
+            return value
+
+
+# 將數字轉為固定長度的 base62 字串
+def encode(value: int) -> str:
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, remainder = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+# 由資料庫保留一段連續的序號，回傳起始值；序號第一次使用時以 initial() 作為起始值
+def reserve_block(size: int, name: str = SEQUENCE_NAME, initial: Callable[[], int] = lambda: 0) -> int:
+    with transaction.atomic():
+        sequence = ShortCodeSequence.objects.select_for_update().filter(name=name).first()
+        if sequence is None:
+            sequence, _ = ShortCodeSequence.objects.select_for_update().get_or_create(
+                name=name, defaults={'next_value': initial()}
+            )
+        start = sequence.next_value
+        sequence.next_value = start + size
+        sequence.save(update_fields=['next_value'])
+    return start
+
+
+# 序號分配器：每個行程一次保留一段序號，大多數情況下取得序號不需要存取資料庫
+class SequenceAllocator:
+    def __init__(self, name: str, block_size: int, limit: Optional[int] = None, initial: Callable[[], int] = lambda: 0):
+        self.name = name
+        self.block_size = block_size
+        self.limit = limit
+        self.initial = initial
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._pid = os.getpid()
+
+    def next_values(self, count: int) -> List[int]:
+        with self._lock:
+            # fork 出的子行程不能沿用父行程保留的序號
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._next = self._end = 0
+            values = []
+            while len(values) < count:
+                if self._next >= self._end:
+                    size = max(self.block_size, count - len(values))
+                    self._next = reserve_block(size, self.name, self.initial)
+                    self._end = self._next + size
+                    if self.limit is not None and self._end > self.limit:
+                        raise RuntimeError(f'序號 {self.name} 已用盡')
+                take = min(count - len(values), self._end - self._next)
+                values.extend(range(self._next, self._next + take))
+                self._next += take
+            return values
+
+
+# 短網址分配器：將序號以 Feistel 網路打亂後編碼為短網址
+class ShortCodeAllocator(SequenceAllocator):
+    def __init__(self, block_size: int, name: str = SEQUENCE_NAME):
+        super().__init__(name, block_size, limit=CODE_SPACE)
+
+    def next_codes(self, count: int) -> List[str]:
+        return [encode(permute(value)) for value in self.next_values(count)]
+
+    def next_code(self) -> str:
+        return self.next_codes(1)[0]
+
+
+allocator = ShortCodeAllocator(settings.SHORT_CODE_BLOCK_SIZE)
@@ -0,0 +1,163 @@
+import datetime
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis import RedisError
+
+from . import metrics, sharding
+from .models import Url
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+FILTER_KEY_PREFIX = 'short_code_filter'     # Redis 中 Bloom filter 的鍵前綴，鍵名包含位元數與雜湊數，設定變更後需重建
+REBUILD_CHUNK_SIZE = 10000                  # 重建時每次由資料庫讀取的筆數
+REBUILD_PENDING_TIMEOUT = 60 * 60           # 重建期間記錄新增短網址的集合的存活時間（秒），重建中斷時自動清除
+REBUILD_LATE_WINDOW = 5 * 60                # 重建完成後再補上建立時間在重建開始前幾秒內的短網址（讀取時尚未 commit 的交易）
+
+# Bloom filter 的判斷結果
+ABSENT = 'absent'           # 一定不存在
+MAYBE = 'maybe'             # 可能存在，需要查詢資料庫
+UNAVAILABLE = 'unavailable' # 尚未建立 Bloom filter，需要查詢資料庫
+
+# 重建期間（集合存在時）記下新增的短網址，重建完成後補上；只在 Bloom filter 已建立時設定位元，
+# 避免產生一個幾乎全空的 filter 而誤判既有的短網址不存在。ARGV 為短網址數量、短網址、位元位置
+ADD_SCRIPT = """
+local count = tonumber(ARGV[1])
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    for i = 2, count + 1 do
+        redis.call('SADD', KEYS[2], ARGV[i])
+    end
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = count + 2, #ARGV do
+    redis.call('SETBIT', KEYS[1], ARGV[i], 1)
+end
+return 1
+"""
+
+
+def filter_key() -> str:
+    return f'{FILTER_KEY_PREFIX}:{settings.SHORT_CODE_FILTER_BITS}:{settings.SHORT_CODE_FILTER_HASHES}'
+
+
+def _pending_key() -> str:
+    return f'{filter_key()}:pending'
+
+
+# 計算短網址在 Bloom filter 中的位元位置，以兩個雜湊值組合出 k 個位置
+def positions(short_string: str) -> List[int]:
+    digest = hashlib.blake2b(short_string.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'big')
+    h2 = int.from_bytes(digest[8:], 'big') | 1
+    bits = settings.SHORT_CODE_FILTER_BITS
+    return [(h1 + i * h2) % bits for i in range(settings.SHORT_CODE_FILTER_HASHES)]
+
+
+def count(name: str, amount: int = 1) -> None:
+    metrics.short_code_filter_results.inc(name, amount=amount)
+
+
+# 本行程的統計數字
+def stats() -> Dict[str, int]:
+    return {labels[0]: value for labels, value in list(metrics.short_code_filter_results.values.items())}
+
+
+# 將檢查短網址所需的指令加入 Redis pipeline（同步或 asyncio 皆可）
+def queue_check(pipe, short_string: str) -> None:
+    key = filter_key()
+    pipe.exists(key)
+    for position in positions(short_string):
+        pipe.getbit(key, position)
+
+
+# 解讀 queue_check 加入的指令結果
+def check_result(results) -> str:
+    exists, *bits = results
+    if not exists:
+        count('unavailable')
+        return UNAVAILABLE
+    if all(bits):
+        count('passed')
+        return MAYBE
+    count('rejected')
+    return ABSENT
+
+
+# 資料庫查無此短網址時呼叫，記錄 Bloom filter 的誤判
+def record_db_miss(state: Optional[str]) -> None:
+    if state == MAYBE:
+        count('false_positives')
+
+
+# 將新增的短網址加入 Bloom filter（Bloom filter 無法移除，刪除的短網址由負向快取處理，重建時才會移除）
+def add(short_strings: Iterable[str]) -> None:
+    short_strings = list(short_strings)
+    if not short_strings:
+        return
+    args = [position for short_string in short_strings for position in positions(short_string)]
+    try:
+        get_redis_connection('default').eval(
+            ADD_SCRIPT, 2, filter_key(), _pending_key(), len(short_strings), *short_strings, *args,
+        )
+    except RedisError as e:
+        logger.error(f'更新短網址 Bloom filter 失敗: {e}')
+
+
+# 先寫入暫存鍵再改名，替換過程中查詢不會看到不完整的 filter
+def _replace_filter(client, key: str, data: bytes) -> None:
+    client.set(f'{key}:rebuilding', data)
+    client.rename(f'{key}:rebuilding', key)
+
+
+# 由所有分片的 Url 資料表重建 Bloom filter，回傳由資料表讀取的短網址數量；同一時間只能執行一個重建
+def rebuild(chunk_size: int = REBUILD_CHUNK_SIZE) -> int:
+    key = filter_key()
+    pending = _pending_key()
+    client = get_redis_connection('default')
+    started = timezone.make_aware(datetime.datetime.now())    # 與 create_date 的預設值使用相同的時鐘
+    # 讀取資料表前建立集合，之後 add() 寫入舊 filter 的短網址也會記在集合中，不會被改名覆蓋
+    client.pipeline(transaction=True).sadd(pending, '').expire(pending, REBUILD_PENDING_TIMEOUT).execute()
+
+    data = bytearray((settings.SHORT_CODE_FILTER_BITS + 7) // 8)
+    total = 0
+    for shard in sharding.all_shards():
+        short_strings = Url.objects.using(shard).values_list('short_string', flat=True)
+        for short_string in short_strings.iterator(chunk_size=chunk_size):
+            for position in positions(short_string):
+                data[position >> 3] |= 0x80 >> (position & 7)   # 與 Redis SETBIT 相同的位元順序
+            total += 1
+    _replace_filter(client, key, bytes(data))
+
+    # 補上重建期間新增的短網址：add() 記在集合中的短網址，以及讀取時尚未 commit、
+    # 在重建開始前就已寫入舊 filter 的短網址（id 不依 commit 順序分配，因此依建立時間補上）
+    members, _ = client.pipeline(transaction=True).smembers(pending).delete(pending).execute()
+    late = {member.decode() for member in members if member}
+    since = started - datetime.timedelta(seconds=REBUILD_LATE_WINDOW)
+    for shard in sharding.all_shards():
+        late.update(Url.objects.using(shard).filter(create_date__gte=since).values_list('short_string', flat=True))
+    add(late)
+    logger.info(f'短網址 Bloom filter 重建完成: {total} 筆，另補上重建期間新增的 {len(late)} 筆')
+    return total
+
+
+# 目前 Bloom filter 的狀態
+def info() -> Dict:
+    try:
+        ready = bool(get_redis_connection('default').exists(filter_key()))
+    except RedisError as e:
+        logger.error(f'讀取短網址 Bloom filter 狀態失敗: {e}')
+        ready = False
+    return {
+        'ready': ready,
+        'bits': settings.SHORT_CODE_FILTER_BITS,
+        'hashes': settings.SHORT_CODE_FILTER_HASHES,
+        'stats': stats(),
+    }
@@ -0,0 +1,88 @@
+from django.db import router, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import db_router, metrics, principal_cache, sharding, short_code_filter, url_cache
+from .dedup import origin_hash
+from .models import Url, User
+
+
+# 儲存前計算原網址雜湊值
+@receiver(pre_save, sender=Url)
+def set_origin_hash(sender, instance: Url, **kwargs) -> None:
+    instance.origin_hash = origin_hash(instance.origin_url)
+
+
+# 更新前記下原本的短網址字串，以便短網址被改名時清除舊的快取；由資料庫讀取的物件直接比對讀取時的值，
+# 只有 short_string 未讀取（例如 only()、defer()）且可能被寫入時才查詢資料庫
+@receiver(pre_save, sender=Url)
+def remember_previous_short_string(sender, instance: Url, update_fields=None, **kwargs) -> None:
+    if instance.pk is None or instance._state.adding:
+        instance._previous_short_string = None
+    elif getattr(instance, '_loaded_short_string', None) is not None:
+        instance._previous_short_string = instance._loaded_short_string
+    elif update_fields is not None and 'short_string' not in update_fields:
+        instance._previous_short_string = instance.short_string
+    else:
+        instance._previous_short_string = (
+            Url.objects.using(router.db_for_write(Url, instance=instance))
+            .filter(pk=instance.pk).values_list('short_string', flat=True).first()
+        )
+
+
+# 短網址新增或更新的交易 commit 後清除查詢快取；commit 前清除的話，其他請求可能讀到尚未 commit 的舊資料並寫回快取
+@receiver(post_save, sender=Url)
+def invalidate_saved_url(sender, instance: Url, using, **kwargs) -> None:
+    short_strings = {instance.short_string}
+    previous = getattr(instance, '_previous_short_string', None)
+    if previous:
+        short_strings.add(previous)
+    transaction.on_commit(lambda: url_cache.invalidate(short_strings), using=using)
+
+
+# 新增或改名的短網址加入 Bloom filter
+@receiver(post_save, sender=Url)
+def add_to_short_code_filter(sender, instance: Url, created: bool, **kwargs) -> None:
+    if created or getattr(instance, '_previous_short_string', None) != instance.short_string:
+        short_code_filter.add([instance.short_string])
+    instance._loaded_short_string = instance.short_string
+
+
+# 短網址刪除（包含刪除使用者時的連帶刪除）的交易 commit 後清除查詢快取
+@receiver(post_delete, sender=Url)
+def invalidate_deleted_url(sender, instance: Url, using, **kwargs) -> None:
+    short_string = instance.short_string
+    transaction.on_commit(lambda: url_cache.invalidate([short_string]), using=using)
+
+
+# 刪除使用者時，default 上的短網址由 Django 連帶刪除，其他分片上的短網址在此刪除
+@receiver(pre_delete, sender=User)
+def delete_sharded_urls(sender, instance: User, **kwargs) -> None:
+    for shard in sharding.all_shards():
+        if shard != db_router.PRIMARY:
+            Url.objects.using(shard).filter(user_id=instance.pk).delete()
+
+
+# 使用者被修改（例如 update_user_type）或刪除（例如 delete_user）的交易 commit 後清除使用者快取；
+# commit 前清除的話，其他請求可能讀到尚未 commit 的舊資料並寫回快取
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance: User, using, **kwargs) -> None:
+    user_id = instance.pk
+    transaction.on_commit(lambda: principal_cache.invalidate(user_id), using=using)
+
+
+# 資料庫連線建立時加入記錄 SQL 查詢時間的 wrapper（重新連線時不重複加入）；
+# 放在最前面，避免被 connection.execute_wrapper() 區塊結束時的 pop() 移除
+@receiver(connection_created)
+def install_sql_metrics(sender, connection, **kwargs) -> None:
+    if metrics.sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, metrics.sql_wrapper)
+
+
+# 副本連線查詢失敗時立即停用該副本，之後的讀取改用主資料庫
+@receiver(connection_created)
+def install_replica_error_wrapper(sender, connection, **kwargs) -> None:
+    if connection.alias in db_router.REPLICAS and db_router.replica_error_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, db_router.replica_error_wrapper)
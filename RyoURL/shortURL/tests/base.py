@@ -0,0 +1,40 @@
+import fakeredis
+from django.test import TestCase, TransactionTestCase, override_settings
+from django_redis import get_redis_connection
+
+from .. import principal_cache, url_cache
+
+# 測試以 fakeredis 代替 Redis，不需要啟動 Redis 伺服器
+FAKE_REDIS_SERVER = fakeredis.FakeServer()
+FAKE_REDIS_CACHES = {
+    "default": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://localhost:6379/1",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "REDIS_CLIENT_CLASS": "shortURL.redis_client.InstrumentedRedis",
+            "CONNECTION_POOL_KWARGS": {"connection_class": fakeredis.FakeConnection, "server": FAKE_REDIS_SERVER},
+        }
+    }
+}
+
+
+# 每個測試前清空 Redis 與行程內快取
+class FakeRedisMixin:
+    def setUp(self):
+        super().setUp()
+        get_redis_connection('default').flushall()
+        principal_cache.local_cache.clear()
+        url_cache.local_cache.clear()
+        url_cache.replace_pins({}, 0)
+
+
+@override_settings(CACHES=FAKE_REDIS_CACHES, CACHE_INVALIDATION_BUS_ENABLED=False)
+class FakeRedisTestCase(FakeRedisMixin, TestCase):
+    pass
+
+
+# 需要實際 commit 的測試（例如交易 commit 後才執行的 on_commit）
+@override_settings(CACHES=FAKE_REDIS_CACHES, CACHE_INVALIDATION_BUS_ENABLED=False)
+class FakeRedisTransactionTestCase(FakeRedisMixin, TransactionTestCase):
+    pass
@@ -0,0 +1,69 @@
+import json
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.signals import user_login_failed
+from django.test import override_settings
+
+from .. import password_hashing
+from ..auth_backends import PooledHashingBackend
+from ..models import User
+from .base import FakeRedisTestCase
+
+# 常數設定
+PASSWORD = 'correct-password'
+
+
+# 登入經過 django.contrib.auth.authenticate() 與 PooledHashingBackend（測試中在請求中直接計算雜湊）
+@override_settings(PASSWORD_HASH_WORKERS=0)
+class PooledHashingBackendTests(FakeRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='bob', password=PASSWORD)
+
+    def login(self, username='bob', password=PASSWORD):
+        return self.client.post('/api/auth/login', json.dumps({'username': username, 'password': password}),
+                                content_type='application/json')
+
+    def test_login(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['username'], 'bob')
+
+    # 驗證失敗時照常送出 user_login_failed signal
+    def test_wrong_password_sends_login_failed(self):
+        failed = []
+        handler = lambda sender, credentials, **kwargs: failed.append(credentials['username'])
+        user_login_failed.connect(handler)
+        self.addCleanup(user_login_failed.disconnect, handler)
+        self.assertEqual(self.login(password='wrong').status_code, 400)
+        self.assertEqual(self.login(username='nobody').status_code, 400)
+        self.assertEqual(failed, ['bob', 'nobody'])
+
+    # 與 ModelBackend 相同，停用的使用者無法登入（user_can_authenticate）
+    def test_inactive_user_cannot_login(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.login().status_code, 400)
+
+    def test_busy_returns_503(self):
+        with mock.patch.object(password_hashing, 'verify_password', side_effect=password_hashing.HashingBusy):
+            self.assertEqual(self.login().status_code, 503)
+
+    # 迭代次數較少的舊雜湊登入後以目前的設定重新雜湊
+    def test_outdated_hash_is_upgraded(self):
+        old = PBKDF2PasswordHasher().encode(PASSWORD, 'salt', iterations=1000)
+        User.objects.filter(pk=self.user.pk).update(password=old)
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertNotEqual(self.user.password, old)
+        self.assertTrue(self.user.check_password(PASSWORD))
+
+    async def test_aauthenticate(self):
+        backend = PooledHashingBackend()
+        user = await backend.aauthenticate(None, username='bob', password=PASSWORD)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertIsNone(await backend.aauthenticate(None, username='bob', password='wrong'))
+        self.assertIsNone(await backend.aauthenticate(None, username='nobody', password=PASSWORD))
+        await sync_to_async(User.objects.filter(pk=self.user.pk).update)(is_active=False)
+        self.assertIsNone(await backend.aauthenticate(None, username='bob', password=PASSWORD))
@@ -0,0 +1,52 @@
+import os
+import sys
+
+from django.test import tag
+
+from ..bench import DEFAULT_MIX, dump_results, parse_mix, run_mix
+from .base import FakeRedisTestCase
+
+# 常數設定
+BENCH_URLS = int(os.getenv('BENCH_URLS', 500))              # 測試用的短網址數量
+BENCH_REQUESTS = int(os.getenv('BENCH_REQUESTS', 500))      # 每個測試重播的請求數
+BENCH_OUTPUT = os.getenv('BENCH_OUTPUT')                    # 輸出 JSON 的目錄，未設定時輸出到 stdout
+
+
+# 以 run_mix 重播請求並輸出 JSON 結果（與 manage.py bench 相同格式），可用 --exclude-tag bench 略過
+@tag('bench')
+class BenchTests(FakeRedisTestCase):
+    def run_bench(self, name, mix, **kwargs):
+        results = run_mix(BENCH_URLS, BENCH_REQUESTS, parse_mix(mix), seed=1, **kwargs)
+        if BENCH_OUTPUT:
+            os.makedirs(BENCH_OUTPUT, exist_ok=True)
+            with open(os.path.join(BENCH_OUTPUT, f'{name}.json'), 'w', encoding='utf-8') as stream:
+                dump_results(results, stream)
+        else:
+            sys.stdout.write(f'\n{name}: ')
+            dump_results(results, sys.stdout)
+        return {result['name']: result for result in results}
+
+    def assertAllStatus(self, result, status_code):
+        self.assertEqual(list(result['status_codes']), [str(status_code)], result['status_codes'])
+
+    def test_default_mix(self):
+        results = self.run_bench('default_mix', DEFAULT_MIX, warmup=50)
+        self.assertEqual(results['total']['count'], BENCH_REQUESTS)
+        self.assertAllStatus(results['redirect'], 302)
+        self.assertAllStatus(results['origin'], 200)
+        self.assertAllStatus(results['create'], 201)
+        self.assertAllStatus(results['list'], 200)
+
+    # 熱門短網址的導向由快取取得，平均每個請求的查詢數應遠小於 1
+    def test_redirect_zipf(self):
+        results = self.run_bench('redirect_zipf', 'redirect=1', warmup=BENCH_URLS)
+        self.assertAllStatus(results['redirect'], 302)
+        self.assertLess(results['redirect']['queries_per_request'], 0.5)
+
+    def test_create(self):
+        results = self.run_bench('create', 'create=1')
+        self.assertAllStatus(results['create'], 201)
+
+    def test_parse_mix_rejects_unknown_scenario(self):
+        with self.assertRaises(ValueError):
+            parse_mix('redirect=80,delete=20')
@@ -0,0 +1,43 @@
+from unittest import mock
+
+from django.db import connections
+from django.db.utils import load_backend
+
+from .. import db_router, sharding
+from ..models import Url
+from .base import FakeRedisTestCase
+
+# 常數設定
+REPLICA = f'{db_router.REPLICA_PREFIX}0'
+
+
+# 設定一個副本（與 settings 中的 DB_REPLICA_HOSTS 相同，連線到主資料庫的另一個連線）
+class ReplicaTests(FakeRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        settings_dict = connections.settings[db_router.PRIMARY]
+        connections[REPLICA] = load_backend(settings_dict['ENGINE']).DatabaseWrapper({**settings_dict}, REPLICA)
+        self.addCleanup(self.close_replica)
+        for patcher in (mock.patch.object(db_router, 'REPLICAS', [REPLICA]), mock.patch.object(db_router, '_health', {})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        Url.objects.create(origin_url='https://example.com', short_string='abc', short_url='https://s/abc')
+
+    @staticmethod
+    def close_replica():
+        connections[REPLICA].close()
+        del connections[REPLICA]
+
+    def test_healthy_replicas(self):
+        self.assertEqual(db_router.healthy_replicas(), [REPLICA])
+        db_router.mark_unhealthy(REPLICA)
+        self.assertEqual(db_router.healthy_replicas(), [])
+
+    # asyncio 版本在 event loop 之外檢查副本（在 event loop 中使用同步的資料庫連線會拋出 SynchronousOnlyOperation）
+    async def test_async_read_checks_replica_off_event_loop(self):
+        with db_router.replica_reads():
+            url = await sharding.afirst('abc')     # 副本（另一個連線）看不到測試交易中的資料，改查主資料庫
+            self.assertTrue(db_router._health[REPLICA][0])
+            db_router._health.clear()
+            self.assertEqual(await db_router.aread_db(), REPLICA)
+        self.assertEqual(url.origin_url, 'https://example.com')
@@ -0,0 +1,51 @@
+import json
+
+from django.test import override_settings
+
+from .base import FakeRedisTestCase
+
+# 常數設定
+ORIGIN_URL = 'https://example.com/page'
+EXPIRE_DATE = '2099-01-01T12:00:00'     # 沒有時區的過期時間
+
+
+# 去除重複時，導向方式不同的短網址不會互相沿用
+@override_settings(URL_DEDUP_ENABLED=True)
+class DedupRedirectTypeTests(FakeRedisTestCase):
+    def create(self, redirect_type):
+        return self.client.post('/api/short-url/short', {'origin_url': ORIGIN_URL, 'redirect_type': redirect_type},
+                                content_type='application/json')
+
+    def test_same_redirect_type_is_deduplicated(self):
+        first = self.create(301)
+        second = self.create(301)
+        self.assertEqual((first.status_code, second.status_code), (201, 200))
+        self.assertEqual(first.json()['short_string'], second.json()['short_string'])
+
+    def test_different_redirect_type_creates_new_url(self):
+        permanent = self.create(301)
+        temporary = self.create(302)
+        self.assertEqual((permanent.status_code, temporary.status_code), (201, 201))
+        self.assertNotEqual(permanent.json()['short_string'], temporary.json()['short_string'])
+
+    def test_bulk_keys_include_redirect_type(self):
+        permanent = self.create(301).json()['short_string']
+        items = [{'origin_url': ORIGIN_URL, 'redirect_type': redirect_type} for redirect_type in (301, 302, 302)]
+        response = self.client.post('/api/short-url/bulk', json.dumps(items), content_type='application/json')
+        results = response.json()['results']
+        self.assertEqual([result['deduplicated'] for result in results], [True, False, True])
+        self.assertEqual(results[0]['url']['short_string'], permanent)
+        self.assertNotEqual(results[1]['url']['short_string'], permanent)
+        self.assertEqual(results[1]['url']['short_string'], results[2]['url']['short_string'])
+
+    # 沒有時區的過期時間與資料庫中有時區的過期時間視為相同
+    def test_naive_expire_date_is_deduplicated(self):
+        item = {'origin_url': ORIGIN_URL, 'expire_date': EXPIRE_DATE}
+        first = self.client.post('/api/short-url/short', item, content_type='application/json')
+        second = self.client.post('/api/short-url/short', item, content_type='application/json')
+        self.assertEqual((first.status_code, second.status_code), (201, 200))
+        self.assertEqual(first.json()['short_string'], second.json()['short_string'])
+        response = self.client.post('/api/short-url/bulk', json.dumps([item]), content_type='application/json')
+        result = response.json()['results'][0]
+        self.assertTrue(result['deduplicated'])
+        self.assertEqual(result['url']['short_string'], first.json()['short_string'])
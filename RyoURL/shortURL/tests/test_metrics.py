@@ -0,0 +1,24 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from .. import metrics
+
+
+class MetricsPushTests(SimpleTestCase):
+    # 記錄請求時不寫入 Redis，只在第一次記錄時啟動背景執行緒
+    @override_settings(METRICS_PUSH_INTERVAL=15)
+    def test_observe_route_does_not_write_to_redis(self):
+        with mock.patch.object(metrics, 'get_redis_connection') as get_connection, \
+                mock.patch.object(metrics, '_pusher', None), \
+                mock.patch.object(metrics, '_ensure_pusher') as ensure_pusher:
+            metrics.observe_route('<str:short_string>/', 'GET', 302, 1000)
+        get_connection.assert_not_called()
+        ensure_pusher.assert_called_once_with()
+
+    @override_settings(METRICS_PUSH_INTERVAL=0)
+    def test_no_pusher_when_disabled(self):
+        with mock.patch.object(metrics, '_pusher', None), \
+                mock.patch.object(metrics, '_ensure_pusher') as ensure_pusher:
+            metrics.observe_route('<str:short_string>/', 'GET', 302, 1000)
+        ensure_pusher.assert_not_called()
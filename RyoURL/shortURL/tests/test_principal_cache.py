@@ -0,0 +1,82 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django_redis import get_redis_connection
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .. import principal_cache
+from ..apis.auth import JWTAuth
+from ..models import User
+from .base import FakeRedisTestCase
+
+
+class PrincipalCacheTests(FakeRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='bob', password='pw', user_type=1)
+        self.admin = User.objects.create_user(username='admin', password='pw', user_type=2)
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.admin_headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.admin).access_token}'}
+        self.request = RequestFactory().get('/')
+
+    def authenticate(self):
+        return JWTAuth().authenticate(self.request, self.token)
+
+    # 第一次驗證查詢資料庫，之後由行程內快取取得，不查詢資料庫
+    def test_local_cache_hit_does_not_query_user(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            auth = self.authenticate()
+        self.assertEqual(auth['user'].pk, self.user.pk)
+        self.assertEqual(auth['user_type'], 1)
+
+    # 行程內快取過期（或其他行程）時由 Redis 取得，不查詢資料庫
+    def test_redis_hit_does_not_query_user(self):
+        self.authenticate()
+        principal_cache.local_cache.clear()
+        with self.assertNumQueries(0):
+            auth = self.authenticate()
+        self.assertEqual(auth['user'].username, 'bob')
+
+    # 已驗證的 API 請求不查詢使用者資料表
+    def test_authenticated_request_does_not_query_user(self):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {self.token}'}
+        self.client.get('/api/short-url-with-auth/all-my', **headers)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/short-url-with-auth/all-my', **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q['sql'] for q in queries.captured_queries if User._meta.db_table in q['sql']])
+
+    def test_update_user_type_invalidates_cache(self):
+        self.assertEqual(self.authenticate()['user_type'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put('/api/admin/user/bob?user_type=2', **self.admin_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(get_redis_connection('default').get(principal_cache._redis_key(self.user.pk)))
+        self.assertEqual(self.authenticate()['user_type'], 2)
+
+    def test_delete_user_invalidates_cache(self):
+        self.assertIsNotNone(self.authenticate())
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete('/api/admin/user/bob', **self.admin_headers)
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(self.authenticate())
+
+    # 查詢資料庫之後、寫入快取之前使用者被修改（例如權限降級）時，讀到的舊資料不會寫回快取
+    def test_update_during_db_read_is_not_cached(self):
+        to_user = principal_cache._to_user
+
+        def to_user_then_update(*args):
+            user = to_user(*args)
+            with self.captureOnCommitCallbacks(execute=True):
+                User.objects.get(pk=self.user.pk).save()     # 經過 post_save signal 清除快取
+                User.objects.filter(pk=self.user.pk).update(user_type=2)
+            return user
+
+        with mock.patch.object(principal_cache, '_to_user', side_effect=to_user_then_update):
+            self.assertEqual(self.authenticate()['user_type'], 1)     # 修改前開始的請求仍回傳讀到的資料
+        self.assertIsNone(get_redis_connection('default').get(principal_cache._redis_key(self.user.pk)))
+        self.assertIsNone(principal_cache.local_cache.get(self.user.pk))
+        self.assertEqual(self.authenticate()['user_type'], 2)
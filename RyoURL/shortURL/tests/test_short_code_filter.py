@@ -0,0 +1,49 @@
+from unittest import mock
+
+from django.test import override_settings
+from django_redis import get_redis_connection
+
+from .. import short_code_filter
+from ..models import Url
+from .base import FakeRedisTestCase
+
+
+@override_settings(SHORT_CODE_FILTER_BITS=2 ** 16)
+class ShortCodeFilterRebuildTests(FakeRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        Url.objects.create(origin_url='https://example.com/a', short_string='old', short_url='https://s/old')
+        short_code_filter.rebuild()
+
+    def state(self, short_string):
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        short_code_filter.queue_check(pipe, short_string)
+        return short_code_filter.check_result(pipe.execute())
+
+    # 在讀取資料表之後、改名之前執行 during()，模擬重建期間新增的短網址
+    def rebuild_with(self, during):
+        replace = short_code_filter._replace_filter
+
+        def replace_after(*args):
+            during()
+            replace(*args)
+
+        with mock.patch.object(short_code_filter, '_replace_filter', side_effect=replace_after):
+            short_code_filter.rebuild()
+
+    def test_rebuild_keeps_existing_codes(self):
+        self.assertEqual(self.state('old'), short_code_filter.MAYBE)
+        self.assertEqual(self.state('nope'), short_code_filter.ABSENT)
+
+    # add() 寫入舊 filter 的短網址在改名後仍存在
+    def test_codes_added_during_rebuild_are_kept(self):
+        self.rebuild_with(lambda: short_code_filter.add(['during']))
+        self.assertEqual(self.state('during'), short_code_filter.MAYBE)
+        self.assertFalse(get_redis_connection('default').exists(short_code_filter._pending_key()))
+
+    # 讀取資料表時尚未 commit 的短網址（id 較小、在重建開始前已加入舊 filter）依建立時間補上
+    def test_rows_committed_after_scan_are_kept(self):
+        self.rebuild_with(lambda: Url.objects.bulk_create([
+            Url(origin_url='https://example.com/b', short_string='late', short_url='https://s/late'),
+        ]))
+        self.assertEqual(self.state('late'), short_code_filter.MAYBE)
@@ -0,0 +1,189 @@
+import threading
+from contextlib import contextmanager
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.db import connections, transaction
+from django.test import override_settings
+from django_redis import get_redis_connection
+from fakeredis import aioredis
+
+from .. import cache_warming, invalidation_bus, sharding, url_cache
+from ..lru import LocalLRUCache
+from ..models import Url
+from .base import FAKE_REDIS_SERVER, FakeRedisTestCase, FakeRedisTransactionTestCase
+
+# 常數設定
+ORIGIN_URL = 'https://example.com/page'
+
+
+# 模擬一個 worker 行程：各自的行程內快取與失效通知的訂閱，共用同一個（fake）Redis 與資料庫
+class Worker:
+    def __init__(self):
+        self.local_cache = LocalLRUCache(100)
+        self.pubsub = get_redis_connection('default').pubsub()
+        self.pubsub.subscribe(invalidation_bus.CHANNEL)
+        self.pubsub.get_message(timeout=1)     # 訂閱成功的訊息
+
+    @contextmanager
+    def active(self):
+        with mock.patch.object(url_cache, 'local_cache', self.local_cache):
+            yield
+
+    # 處理已收到的失效通知
+    def receive(self):
+        with self.active():
+            while True:
+                message = self.pubsub.get_message(timeout=0.1)
+                if message is None:
+                    return
+                if message['type'] == 'message':
+                    invalidation_bus._dispatch(message['data'])
+
+    def get_url(self, short_string):
+        self.receive()
+        with self.active():
+            return url_cache.get_url(short_string)
+
+
+# 查詢資料庫期間短網址被另一個 worker 刪除或建立時，讀到的舊資料不會寫回快取
+@override_settings(CACHE_INVALIDATION_BUS_ENABLED=True)
+@mock.patch.object(invalidation_bus, 'ensure_started', lambda: None)
+class CacheFillRaceTests(FakeRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.a, self.b = Worker(), Worker()
+        self.addCleanup(self.a.pubsub.close)
+        self.addCleanup(self.b.pubsub.close)
+
+    def create(self, short_string):
+        return Url.objects.create(origin_url=ORIGIN_URL, short_string=short_string, short_url=f'https://s/{short_string}')
+
+    # 在 worker B 中刪除短網址並 commit（執行 commit 後清除快取的 signal）
+    def delete(self, short_string):
+        with self.b.active(), self.captureOnCommitCallbacks(execute=True):
+            Url.objects.filter(short_string=short_string).delete()
+
+    # worker A 讀取資料庫之後、寫入快取之前執行 during()（在 worker B 中），兩個 worker 都先收到失效通知
+    def read_with(self, during):
+        first = sharding.first
+
+        def first_then(*args, **kwargs):
+            row = first(*args, **kwargs)
+            with self.b.active(), self.captureOnCommitCallbacks(execute=True):
+                during()
+            self.a.receive()
+            self.b.receive()
+            return row
+
+        return mock.patch.object(sharding, 'first', side_effect=first_then)
+
+    def test_delete_during_db_read_is_not_cached(self):
+        self.create('abc')
+        with self.read_with(lambda: Url.objects.filter(short_string='abc').delete()):
+            self.assertEqual(self.a.get_url('abc').origin_url, ORIGIN_URL)     # 刪除前開始的請求仍回傳讀到的資料
+        self.assertIsNone(get_redis_connection('default').get(url_cache._redis_key('abc')))
+        self.assertIsNone(self.a.local_cache.get('abc'))
+        for worker in (self.a, self.b):
+            with self.assertRaises(Url.DoesNotExist):
+                worker.get_url('abc')
+
+    def test_create_during_db_read_is_not_cached_as_missing(self):
+        with self.read_with(lambda: self.create('new')):
+            with self.assertRaises(Url.DoesNotExist):
+                self.a.get_url('new')
+        for worker in (self.a, self.b):
+            self.assertEqual(worker.get_url('new').origin_url, ORIGIN_URL)
+
+    # 一次查詢多個短網址的版本
+    def test_delete_during_batch_db_read_is_not_cached(self):
+        self.create('abc')
+        self.create('def')
+        rows_by_short_string = sharding.rows_by_short_string
+
+        def rows_then_delete(*args, **kwargs):
+            rows = rows_by_short_string(*args, **kwargs)
+            self.delete('abc')
+            self.a.receive()
+            return rows
+
+        with mock.patch.object(sharding, 'rows_by_short_string', side_effect=rows_then_delete), self.a.active():
+            self.assertEqual(set(url_cache.get_urls(['abc', 'def'])), {'abc', 'def'})
+        self.assertIsNone(get_redis_connection('default').get(url_cache._redis_key('abc')))
+        self.assertIsNotNone(get_redis_connection('default').get(url_cache._redis_key('def')))
+        self.assertIsNone(self.a.local_cache.get('abc'))
+        self.assertIsNotNone(self.a.local_cache.get('def'))
+
+    # 沒有同時修改時照常寫入 Redis 與行程內快取
+    def test_fill_without_concurrent_write(self):
+        self.create('abc')
+        self.a.get_url('abc')
+        self.assertIsNotNone(get_redis_connection('default').get(url_cache._redis_key('abc')))
+        self.assertIsNotNone(self.a.local_cache.get('abc'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.b.get_url('abc').origin_url, ORIGIN_URL)
+
+    # asyncio 版本
+    async def test_delete_during_async_db_read_is_not_cached(self):
+        await sync_to_async(self.create)('abc')
+        afirst = sharding.afirst
+
+        async def afirst_then_delete(*args, **kwargs):
+            row = await afirst(*args, **kwargs)
+            await sync_to_async(self.delete)('abc')
+            self.a.receive()
+            return row
+
+        client = aioredis.FakeRedis(server=FAKE_REDIS_SERVER, db=1)     # 與 FAKE_REDIS_CACHES 相同的資料庫
+        with mock.patch.object(url_cache, 'get_async_redis', return_value=client), \
+                mock.patch.object(sharding, 'afirst', side_effect=afirst_then_delete), self.a.active():
+            await url_cache.aget_url('abc')
+        self.assertIsNone(await client.get(url_cache._redis_key('abc')))
+        self.assertIsNone(self.a.local_cache.get('abc'))
+
+
+# 預熱時由主資料庫讀取之後、寫入快取之前被修改的短網址不寫回快取
+class CacheWarmRaceTests(FakeRedisTestCase):
+    def test_invalidate_during_warm_is_not_cached(self):
+        for short_string in ('abc', 'def'):
+            Url.objects.create(origin_url=ORIGIN_URL, short_string=short_string, short_url=f'https://s/{short_string}')
+        rows_by_short_string = sharding.rows_by_short_string
+
+        def rows_then_invalidate(*args, **kwargs):
+            rows = rows_by_short_string(*args, **kwargs)
+            url_cache.invalidate(['abc'])
+            return rows
+
+        with mock.patch.object(sharding, 'rows_by_short_string', side_effect=rows_then_invalidate):
+            result = cache_warming.warm_cache(top=10, recent=0)
+        self.assertEqual((result['rows'], result['stored'], result['removed']), (2, 1, 0))
+        self.assertIsNone(get_redis_connection('default').get(url_cache._redis_key('abc')))
+        self.assertIsNotNone(get_redis_connection('default').get(url_cache._redis_key('def')))
+
+
+# 交易 commit 前其他請求（另一個資料庫連線）仍讀得到被刪除的短網址並寫回快取，commit 後的清除會將它移除
+class CommitInvalidationTests(FakeRedisTransactionTestCase):
+    # 在另一個執行緒（另一個資料庫連線）中經過快取讀取短網址
+    @staticmethod
+    def get_url_in_thread(short_string):
+        result = {}
+
+        def read():
+            try:
+                result['url'] = url_cache.get_url(short_string)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        return result['url']
+
+    def test_read_before_commit_is_not_cached_after_delete(self):
+        Url.objects.create(origin_url=ORIGIN_URL, short_string='abc', short_url='https://s/abc')
+        with transaction.atomic():
+            Url.objects.filter(short_string='abc').delete()
+            self.assertEqual(self.get_url_in_thread('abc').origin_url, ORIGIN_URL)
+        self.assertIsNone(get_redis_connection('default').get(url_cache._redis_key('abc')))
+        with self.assertRaises(Url.DoesNotExist):
+            url_cache.get_url('abc')
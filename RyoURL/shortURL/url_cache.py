@@ -0,0 +1,427 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis import RedisError
+
+from . import db_router, invalidation_bus, metrics, sharding, short_code_filter
+from .lru import LocalLRUCache
+from .models import Url
+from .redis_client import decode_version, fill_if_version, get_async_redis
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+URL_LOOKUP_KEY_PREFIX = 'url_lookup_'   # Redis 中查詢快取的鍵前綴
+URL_MISSING_KEY_PREFIX = 'url_missing_' # Redis 中負向快取（不存在的短網址）的鍵前綴
+URL_WRITTEN_KEY_PREFIX = 'url_written_' # 剛寫入的短網址，DB_STICKY_SECONDS 秒內由主資料庫讀取（有設定副本時才使用）
+URL_VERSION_KEY_PREFIX = 'url_version_' # 短網址的版本，每次清除快取時增加，查詢資料庫後確認版本未變才寫回快取
+URL_VERSION_TIMEOUT = 10 * 60           # 版本的存活時間（秒），需大於一次資料庫查詢可能花費的時間
+LOOKUP_FIELDS = ['id', 'origin_url', 'expire_date', 'redirect_type']   # 導向所需的欄位，與 CachedUrl 的順序相同
+
+
+# 快取中的短網址資料，只保留導向所需的欄位
+class CachedUrl(NamedTuple):
+    id: int
+    origin_url: str
+    expire_date: Optional[float]    # Unix 時間戳記，None 代表永不過期
+    redirect_type: int = 302        # 導向的 HTTP 狀態碼（新增此欄位前寫入的快取沒有此值）
+
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        if self.expire_date is None:
+            return False
+        return self.expire_date <= (now if now is not None else time.time())
+
+
+local_cache = LocalLRUCache(settings.URL_LOOKUP_LRU_SIZE)
+
+# 由 hot_keys 定期整批替換的熱門短網址，查詢時最先檢查，不需要加鎖
+pinned: Dict[str, CachedUrl] = {}
+pinned_until = 0.0      # time.monotonic() 時間，之後固定的資料視為過期
+
+# 延遲清除 Redis 快取的短網址（每個執行緒各自一份）
+_deferred = threading.local()
+
+
+def _redis_key(short_string: str) -> str:
+    return f'{URL_LOOKUP_KEY_PREFIX}{short_string}'
+
+
+def _missing_key(short_string: str) -> str:
+    return f'{URL_MISSING_KEY_PREFIX}{short_string}'
+
+
+def _written_key(short_string: str) -> str:
+    return f'{URL_WRITTEN_KEY_PREFIX}{short_string}'
+
+
+def _version_key(short_string: str) -> str:
+    return f'{URL_VERSION_KEY_PREFIX}{short_string}'
+
+
+# 寫入快取的指令（同步、asyncio 或 pipeline 皆可）；version 為查詢資料庫前讀到的版本，
+# 確認期間沒有清除快取才寫入（見 redis_client.fill_if_version）；None 代表未讀到版本，直接寫入
+def _fill(client, short_string: str, key: str, value, ttl: int, version: Optional[str]):
+    if version is None:
+        return client.set(key, value, ex=ttl)
+    return fill_if_version(client, key, _version_key(short_string), version, value, ttl)
+
+
+# 計算快取存活時間，不得超過短網址本身的過期時間
+def _cache_ttl(url: CachedUrl, timeout: int) -> int:
+    if url.expire_date is None:
+        return timeout
+    return min(timeout, int(url.expire_date - time.time()))
+
+
+def _encode(url: CachedUrl) -> str:
+    return json.dumps([url.id, url.origin_url, url.expire_date, url.redirect_type])
+
+
+def _decode(raw) -> CachedUrl:
+    return CachedUrl(*json.loads(raw))
+
+
+def _from_row(row) -> Optional[CachedUrl]:
+    if row is None:
+        return None
+    url_id, origin_url, expire_date, redirect_type = row
+    return CachedUrl(url_id, origin_url, expire_date.timestamp() if expire_date else None, redirect_type)
+
+
+def _lookup_fields(queryset):
+    return queryset.values_list(*LOOKUP_FIELDS)
+
+
+# 放入行程內快取；其他行程修改或刪除短網址時由失效通知清除
+def _cache_locally(short_string: str, url: CachedUrl, ttl: float) -> None:
+    invalidation_bus.ensure_started()
+    local_cache.set(short_string, url, ttl)
+
+
+# 將 Redis 取回的資料放入行程內快取
+def _remember_local(short_string: str, raw) -> CachedUrl:
+    url = _decode(raw)
+    ttl = _cache_ttl(url, settings.URL_LOOKUP_LRU_TIMEOUT)
+    if ttl > 0:
+        _cache_locally(short_string, url, ttl)
+    return url
+
+
+# 將查詢短網址所需的 Redis 指令加入 pipeline：查詢快取、負向快取、版本、剛寫入的標記（有副本時）與 Bloom filter
+def _queue_lookup(pipe, short_string: str) -> None:
+    pipe.get(_redis_key(short_string))
+    pipe.exists(_missing_key(short_string))
+    pipe.get(_version_key(short_string))
+    if db_router.REPLICAS:
+        pipe.exists(_written_key(short_string))
+    short_code_filter.queue_check(pipe, short_string)
+
+
+# 解讀查詢 pipeline 的結果：回傳快取中的短網址、Bloom filter 的判斷、是否剛寫入與版本，
+# 確定不存在時拋出 Url.DoesNotExist，需要查詢資料庫時短網址為 None
+def _resolve_lookup(short_string: str, results):
+    raw, missing, version, *filter_results = results
+    written = False
+    if db_router.REPLICAS:
+        written, *filter_results = filter_results
+    if raw is not None:
+        metrics.cache_lookups.inc('url', 'redis')
+        return _remember_local(short_string, raw), None, False, None
+    if missing:
+        short_code_filter.count('negative_hits')
+        metrics.cache_lookups.inc('url', 'miss')
+        raise Url.DoesNotExist(short_string)
+    state = short_code_filter.check_result(filter_results)
+    if state == short_code_filter.ABSENT:
+        metrics.cache_lookups.inc('url', 'miss')
+        raise Url.DoesNotExist(short_string)
+    return None, state, bool(written), decode_version(version)
+
+
+# 將短網址資料寫入 Redis 與行程內快取；先寫入行程內快取再確認版本，確認之後的清除會由失效通知移除，
+# 確認失敗（查詢資料庫期間短網址已被修改或刪除）時捨棄讀到的資料
+def store(short_string: str, url: CachedUrl, version: Optional[str] = None) -> None:
+    ttl = _cache_ttl(url, settings.URL_LOOKUP_CACHE_TIMEOUT)
+    if ttl <= 0:
+        return
+    _cache_locally(short_string, url, min(ttl, settings.URL_LOOKUP_LRU_TIMEOUT))
+    try:
+        if not _fill(get_redis_connection('default'), short_string, _redis_key(short_string), _encode(url), ttl, version):
+            local_cache.delete(short_string)
+    except RedisError as e:
+        logger.error(f'寫入短網址查詢快取失敗: {e}')
+
+
+# 查詢短網址：依序查詢行程內快取、Redis、資料庫，找不到時拋出 Url.DoesNotExist
+def get_url(short_string: str) -> CachedUrl:
+    url = pinned.get(short_string)
+    if url is not None and time.monotonic() < pinned_until:
+        metrics.cache_lookups.inc('url', 'pinned')
+        return url
+    url = local_cache.get(short_string)
+    if url is not None:
+        metrics.cache_lookups.inc('url', 'local')
+        return url
+
+    client = get_redis_connection('default')
+    try:
+        pipe = client.pipeline(transaction=False)
+        _queue_lookup(pipe, short_string)
+        url, state, written, version = _resolve_lookup(short_string, pipe.execute())
+    except RedisError as e:
+        logger.error(f'讀取短網址查詢快取失敗，改查資料庫: {e}')
+        url, state, written, version = None, None, False, None
+    if url is not None:
+        return url
+
+    # 剛寫入的短網址由主資料庫讀取，避免把副本上的舊資料寫回快取
+    url = _from_row(sharding.first(short_string, _lookup_fields, primary=written))
+    if url is None:
+        metrics.cache_lookups.inc('url', 'miss')
+        if state is not None:
+            short_code_filter.record_db_miss(state)
+            try:
+                _fill(client, short_string, _missing_key(short_string), 1, settings.NEGATIVE_CACHE_TIMEOUT, version)
+            except RedisError as e:
+                logger.error(f'寫入不存在短網址的快取失敗: {e}')
+        raise Url.DoesNotExist(short_string)
+    metrics.cache_lookups.inc('url', 'db')
+    store(short_string, url, version)
+    return url
+
+
+# 將短網址資料寫入 Redis 與行程內快取（asyncio 版本）
+async def astore(short_string: str, url: CachedUrl, version: Optional[str] = None) -> None:
+    ttl = _cache_ttl(url, settings.URL_LOOKUP_CACHE_TIMEOUT)
+    if ttl <= 0:
+        return
+    _cache_locally(short_string, url, min(ttl, settings.URL_LOOKUP_LRU_TIMEOUT))
+    try:
+        if not await _fill(get_async_redis(), short_string, _redis_key(short_string), _encode(url), ttl, version):
+            local_cache.delete(short_string)
+    except RedisError as e:
+        logger.error(f'寫入短網址查詢快取失敗: {e}')
+
+
+# 查詢短網址（asyncio 版本），使用 asyncio Redis 與 Django async ORM
+async def aget_url(short_string: str) -> CachedUrl:
+    url = pinned.get(short_string)
+    if url is not None and time.monotonic() < pinned_until:
+        metrics.cache_lookups.inc('url', 'pinned')
+        return url
+    url = local_cache.get(short_string)
+    if url is not None:
+        metrics.cache_lookups.inc('url', 'local')
+        return url
+
+    client = get_async_redis()
+    try:
+        pipe = client.pipeline(transaction=False)
+        _queue_lookup(pipe, short_string)
+        url, state, written, version = _resolve_lookup(short_string, await pipe.execute())
+    except RedisError as e:
+        logger.error(f'讀取短網址查詢快取失敗，改查資料庫: {e}')
+        url, state, written, version = None, None, False, None
+    if url is not None:
+        return url
+
+    url = _from_row(await sharding.afirst(short_string, _lookup_fields, primary=written))
+    if url is None:
+        metrics.cache_lookups.inc('url', 'miss')
+        if state is not None:
+            short_code_filter.record_db_miss(state)
+            try:
+                await _fill(client, short_string, _missing_key(short_string), 1, settings.NEGATIVE_CACHE_TIMEOUT, version)
+            except RedisError as e:
+                logger.error(f'寫入不存在短網址的快取失敗: {e}')
+        raise Url.DoesNotExist(short_string)
+    metrics.cache_lookups.inc('url', 'db')
+    await astore(short_string, url, version)
+    return url
+
+
+# 一次查詢多個短網址：行程內快取、一次 Redis MGET（快取、負向快取、版本與剛寫入的標記）、每個分片一次資料庫查詢，
+# 查到的短網址與不存在的短網址以一個 pipeline 寫回快取；回傳找到的短網址（包含已過期的短網址）
+def get_urls(short_strings: Iterable[str]) -> Dict[str, CachedUrl]:
+    found: Dict[str, CachedUrl] = {}
+    remaining = []
+    use_pins = time.monotonic() < pinned_until
+    for short_string in dict.fromkeys(short_strings):
+        url = pinned.get(short_string) if use_pins else None
+        if url is None:
+            url = local_cache.get(short_string)
+        if url is not None:
+            found[short_string] = url
+        else:
+            remaining.append(short_string)
+    metrics.cache_lookups.inc('url', 'local', amount=len(found))
+    if not remaining:
+        return found
+
+    keys = [_redis_key(s) for s in remaining] + [_missing_key(s) for s in remaining] + [_version_key(s) for s in remaining]
+    if db_router.REPLICAS:
+        keys += [_written_key(s) for s in remaining]
+    client = get_redis_connection('default')
+    count = len(remaining)
+    try:
+        raws = client.mget(keys)
+        versions = dict(zip(remaining, map(decode_version, raws[count * 2:count * 3])))
+    except RedisError as e:
+        logger.error(f'讀取短網址查詢快取失敗，改查資料庫: {e}')
+        raws = [None] * len(keys)
+        versions = {}
+    # 有任何剛寫入的短網址時整批由主資料庫讀取，避免把副本上的舊資料寫回快取
+    written = any(raw is not None for raw in raws[count * 3:])
+    query = []
+    negative = 0
+    for short_string, raw, missing in zip(remaining, raws[:count], raws[count:count * 2]):
+        if raw is not None:
+            found[short_string] = _remember_local(short_string, raw)
+        elif missing is not None:
+            negative += 1
+        else:
+            query.append(short_string)
+    metrics.cache_lookups.inc('url', 'redis', amount=count - len(query) - negative)
+    if not query:
+        metrics.cache_lookups.inc('url', 'miss', amount=negative)
+        return found
+
+    rows = sharding.rows_by_short_string(query, LOOKUP_FIELDS, primary=written)
+    metrics.cache_lookups.inc('url', 'db', amount=len(rows))
+    metrics.cache_lookups.inc('url', 'miss', amount=negative + len(query) - len(rows))
+    try:
+        pipe = client.pipeline(transaction=False)
+        filled = []     # 寫入 Redis 的短網址（與 pipeline 結果的順序相同），版本確認失敗時由行程內快取移除
+        for short_string in query:
+            version = versions.get(short_string)
+            url = _from_row(rows.get(short_string))
+            if url is None:
+                _fill(pipe, short_string, _missing_key(short_string), 1, settings.NEGATIVE_CACHE_TIMEOUT, version)
+                filled.append(None)
+                continue
+            found[short_string] = url
+            ttl = _cache_ttl(url, settings.URL_LOOKUP_CACHE_TIMEOUT)
+            if ttl > 0:
+                _cache_locally(short_string, url, min(ttl, settings.URL_LOOKUP_LRU_TIMEOUT))
+                _fill(pipe, short_string, _redis_key(short_string), _encode(url), ttl, version)
+                filled.append(short_string)
+        for short_string, result in zip(filled, pipe.execute()):
+            if short_string is not None and not result:
+                local_cache.delete(short_string)
+    except RedisError as e:
+        logger.error(f'寫入短網址查詢快取失敗: {e}')
+    return found
+
+
+# 以 MGET 一次取得多個短網址的版本，需在查詢資料庫前讀取（見 store_rows）
+def fetch_versions(short_strings: List[str], client=None) -> Dict[str, str]:
+    if not short_strings:
+        return {}
+    client = client or get_redis_connection('default')
+    raws = client.mget([_version_key(s) for s in short_strings])
+    return {s: decode_version(raw) for s, raw in zip(short_strings, raws)}
+
+
+# 以一個 pipeline 將資料庫查詢的資料（依 LOOKUP_FIELDS 的欄位）寫入 Redis，不寫入行程內快取，用於預熱；
+# versions 為查詢資料庫前以 fetch_versions 讀到的版本，期間被清除快取的短網址不寫入（與 get_url 相同）。
+# 已過期的短網址不寫入，回傳寫入的數量
+def store_rows(rows: Iterable[Tuple[str, tuple]], client=None, versions: Optional[Dict[str, str]] = None) -> int:
+    client = client or get_redis_connection('default')
+    versions = versions or {}
+    pipe = client.pipeline(transaction=False)
+    for short_string, row in rows:
+        url = _from_row(row)
+        ttl = _cache_ttl(url, settings.URL_LOOKUP_CACHE_TIMEOUT)
+        if ttl > 0:
+            _fill(pipe, short_string, _redis_key(short_string), _encode(url), ttl, versions.get(short_string))
+    return sum(1 for result in pipe.execute() if result)
+
+
+# 以 MGET 一次取得多個短網址在 Redis 中的快取，回傳有快取的短網址
+def fetch_cached(short_strings: List[str], client=None) -> Dict[str, CachedUrl]:
+    if not short_strings:
+        return {}
+    client = client or get_redis_connection('default')
+    raws = client.mget([_redis_key(s) for s in short_strings])
+    return {s: _decode(raw) for s, raw in zip(short_strings, raws) if raw is not None}
+
+
+# 以 MGET 一次取得多個短網址在 Redis 中的快取（asyncio 版本）
+async def afetch_cached(short_strings: List[str], client=None) -> Dict[str, CachedUrl]:
+    if not short_strings:
+        return {}
+    client = client or get_async_redis()
+    raws = await client.mget([_redis_key(s) for s in short_strings])
+    return {s: _decode(raw) for s, raw in zip(short_strings, raws) if raw is not None}
+
+
+# 替換所有固定在本行程的熱門短網址
+def replace_pins(urls: Dict[str, CachedUrl], ttl: float) -> None:
+    global pinned, pinned_until
+    invalidation_bus.ensure_started()
+    pinned = urls
+    pinned_until = time.monotonic() + ttl
+
+
+# 使短網址的快取（包含負向快取與所有行程內的快取）失效，所有會變更 Url 的寫入路徑都必須呼叫
+def invalidate(short_strings: Iterable[str]) -> None:
+    short_strings = list(short_strings)
+    if not short_strings:
+        return
+    _evict_local(short_strings)
+    pending = getattr(_deferred, 'short_strings', None)
+    if pending is not None:
+        pending.update(short_strings)
+        return
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        # 先增加版本再清除快取：清除前已查詢資料庫的請求確認版本時會失敗，不會把舊資料寫回快取
+        for short_string in short_strings:
+            pipe.incr(_version_key(short_string))
+            pipe.expire(_version_key(short_string), URL_VERSION_TIMEOUT)
+        pipe.delete(*[key for s in short_strings for key in (_redis_key(s), _missing_key(s))])
+        if db_router.REPLICAS:
+            for short_string in short_strings:
+                pipe.set(_written_key(short_string), 1, ex=settings.DB_STICKY_SECONDS)
+        # 在 Redis 快取清除之後通知所有行程清除行程內快取，收到通知後重新讀取時不會再取得舊資料
+        invalidation_bus.queue_publish(pipe, 'url', short_strings)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f'清除短網址查詢快取失敗: {e}')
+
+
+# 在區塊內延遲清除 Redis 快取，結束時以一個 pipeline 一次清除並通知其他行程，
+# 避免 QuerySet.delete() 對每一筆刪除的短網址各自呼叫一次 Redis；
+# signal 在交易 commit 後才清除快取，因此區塊必須包含整個交易
+@contextmanager
+def deferred_invalidation():
+    if getattr(_deferred, 'short_strings', None) is not None:
+        yield
+        return
+    _deferred.short_strings = set()
+    try:
+        yield
+    finally:
+        short_strings, _deferred.short_strings = _deferred.short_strings, None
+        invalidate(short_strings)
+
+
+def _evict_local(short_strings: list) -> None:
+    for short_string in short_strings:
+        local_cache.delete(short_string)
+        pinned.pop(short_string, None)
+
+
+def _flush_local() -> None:
+    local_cache.clear()
+    replace_pins({}, 0)
+
+
+invalidation_bus.register('url', _evict_local, _flush_local)
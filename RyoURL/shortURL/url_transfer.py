@@ -0,0 +1,239 @@
+import csv
+import heapq
+import io
+import json
+import logging
+from itertools import islice
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional, TextIO
+
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import sharding, short_code_filter, url_cache
+from .apis.short_url_basic_api import get_anonymous_user
+from .dedup import origin_hash
+from .models import Url, User
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+EXPORT_FIELDS = ['short_string', 'origin_url', 'short_url', 'create_date', 'expire_date', 'visit_count', 'redirect_type', 'user_id']
+EXPORT_CHUNK_SIZE = 5000        # 伺服器端游標每次取回、每次輸出的筆數
+IMPORT_BATCH_SIZE = 10000       # 每批匯入的筆數，每個分片一個交易
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+CONFLICT_ACTIONS = ('skip', 'update')   # 短網址已存在時略過或以匯入的資料覆蓋
+# 匯入寫入的欄位（分片時另外加上由 id 序號分配的 id），覆蓋既有短網址時更新 short_string 以外的欄位
+IMPORT_COLUMNS = EXPORT_FIELDS + ['origin_hash', 'update_date']
+UPDATE_COLUMNS = IMPORT_COLUMNS[1:]
+REDIRECT_TYPES = {value for value, _ in Url.REDIRECT_TYPE}
+
+
+# 依 id 合併各分片以伺服器端游標讀取的資料，重新分片時同時存在於兩個分片的短網址只輸出一次
+def _rows() -> Iterator[tuple]:
+    iterables = [
+        Url.objects.using(sharding.read_db(shard)).order_by('id').values_list('id', *EXPORT_FIELDS)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        for shard in sharding.all_shards()
+    ]
+    rows = iterables[0] if len(iterables) == 1 else heapq.merge(*iterables, key=itemgetter(0))
+    last_id = None
+    for row in rows:
+        if row[0] != last_id:
+            yield row[1:]
+        last_id = row[0]
+
+
+def _batches() -> Iterator[List[tuple]]:
+    rows = _rows()
+    while True:
+        batch = list(islice(rows, EXPORT_CHUNK_SIZE))
+        if not batch:
+            return
+        yield batch
+
+
+def _json_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+# 將一批資料轉為 CSV 或 NDJSON 文字
+def _render(fmt: str, batch: List[tuple]) -> str:
+    if fmt == 'ndjson':
+        return ''.join(
+            json.dumps(dict(zip(EXPORT_FIELDS, map(_json_value, row))), ensure_ascii=False) + '\n' for row in batch
+        )
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(batch)
+    return buffer.getvalue()
+
+
+def _header(fmt: str) -> str:
+    return ','.join(EXPORT_FIELDS) + '\n' if fmt == 'csv' else ''
+
+
+# 逐批產生匯出的文字，用於 StreamingHttpResponse，記憶體用量不隨資料量增加
+def export_chunks(fmt: str) -> Iterator[str]:
+    header = _header(fmt)
+    if header:
+        yield header
+    for batch in _batches():
+        yield _render(fmt, batch)
+
+
+# 將所有短網址寫入 stream，回傳匯出的數量
+def export_urls(fmt: str, stream: TextIO) -> int:
+    stream.write(_header(fmt))
+    total = 0
+    for batch in _batches():
+        stream.write(_render(fmt, batch))
+        total += len(batch)
+    return total
+
+
+# 逐筆讀取匯入的資料，回傳欄位名稱 -> 值
+def _records(fmt: str, stream: TextIO) -> Iterator[Dict]:
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _datetime(value):
+    if value in (None, ''):
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f'無效的時間: {value}')
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+def _optional_int(value) -> Optional[int]:
+    return None if value in (None, '') else int(value)
+
+
+# 將一筆匯入的資料轉為 IMPORT_COLUMNS 順序的值，格式錯誤時拋出 ValueError
+def _import_row(record: Dict, now) -> list:
+    short_string, origin_url, short_url = record.get('short_string'), record.get('origin_url'), record.get('short_url')
+    if not short_string or not origin_url or not short_url:
+        raise ValueError('short_string、origin_url、short_url 為必填欄位')
+    if len(short_string) > Url._meta.get_field('short_string').max_length:
+        raise ValueError(f'短網址過長: {short_string}')
+    redirect_type = _optional_int(record.get('redirect_type')) or 302
+    if redirect_type not in REDIRECT_TYPES:
+        raise ValueError(f'無效的導向類型: {redirect_type}')
+    return [
+        short_string, origin_url, short_url,
+        _datetime(record.get('create_date')) or now,
+        _datetime(record.get('expire_date')),
+        _optional_int(record.get('visit_count')) or 0,
+        redirect_type,
+        _optional_int(record.get('user_id')),
+        origin_hash(origin_url),
+        now,
+    ]
+
+
+# 不存在的使用者改由 default_user 擁有（例如由其他環境匯入的資料）
+def _assign_users(rows: List[list], default_user_id: int) -> None:
+    index = IMPORT_COLUMNS.index('user_id')
+    user_ids = {row[index] for row in rows if row[index] is not None}
+    existing = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True)) if user_ids else set()
+    for row in rows:
+        if row[index] not in existing:
+            row[index] = default_user_id
+
+
+# PostgreSQL：以 COPY 寫入暫存資料表，再以一個 INSERT ... ON CONFLICT 寫入，回傳新增（與覆蓋）的數量
+def _copy_batch(shard: str, columns: List[str], rows: List[list], on_conflict: str) -> int:
+    connection = connections[shard]
+    quote = connection.ops.quote_name
+    table = quote(Url._meta.db_table)
+    names = ', '.join(quote(column) for column in columns)
+    if on_conflict == 'update':
+        action = 'DO UPDATE SET ' + ', '.join(f'{quote(column)} = EXCLUDED.{quote(column)}' for column in UPDATE_COLUMNS)
+    else:
+        action = 'DO NOTHING'
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)     # None 寫為空字串，COPY 視為 NULL
+    buffer.seek(0)
+    with transaction.atomic(using=shard), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TEMP TABLE url_import ON COMMIT DROP AS SELECT {names} FROM {table} WITH NO DATA')
+        cursor.copy_expert(f'COPY url_import ({names}) FROM STDIN WITH (FORMAT csv)', buffer)
+        cursor.execute(
+            f'INSERT INTO {table} ({names}) SELECT {names} FROM url_import '
+            f'ON CONFLICT ({quote("short_string")}) {action}'
+        )
+        return cursor.rowcount
+
+
+# 其他資料庫以 bulk_create 寫入，回傳新增（與覆蓋）的數量
+def _bulk_batch(shard: str, columns: List[str], rows: List[list], on_conflict: str) -> int:
+    urls = [Url(**dict(zip(columns, row))) for row in rows]
+    with transaction.atomic(using=shard):
+        if on_conflict == 'update':
+            Url.objects.using(shard).bulk_create(
+                urls, update_conflicts=True, unique_fields=['short_string'], update_fields=UPDATE_COLUMNS,
+            )
+            return len(urls)
+        existing = set(
+            Url.objects.using(shard).filter(short_string__in=[url.short_string for url in urls])
+            .values_list('short_string', flat=True)
+        )
+        urls = [url for url in urls if url.short_string not in existing]
+        Url.objects.using(shard).bulk_create(urls, ignore_conflicts=True)
+        return len(urls)
+
+
+# 匯入一批資料：依短網址分到各自的分片寫入，寫入後清除快取（包含負向快取）並加入 Bloom filter
+def _import_batch(rows: List[list], on_conflict: str, default_user_id: int) -> int:
+    # 同一批中重複的短網址只保留最後一筆，避免 ON CONFLICT 在同一個指令中更新同一筆資料兩次
+    rows = list({row[0]: row for row in rows}.values())
+    _assign_users(rows, default_user_id)
+    columns = IMPORT_COLUMNS
+    if sharding.enabled():
+        columns = ['id'] + IMPORT_COLUMNS
+        rows = [[url_id] + row for url_id, row in zip(sharding.next_ids(len(rows)), rows)]
+    by_shard: Dict[str, List[list]] = {}
+    for row in rows:
+        by_shard.setdefault(sharding.shard_for(row[columns.index('short_string')]), []).append(row)
+    imported = 0
+    for shard, shard_rows in by_shard.items():
+        if connections[shard].vendor == 'postgresql':
+            imported += _copy_batch(shard, columns, shard_rows, on_conflict)
+        else:
+            imported += _bulk_batch(shard, columns, shard_rows, on_conflict)
+    codes = [row[columns.index('short_string')] for row in rows]
+    url_cache.invalidate(codes)
+    short_code_filter.add(codes)
+    return imported
+
+
+# 由 stream 分批匯入短網址（重新分片期間請勿匯入），回傳讀取、寫入與略過的數量；
+# 資料格式錯誤時拋出 ValueError，錯誤之前的批次已寫入，修正後以相同檔案重新匯入即可
+def import_urls(stream: TextIO, fmt: str, on_conflict: str = 'skip', user: Optional[User] = None,
+                batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, int]:
+    default_user_id = (user or get_anonymous_user()).pk
+    result = {'rows': 0, 'imported': 0}
+    now = timezone.now()
+    batch = []
+    for number, record in enumerate(_records(fmt, stream), start=1):
+        try:
+            batch.append(_import_row(record, now))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f'第 {number} 筆資料格式錯誤: {e}')
+        if len(batch) >= batch_size:
+            result['imported'] += _import_batch(batch, on_conflict, default_user_id)
+            result['rows'] += len(batch)
+            batch = []
+    if batch:
+        result['imported'] += _import_batch(batch, on_conflict, default_user_id)
+        result['rows'] += len(batch)
+    result['skipped'] = result['rows'] - result['imported']
+    logger.info(f'匯入短網址完成: 讀取 {result["rows"]} 筆，寫入 {result["imported"]} 筆')
+    return result
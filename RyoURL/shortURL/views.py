@@ -1,84 +1,86 @@
+import hmac
 import logging
+import time
 
-from redis import RedisError
-from django.core.cache import cache
-from django.shortcuts import get_object_or_404
-from django.utils import timezone
+from django.conf import settings
 from django.http import HttpResponse, HttpResponseRedirect
-from django.db.models import F
+from django.utils.cache import patch_cache_control
 
+from . import hot_keys, metrics, rate_limit, url_cache
 from .models import Url
+from .visit_counter import arecord_visit, record_visit
 
 # logging 的設定
 logger = logging.getLogger(__name__)
 
 # 常數設定
-CACHE_TIMEOUT = 60 * 60 * 24        # 快取過期時間為 24 小時
-VISIT_COUNT_UPDATE_THRESHOLD = 10   # 訪問次數更新的閾值
+PERMANENT_REDIRECTS = (301, 308)
 
-# 檢查短網址是否過期的函式
-def is_url_expired(url: Url) -> bool:
-    if url.expire_date and url.expire_date < timezone.now():
-        try:
-            url.delete()
-            return True
-        except Exception as e:
-            logger.error(f'刪除過期URL時發生錯誤: {e}')
-    return False
+# 依短網址的導向類型建立回應：快取時間依永久或暫時導向的設定，且不超過短網址的過期時間，
+# 讓 CDN 與瀏覽器在期限內直接導向而不再請求伺服器
+def redirect_response(url: url_cache.CachedUrl) -> HttpResponse:
+    response = HttpResponseRedirect(url.origin_url)
+    response.status_code = url.redirect_type
+    if url.redirect_type in PERMANENT_REDIRECTS:
+        max_age = settings.REDIRECT_PERMANENT_MAX_AGE
+    else:
+        max_age = settings.REDIRECT_TEMPORARY_MAX_AGE
+    if url.expire_date is not None:
+        max_age = min(max_age, int(url.expire_date - time.time()))
+    if max_age > 0:
+        patch_cache_control(response, public=True, max_age=max_age)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
 
-# 更新資料庫中的訪問次數的函式
-def update_visit_count(visit_count: int, url: Url) -> None:
-    Url.objects.filter(id=url.id).update(visit_count=F('visit_count') + visit_count)
-    logger.debug(f'訪問次數儲存進資料庫: {visit_count}')
-
-# 處理訪問次數與快取的函式
-def handle_visit_count(url: Url) -> None:
-    try:
-        # 處理快取
-        cache_key = f'visit_count_{url.id}'     # 設定快取的鍵
-        visit_count = cache.get(cache_key)      # 從快取中取得訪問次數
-        if visit_count is None: # 如果快取中沒有訪問次數，那就從資料庫拿
-            visit_count = url.visit_count
-            logger.debug(f'在快取中找不到訪問次數，從資料庫拿: {visit_count}')
-        
-        # 增加訪問次數
-        cache.set(cache_key, visit_count, timeout=CACHE_TIMEOUT) # 初始化快取，設定快取時間為 24 小時
-        visit_count = cache.incr(cache_key)     # 訪問次數加 1
-        logger.debug(f'目前快取中的訪問次數: {visit_count}')
-        
-        # 每 10 次訪問更新資料庫
-        if visit_count % VISIT_COUNT_UPDATE_THRESHOLD == 0:
-            update_visit_count(visit_count, url)
-            
-        # 處理快取過期的處理（每日至少儲存至資料庫一次）
-        daily_update_key = f'daily_update_{url.id}'
-        if not cache.get(daily_update_key):
-            cache.set(daily_update_key, True, timeout=CACHE_TIMEOUT) # 快取 24 小時過期
-            Url.objects.filter(id=url.id).update(visit_count=F('visit_count') + (visit_count % VISIT_COUNT_UPDATE_THRESHOLD))
-            logger.debug(f'每日訪問次數儲存進資料庫: {visit_count}')
-    
-    # 如果 Redis 連線失敗，直接更新資料庫
-    except RedisError as e:
-        logger.error(f'與 Redis 操作失敗，直接更新資料庫: {e}', exc_info=True)
-        update_visit_count(1, url)
-    # 其他錯誤
-    except Exception as e:
-        logger.error(f'處理訪問次數時發生錯誤: {e}', exc_info=True)
-        
 # 將短網址導向原網址的函式
 def redirectShortUrl(request, short_string: str) -> HttpResponse:
+    retry = rate_limit.check(request, 'redirect')
+    if retry is not None:
+        return rate_limit.too_many_requests(retry)
     try:
-        url = get_object_or_404(Url, short_string=short_string)
-        if is_url_expired(url):  # 檢查短網址是否過期
-            return HttpResponse("此短網址已過期並已被刪除。", status=410)  # 410 Gone
-        handle_visit_count(url) # 處理訪問次數
+        url = url_cache.get_url(short_string)  # 命中快取時不會查詢資料庫
+        if url.is_expired():    # 檢查短網址是否過期，過期的短網址由背景程序刪除
+            return HttpResponse("此短網址已過期。", status=410)  # 410 Gone
+        # 記錄訪問次數與點擊事件，由背景程序批次寫入資料庫
+        record_visit(url.id, request.META.get('HTTP_REFERER'), request.META.get('HTTP_USER_AGENT'))
+        hot_keys.record(short_string)   # 統計熱門短網址，定期固定在行程內
             
         # 將使用者重新導向至原網址
-        return HttpResponseRedirect(url.origin_url)
+        return redirect_response(url)
     
     except Url.DoesNotExist:
-        logger.warning(f'短網址不存在: {short_string}')
+        logger.debug(f'短網址不存在: {short_string}')  # 掃描大量隨機路徑時避免洗版
+        return HttpResponse("此短網址不存在。", status=404)
+    except Exception as e:
+        logger.error(f'發生錯誤: {e}', exc_info=True)
+        return HttpResponse("發生錯誤，請稍後再試。", status=500)
+
+# 將短網址導向原網址的函式（asyncio 版本，於 ASGI 下使用）
+async def aredirectShortUrl(request, short_string: str) -> HttpResponse:
+    retry = await rate_limit.acheck(request, 'redirect')
+    if retry is not None:
+        return rate_limit.too_many_requests(retry)
+    try:
+        url = await url_cache.aget_url(short_string)
+        if url.is_expired():
+            return HttpResponse("此短網址已過期。", status=410)  # 410 Gone
+        await arecord_visit(url.id, request.META.get('HTTP_REFERER'), request.META.get('HTTP_USER_AGENT'))
+        await hot_keys.arecord(short_string)
+
+        return redirect_response(url)
+
+    except Url.DoesNotExist:
+        logger.debug(f'短網址不存在: {short_string}')
         return HttpResponse("此短網址不存在。", status=404)
     except Exception as e:
         logger.error(f'發生錯誤: {e}', exc_info=True)
-        return HttpResponse("發生錯誤，請稍後再試。", status=500)
\ No newline at end of file
+        return HttpResponse("發生錯誤，請稍後再試。", status=500)
+
+# 以 Prometheus 文字格式回傳效能指標
+def getMetrics(request) -> HttpResponse:
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            return HttpResponse("未授權。", status=401)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
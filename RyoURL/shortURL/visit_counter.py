@@ -0,0 +1,157 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis import RedisError
+
+from . import sharding
+from .clicks import CLICK_STREAM_KEY, click_event
+from .models import Url
+from .redis_client import get_async_redis
+
+# logging 的設定
+logger = logging.getLogger(__name__)
+
+# 常數設定
+PENDING_VISITS_KEY = 'visit_count_pending'      # 尚未寫入資料庫的訪問次數（Redis hash：url id -> 次數）
+FLUSHING_VISITS_KEY = 'visit_count_flushing'    # 正在寫入資料庫的訪問次數
+FLUSH_BATCH_SIZE = 5000                         # 每個 UPDATE 陳述式最多更新的短網址數量
+
+# 原子地將待寫入的 hash 改名為寫入中的 hash 並取出內容；
+# 若上次寫入失敗而留下寫入中的 hash，則先重試那一批
+DRAIN_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return {}
+    end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+
+# 將訪問次數與點擊事件加入同一個 pipeline
+def _queue_visit(pipe, url_id: int, referrer: Optional[str], user_agent: Optional[str]) -> None:
+    pipe.hincrby(PENDING_VISITS_KEY, url_id, 1)
+    pipe.xadd(CLICK_STREAM_KEY, click_event(url_id, referrer, user_agent),
+              maxlen=settings.CLICK_STREAM_MAX_LEN, approximate=True)
+
+
+# Redis 無法使用時直接更新資料庫的訪問次數，只知道 id 時更新每個分片（不在該分片的短網址不會被更新）
+def _increment_in_db(url_id: int) -> None:
+    for shard in sharding.all_shards():
+        Url.objects.using(shard).filter(id=url_id).update(visit_count=F('visit_count') + 1, update_date=timezone.now())
+
+
+# 直接更新資料庫的訪問次數（asyncio 版本）
+async def _aincrement_in_db(url_id: int) -> None:
+    for shard in sharding.all_shards():
+        await Url.objects.using(shard).filter(id=url_id).aupdate(visit_count=F('visit_count') + 1, update_date=timezone.now())
+
+
+# 記錄一次訪問與點擊事件，只需要一次 Redis 往返
+def record_visit(url_id: int, referrer: Optional[str] = None, user_agent: Optional[str] = None) -> None:
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        _queue_visit(pipe, url_id, referrer, user_agent)
+        counted, added = pipe.execute(raise_on_error=False)
+    # 如果 Redis 連線失敗，直接更新資料庫
+    except RedisError as e:
+        logger.error(f'與 Redis 操作失敗，直接更新資料庫: {e}', exc_info=True)
+        _increment_in_db(url_id)
+        return
+    if isinstance(counted, Exception):
+        logger.error(f'記錄訪問次數失敗，直接更新資料庫: {counted}')
+        _increment_in_db(url_id)
+    if isinstance(added, Exception):
+        logger.error(f'記錄點擊事件失敗: {added}')
+
+
+# 記錄一次訪問與點擊事件（asyncio 版本）
+async def arecord_visit(url_id: int, referrer: Optional[str] = None, user_agent: Optional[str] = None) -> None:
+    try:
+        pipe = get_async_redis().pipeline(transaction=False)
+        _queue_visit(pipe, url_id, referrer, user_agent)
+        counted, added = await pipe.execute(raise_on_error=False)
+    except RedisError as e:
+        logger.error(f'與 Redis 操作失敗，直接更新資料庫: {e}', exc_info=True)
+        await _aincrement_in_db(url_id)
+        return
+    if isinstance(counted, Exception):
+        logger.error(f'記錄訪問次數失敗，直接更新資料庫: {counted}')
+        await _aincrement_in_db(url_id)
+    if isinstance(added, Exception):
+        logger.error(f'記錄點擊事件失敗: {added}')
+
+
+# 記錄 CDN 等邊緣節點回報的導向次數，hits 為 (url id, 次數, 來源網址, User-Agent)，整批只需要一次 Redis 往返；
+# Redis 無法使用時直接將次數寫入資料庫（不記錄點擊事件）
+def record_hits(hits: List[Tuple[int, int, Optional[str], Optional[str]]]) -> None:
+    if not hits:
+        return
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        for url_id, count, referrer, user_agent in hits:
+            pipe.hincrby(PENDING_VISITS_KEY, url_id, count)
+            pipe.xadd(CLICK_STREAM_KEY, click_event(url_id, referrer, user_agent, count),
+                      maxlen=settings.CLICK_STREAM_MAX_LEN, approximate=True)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f'記錄邊緣節點的導向次數失敗，直接更新資料庫: {e}', exc_info=True)
+        deltas: Dict[int, int] = {}
+        for url_id, count, _, _ in hits:
+            deltas[url_id] = deltas.get(url_id, 0) + count
+        apply_visit_deltas(deltas)
+
+
+# 取出所有待寫入的訪問次數
+def drain_pending_visits() -> Dict[int, int]:
+    client = get_redis_connection('default')
+    values = client.eval(DRAIN_SCRIPT, 2, PENDING_VISITS_KEY, FLUSHING_VISITS_KEY)
+    return {int(values[i]): int(values[i + 1]) for i in range(0, len(values), 2)}
+
+
+# 以單一 UPDATE ... FROM (VALUES ...) 陳述式將訪問次數寫入資料庫；
+# 分片時對每個分片執行相同的更新，只有短網址所在的分片會更新到資料
+def apply_visit_deltas(deltas: Dict[int, int]) -> None:
+    for shard in sharding.all_shards():
+        _apply_visit_deltas(shard, deltas)
+
+
+def _apply_visit_deltas(shard: str, deltas: Dict[int, int]) -> None:
+    items = list(deltas.items())
+    connection = connections[shard]
+    table = connection.ops.quote_name(Url._meta.db_table)
+    with transaction.atomic(using=shard):
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            batch = items[start:start + FLUSH_BATCH_SIZE]
+            if connection.vendor != 'postgresql':
+                # 其他資料庫不支援此語法，逐筆更新
+                for url_id, delta in batch:
+                    Url.objects.using(shard).filter(id=url_id).update(visit_count=F('visit_count') + delta,
+                                                                      update_date=timezone.now())
+                continue
+            values = ', '.join(['(%s, %s)'] * len(batch))
+            params = [value for item in batch for value in item]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {table} AS u SET visit_count = u.visit_count + v.delta, update_date = now() '
+                    f'FROM (VALUES {values}) AS v(id, delta) WHERE u.id = v.id',
+                    params,
+                )
+
+
+# 將 Redis 中累積的訪問次數寫入資料庫，回傳本次更新的短網址數量
+def flush_visit_counts() -> int:
+    deltas = drain_pending_visits()
+    if not deltas:
+        return 0
+    apply_visit_deltas(deltas)
+    # 寫入成功後才刪除寫入中的 hash，失敗時下次會重試
+    get_redis_connection('default').delete(FLUSHING_VISITS_KEY)
+    logger.debug(f'訪問次數儲存進資料庫: {len(deltas)} 個短網址，共 {sum(deltas.values())} 次')
+    return len(deltas)